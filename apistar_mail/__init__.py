@@ -4,4 +4,29 @@ __author__ = """Drew Bednar"""
 __email__ = 'drew@androiddrew.com'
 __version__ = '0.3.0'
 
-from .mail import MailComponent, Message, Mail  # NOQA: F401
+import importlib
+
+# The public names are imported from their modules when first used, so
+# importing the package doesn't pull in apistar, asyncio or the email machinery.
+_exports = {
+    'MailComponent': '.component',
+    'Message': '.mail',
+    'Mail': '.mail',
+    'AsyncMailComponent': '.component',
+    'AsyncMail': '.aio',
+    'MessageTemplate': '.template',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
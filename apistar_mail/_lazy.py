@@ -0,0 +1,23 @@
+import importlib
+
+
+class LazyModule:
+    """Stands in for a module that is only imported when first used.
+
+    Attribute lookups are passed on to the module, importing it if need be,
+    so ``smtplib = LazyModule('smtplib')`` can be used just like the module,
+    including in ``except`` clauses and by unittest.mock.patch.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self._name
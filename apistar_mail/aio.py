@@ -0,0 +1,725 @@
+import asyncio
+import base64
+import re
+import time
+import weakref
+
+from contextlib import asynccontextmanager
+
+from ._lazy import LazyModule
+from .exc import BadHeaderError
+from .mail import (Mail, Message, SendResult, _batch_failure, _batches, _failed_result,
+                   _merge_batches, _prepare_message, _sent_result, _size, sanitize_address)
+from .smtp import (BDAT_WINDOW, envelope_error, iter_bdat, iter_quoted, mail_command,
+                   rcpt_command)
+
+# smtplib and ssl are imported when the first connection is made, as in mail
+smtplib = LazyModule('smtplib')
+socket = LazyModule('socket')
+ssl = LazyModule('ssl')
+
+DEFAULT_POOL_SIZE = 10
+
+# StreamWriter.start_tls, needed for STARTTLS, is new in Python 3.11
+HAS_START_TLS = hasattr(asyncio.StreamWriter, 'start_tls')
+
+FEATURE = re.compile(r'(?P<feature>[A-Za-z0-9][A-Za-z0-9\-]*) ?')
+
+_local_hostname = None
+
+
+def local_hostname():
+    """The name sent with EHLO, looked up once per process."""
+    global _local_hostname
+    if _local_hostname is None:
+        _local_hostname = socket.getfqdn()
+    return _local_hostname
+
+
+async def _send_batches(send_batch, batches):
+    """Sends every batch of recipients in turn, as mail._send_batches does."""
+    outcomes = []
+    for batch in batches:
+        try:
+            outcomes.append((await send_batch(batch), None))
+        except Exception as e:
+            outcomes.append(_batch_failure(batch, e))
+    return _merge_batches(batches, outcomes)
+
+
+async def _send_result(connection, message):
+    """Sends a message on a connection, capturing the outcome as a SendResult."""
+    try:
+        refused = await connection.send(message)
+    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException,
+            BadHeaderError, AssertionError) as e:
+        return _failed_result(message, e)
+    except Exception as e:
+        # the session is broken or mid-transaction; the next send reopens it
+        connection._abort()
+        return _failed_result(message, e)
+    return _sent_result(message, refused)
+
+
+class AsyncConnection:
+    """Handles connection to host over asyncio streams"""
+
+    def __init__(self, mail):
+        """
+        configure new connection
+
+        :param mail: the application mail manager
+        """
+        self.mail = mail
+        self.reader = None
+        self.writer = None
+        self.esmtp_features = {}
+        self.relay = None
+        self.server = None
+        self.num_emails = 0
+        # True while a transaction may have replies left unread, see AsyncConnectionPool
+        self._in_transaction = False
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+
+    async def open(self):
+        """Opens the SMTP session unless sending is suppressed."""
+        if not self.mail.mail_suppress_send:
+            await self.configure_host()
+
+        self.num_emails = 0
+
+        return self
+
+    async def close(self):
+        """Sends QUIT and closes the streams, ignoring a server that already hung up."""
+        if self.writer is None:
+            return
+        try:
+            with self.mail.instrumentation.phase('quit'):
+                await self.command('quit')
+        except OSError:
+            pass
+        finally:
+            self._abort()
+
+    async def reconnect(self):
+        """Replaces the SMTP session with a freshly configured one."""
+        self.mail.instrumentation.increment('reconnects')
+        await self.close()
+        return await self.open()
+
+    async def is_alive(self):
+        """Checks the SMTP session with a NOOP command."""
+        if self.writer is None:
+            return self.mail.mail_suppress_send
+        try:
+            code, _ = await self.command('noop')
+        except OSError:
+            return False
+        return code == 250
+
+    def _abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+        self.esmtp_features = {}
+        self._in_transaction = False
+
+    async def configure_host(self):
+        """Opens and authenticates an SMTP session, trying each relay in turn
+        with **MAIL_SERVERS**, as Connection.configure_host does."""
+        relays = self.mail.relays
+        if relays is None:
+            return await self._configure_host(self.mail.mail_server, self.mail.mail_port)
+
+        error = None
+        for relay in relays.candidates():
+            start = time.monotonic()
+            try:
+                await self._configure_host(relay.server, relay.port)
+            except OSError as e:
+                self._abort()
+                relays.failure(relay)
+                error = e
+                continue
+            relays.success(relay, time.monotonic() - start)
+            self.relay = relay
+            return
+        raise error
+
+    async def _configure_host(self, server, port):
+        self.server = server
+        instrumentation = self.mail.instrumentation
+        context = self.ssl_context() if self.mail.mail_use_ssl else None
+        with instrumentation.phase('connect'):
+            self.reader, self.writer = await asyncio.open_connection(
+                server, port, ssl=context)
+
+            code, resp = await self.getreply()
+            if code != 220:
+                self._abort()
+                raise smtplib.SMTPConnectError(code, resp)
+
+            await self.ehlo()
+
+        if self.mail.mail_use_tls:
+            with instrumentation.phase('starttls'):
+                await self.starttls()
+        if self.mail.mail_user and self.mail.mail_password:
+            with instrumentation.phase('login'):
+                await self.login(self.mail.mail_user, self.mail.mail_password)
+
+    async def getreply(self):
+        """Reads a possibly multi-line reply and returns (code, message)."""
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                self._abort()
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            code, separator = line[:3], line[3:4]
+            lines.append(line[4:].strip())
+            if separator != b'-':
+                break
+        try:
+            errcode = int(code)
+        except ValueError:
+            errcode = -1
+        return errcode, b'\n'.join(lines)
+
+    async def command(self, cmd, args=''):
+        """Sends a command and waits for its reply."""
+        if self.writer is None:
+            raise smtplib.SMTPServerDisconnected('please run connect() first')
+        line = ('%s %s' % (cmd, args)).strip() if args else cmd
+        self.writer.write(line.encode('ascii') + b'\r\n')
+        await self.writer.drain()
+        return await self.getreply()
+
+    def has_extn(self, name):
+        return name.lower() in self.esmtp_features
+
+    async def ehlo(self):
+        code, resp = await self.command('ehlo', local_hostname())
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, resp)
+
+        self.esmtp_features = {}
+        for each in resp.decode('latin-1').split('\n')[1:]:
+            m = FEATURE.match(each)
+            if m:
+                feature = m.group('feature').lower()
+                self.esmtp_features[feature] = each[m.end('feature'):].strip()
+        return code, resp
+
+    def ssl_context(self):
+        """The MAIL_SSL_CONTEXT, or by default one that verifies the server's certificate."""
+        return self.mail.mail_ssl_context or ssl.create_default_context()
+
+    async def starttls(self):
+        if not self.has_extn('starttls'):
+            raise smtplib.SMTPNotSupportedError('STARTTLS extension not supported by server.')
+        code, resp = await self.command('STARTTLS')
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, resp)
+
+        await self.writer.start_tls(self.ssl_context(), server_hostname=self.server)
+
+        # RFC 3207: the client must discard what it knew about the server
+        await self.ehlo()
+
+    async def login(self, user, password):
+        if not self.has_extn('auth'):
+            raise smtplib.SMTPNotSupportedError('SMTP AUTH extension not supported by server.')
+
+        def b64(value):
+            return base64.b64encode(value.encode('utf-8')).decode('ascii')
+
+        methods = self.esmtp_features['auth'].upper().split()
+        if 'PLAIN' in methods:
+            code, resp = await self.command('AUTH', 'PLAIN ' + b64('\0%s\0%s' % (user, password)))
+        elif 'LOGIN' in methods:
+            code, resp = await self.command('AUTH', 'LOGIN ' + b64(user))
+            if code == 334:
+                code, resp = await self.command(b64(password))
+        else:
+            raise smtplib.SMTPException('No suitable authentication method found.')
+
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, resp)
+        return code, resp
+
+    async def _rset(self):
+        try:
+            await self.command('rset')
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """Sends a message envelope, pipelining the commands when the server allows it.
+
+        The message is sent in BDAT chunks when the server supports CHUNKING
+        and MAIL_USE_CHUNKING is on, see apistar_mail.smtp.sendmail. Mirrors
+        smtplib.SMTP.sendmail: returns a dict of refused recipients and
+        raises the same exceptions.
+        """
+        esmtp_opts = []
+        if self.has_extn('size'):
+            try:
+                esmtp_opts.append('size=%d' % len(msg))
+            except TypeError:
+                # the size of a streamed message is not always known up front
+                pass
+        esmtp_opts.extend(mail_options)
+
+        phase = self.mail.instrumentation.phase
+        pipelining = self.has_extn('pipelining')
+        chunking = self.mail.mail_use_chunking and self.has_extn('chunking')
+        commands = [mail_command(from_addr, esmtp_opts)]
+        commands.extend(rcpt_command(each, rcpt_options) for each in to_addrs)
+
+        replies = []
+        with phase('envelope'):
+            if pipelining:
+                self.writer.write(b''.join(commands) + (b'' if chunking else b'data\r\n'))
+                await self.writer.drain()
+                for _ in range(len(commands) if chunking else len(commands) + 1):
+                    replies.append(await self.getreply())
+            else:
+                for line in commands:
+                    self.writer.write(line)
+                    await self.writer.drain()
+                    replies.append(await self.getreply())
+                    if replies[0][0] != 250:
+                        break
+
+        data_reply = replies.pop() if len(replies) > len(commands) else None
+        senderrs, error = envelope_error(from_addr, to_addrs, replies)
+        with phase('data'):
+            if error is not None:
+                if data_reply and data_reply[0] == 354:
+                    # the server accepted DATA regardless, so send an empty body
+                    self.writer.write(b'.\r\n')
+                    await self.getreply()
+                await self._rset()
+                raise error
+
+            if chunking:
+                code, resp = await self._send_bdat(msg, pipelining)
+                if code != 250:
+                    await self._rset()
+                    raise smtplib.SMTPDataError(code, resp)
+                return senderrs
+
+            if data_reply is None:
+                data_reply = await self.command('data')
+            if data_reply[0] != 354:
+                await self._rset()
+                raise smtplib.SMTPDataError(*data_reply)
+
+            try:
+                for chunk in iter_quoted(msg):
+                    self.writer.write(chunk)
+                    await self.writer.drain()
+            except BaseException:
+                # the server is part-way through DATA, so the session is unusable
+                self._abort()
+                raise
+            code, resp = await self.getreply()
+            if code != 250:
+                await self._rset()
+                raise smtplib.SMTPDataError(code, resp)
+        return senderrs
+
+    async def _send_bdat(self, msg, pipelining):
+        """Sends the message in BDAT chunks, returning the first failed or the last reply."""
+        window = BDAT_WINDOW if pipelining else 0
+        outstanding = 0
+        failed = None
+        try:
+            for command, chunk in iter_bdat(msg):
+                self.writer.write(command)
+                self.writer.write(chunk)
+                await self.writer.drain()
+                outstanding += 1
+                while outstanding > window:
+                    reply = await self.getreply()
+                    outstanding -= 1
+                    if reply[0] != 250:
+                        failed = reply
+                        break
+                if failed is not None:
+                    break
+        except BaseException:
+            # the server is waiting for the rest of a chunk, so the session is unusable
+            self._abort()
+            raise
+        while outstanding:
+            reply = await self.getreply()
+            outstanding -= 1
+            if reply[0] != 250 and failed is None:
+                failed = reply
+        return failed or reply
+
+    async def send(self, message, envelope_from=None):
+        """Verifies and sends message.
+
+        :param message: Message instance.
+        :param envelope_from: Email address to be used in MAIL FROM command.
+        :returns: a dict of the recipients the server refused
+
+        With **MAIL_MAX_RECIPIENTS** the recipients are split into envelopes
+        of at most that many, sent one after the other on this connection
+        with the message rendered once.
+        """
+        _prepare_message(message, self.mail)
+
+        if self.writer is None and self.mail.mail_suppress_send and not self.mail.outboxes:
+            return {}
+
+        instrumentation = self.mail.instrumentation
+        with instrumentation.phase('sanitize'):
+            from_addr = sanitize_address(envelope_from or message.sender)
+            to_addrs = message.envelope_recipients()
+        with instrumentation.phase('build'):
+            data = message.stream() if message.streamed else message.as_bytes()
+
+        batch_size = self.mail.mail_max_recipients
+        if batch_size and len(to_addrs) > batch_size:
+            return await _send_batches(
+                lambda batch: self.send_raw(from_addr, batch, data,
+                                            message.mail_options, message.rcpt_options),
+                _batches(to_addrs, batch_size))
+
+        return await self.send_raw(from_addr, to_addrs, data,
+                                   message.mail_options,
+                                   message.rcpt_options)
+
+    async def send_raw(self, from_addr, to_addrs, data, mail_options=(), rcpt_options=()):
+        """Sends already rendered message data, as Connection.send_raw does.
+
+        :returns: a dict of the recipients the server refused
+        """
+        if self.writer is None and self.mail.mail_suppress_send:
+            self.mail._record(from_addr, to_addrs, data)
+            return {}
+
+        if self.writer is None:
+            await self.open()
+        to_addrs = list(to_addrs)
+        instrumentation = self.mail.instrumentation
+        throttle = self.mail.throttle_for(self.relay)
+        if throttle is not None:
+            with instrumentation.phase('throttle'):
+                await throttle.wait_async(len(to_addrs), _size(data))
+
+        try:
+            refused = await self._sendmail(from_addr, to_addrs, data, mail_options, rcpt_options)
+        except Exception:
+            instrumentation.increment('failures')
+            raise
+        instrumentation.increment('messages')
+        instrumentation.increment('recipients', len(to_addrs) - len(refused))
+        if refused:
+            instrumentation.increment('refused', len(refused))
+        try:
+            instrumentation.increment('bytes', len(data))
+        except TypeError:
+            # the size of a streamed message is not always known
+            pass
+
+        self.num_emails += 1
+
+        if self.num_emails == self.mail.mail_max_emails:
+            instrumentation.increment('recycles')
+            await self.close()
+            await self.open()
+
+        if self.mail.outboxes:
+            self.mail._record(from_addr, [each for each in to_addrs if each not in refused], data)
+        return refused
+
+    async def _sendmail_once(self, *args):
+        phase = self.mail.instrumentation.phase
+        try:
+            with phase('sendmail'):
+                return await self._transaction(*args)
+        except smtplib.SMTPServerDisconnected:
+            await self.reconnect()
+            with phase('sendmail'):
+                return await self._transaction(*args)
+
+    async def _transaction(self, *args):
+        self._in_transaction = True
+        try:
+            refused = await self.sendmail(*args)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # sendmail resets the transaction before raising a reply error
+            self._in_transaction = False
+            raise
+        self._in_transaction = False
+        return refused
+
+    async def _sendmail(self, from_addr, to_addrs, data, mail_options, rcpt_options):
+        """Sends under the mail's retry policy, as Connection._sendmail does."""
+        policy = self.mail.retry_policy
+        refused = {}
+        delivered = False
+        attempt = 1
+        while True:
+            try:
+                if self.writer is None:
+                    await self.open()
+                failed = await self._sendmail_once(from_addr, to_addrs, data,
+                                                   mail_options, rcpt_options)
+                delivered = True
+            except OSError as e:
+                if policy.is_dropped(e):
+                    if self.relay is not None:
+                        self.mail.relays.failure(self.relay)
+                    self._abort()
+                if isinstance(e, smtplib.SMTPRecipientsRefused):
+                    failed = e.recipients
+                elif delivered and isinstance(e, smtplib.SMTPResponseException):
+                    failed = dict((addr, (e.smtp_code, e.smtp_error)) for addr in to_addrs)
+                elif attempt < policy.attempts and policy.is_transient(e):
+                    failed = None
+                else:
+                    raise
+
+            if failed is None:
+                retry = to_addrs
+            else:
+                retry, permanent = policy.split_refused(failed)
+                refused.update(permanent)
+                if not retry or attempt >= policy.attempts:
+                    refused.update((addr, failed[addr]) for addr in retry)
+                    if delivered:
+                        return refused
+                    raise smtplib.SMTPRecipientsRefused(refused)
+
+            to_addrs = retry
+            await asyncio.sleep(policy.delay(attempt))
+            attempt += 1
+
+    async def send_message(self, *args, **kwargs):
+        """Shortcut for send(msg).
+
+        Takes same arguments as Message constructor.
+        """
+
+        await self.send(Message(*args, **kwargs))
+
+
+class AsyncConnectionPool:
+    """Keeps authenticated asyncio connections open and lends them to tasks.
+
+    A pool belongs to the event loop it was created in.
+
+    :param factory: callable returning a new, unopened AsyncConnection
+    :param size: maximum number of connections open at once
+    :param idle_timeout: seconds an idle connection is kept before being closed
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, idle_timeout=None):
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._created = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """Checks out a healthy connection, waiting while the pool is exhausted."""
+        async with self._cond:
+            while True:
+                expired = []
+                if self.idle_timeout is not None:
+                    now = time.monotonic()
+                    expired = [conn for conn, last_used in self._idle
+                               if now - last_used >= self.idle_timeout]
+                    self._idle = [(conn, last_used) for conn, last_used in self._idle
+                                  if now - last_used < self.idle_timeout]
+                    self._created -= len(expired)
+                if self._idle:
+                    conn, _ = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn = None
+                    break
+                await self._cond.wait()
+
+        for stale in expired:
+            await stale.close()
+
+        try:
+            if conn is None:
+                conn = await self.factory().open()
+            elif not await conn.is_alive():
+                await conn.reconnect()
+        except BaseException:
+            await self._discard()
+            raise
+        return conn
+
+    async def release(self, conn, discard=False):
+        """Returns a connection to the pool, or closes it if discard is True."""
+        if not discard:
+            async with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            return
+        await conn.close()
+        await self._discard()
+
+    async def _discard(self):
+        async with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Lends a connection for the duration of an async with block."""
+        conn = await self.acquire()
+        try:
+            yield conn
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            await self.release(conn)
+            raise
+        except BaseException as e:
+            if conn._in_transaction:
+                # a send cancelled or failed mid-transaction leaves replies
+                # unread, so the session is dropped without QUIT
+                conn._abort()
+                await self.release(conn, discard=True)
+            else:
+                await self.release(conn, discard=isinstance(e, OSError))
+            raise
+        else:
+            await self.release(conn)
+
+    async def close(self):
+        """Closes all idle connections."""
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn, _ in idle:
+            await conn.close()
+
+
+class AsyncMail(Mail):
+    """Manages email messaging from coroutines.
+
+    Takes the same options as Mail. Connections are always pooled, one pool
+    per event loop, holding up to **MAIL_POOL_SIZE** sessions (default 10).
+    Unlike Mail, the server's certificate is verified unless
+    **MAIL_SSL_CONTEXT** says otherwise, and **MAIL_USE_TLS** needs Python
+    3.11 or later.
+    """
+
+    def __init__(self, **mail_options):
+        if mail_options.get('MAIL_USE_TLS') and not HAS_START_TLS:
+            raise ValueError('MAIL_USE_TLS with AsyncMail needs Python 3.11 or later; '
+                             'use MAIL_USE_SSL or Mail instead')
+        super().__init__(**mail_options)
+        self.pool = None
+        self.queue = None
+        self._pools = weakref.WeakKeyDictionary()
+
+    def connect(self):
+        """Creates a connection to the mail host; open it with ``async with``."""
+        return AsyncConnection(self)
+
+    def get_pool(self):
+        """Returns the connection pool of the running event loop."""
+        loop = asyncio.get_event_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = self._pools[loop] = AsyncConnectionPool(
+                self.connect,
+                size=self.mail_pool_size or DEFAULT_POOL_SIZE,
+                idle_timeout=self.mail_pool_idle_timeout)
+        return pool
+
+    async def send(self, message):
+        """
+        Sends a single message instance. If TESTING is True the message will
+        not actually be sent.
+
+        :param message: a Message instance.
+        """
+        if message.sender is None:
+            message.sender = self.mail_default_sender
+
+        if self.spool is not None:
+            # writing and fsyncing the spool would block the event loop
+            await asyncio.get_event_loop().run_in_executor(None, self._spool, message)
+            return
+
+        async with self.get_pool().connection() as connection:
+            await connection.send(message)
+
+    async def send_many(self, messages, concurrency=1):
+        """
+        Sends many messages, spreading them over up to `concurrency` pooled
+        connections, as Mail.send_many does with executor='thread'. Each
+        connection sends its share in one session.
+
+        Failures do not stop the batch; a SendResult is returned for every
+        message, in order.
+
+        :param messages: an iterable of Message instances.
+        :param concurrency: the number of connections to send on at once.
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1, not %r' % (concurrency,))
+        messages = list(messages)
+        for message in messages:
+            if message.sender is None:
+                message.sender = self.mail_default_sender
+
+        pool = self.get_pool()
+
+        async def send_batch(batch):
+            try:
+                async with pool.connection() as connection:
+                    return [await _send_result(connection, message) for message in batch]
+            except Exception as e:
+                return [SendResult(message, error=e) for message in batch]
+
+        batches = [messages[i::concurrency] for i in range(concurrency)]
+        batches = [batch for batch in batches if batch]
+        results = [None] * len(messages)
+        for i, batch_results in enumerate(await asyncio.gather(*map(send_batch, batches))):
+            results[i::concurrency] = batch_results
+        return results
+
+    async def send_message(self, *args, **kwargs):
+        """Shortcut for send(msg).
+
+        Takes same arguments as Message constructor.
+        """
+
+        await self.send(Message(*args, **kwargs))
+
+    async def close(self):
+        """Closes the pooled connections of the running event loop and stops the spool worker."""
+        if self.spool_worker is not None:
+            self.spool_worker.stop()
+            self.spool.close()
+        pool = self._pools.pop(asyncio.get_event_loop(), None)
+        if pool is not None:
+            await pool.close()
+
+
+def __getattr__(name):
+    if name == 'AsyncMailComponent':
+        from .component import AsyncMailComponent
+        return AsyncMailComponent
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,35 @@
+from apistar import Component
+
+from .mail import Mail
+
+
+class MailComponent(Component):
+    """A component that injects an instance of `Mail` for sending emails"""
+
+    def __init__(self, **mail_options) -> None:
+        self.mail = Mail(**mail_options)
+
+    def resolve(self) -> Mail:
+        return self.mail
+
+
+class AsyncMailComponent(Component):
+    """A component that injects an instance of `AsyncMail` for sending emails
+
+    apistar_mail.aio is imported when the component is created rather than
+    with this module, so `resolve` can't carry AsyncMail as its return
+    annotation and the parameter check is spelled out instead.
+    """
+
+    def __init__(self, **mail_options) -> None:
+        from .aio import AsyncMail
+
+        self.mail = AsyncMail(**mail_options)
+
+    def can_handle_parameter(self, parameter) -> bool:
+        from .aio import AsyncMail
+
+        return parameter.annotation is AsyncMail
+
+    def resolve(self):
+        return self.mail
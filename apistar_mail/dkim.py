@@ -0,0 +1,183 @@
+"""DKIM signing (RFC 6376) of rendered messages.
+
+Headers and body use relaxed canonicalization and SHA-256, signed with an
+RSA key (rsa-sha256) or an Ed25519 key (ed25519-sha256, RFC 8463). The
+body hash is the same for every signer, so a message caches it with its
+rendered body and signing a message again after a header change only
+costs the header signature.
+
+Signing needs the cryptography package, imported when the key is first
+used.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import threading
+
+# the headers signed when present, see DKIMSigner
+DEFAULT_HEADERS = ('from', 'sender', 'reply-to', 'subject', 'date', 'message-id', 'to', 'cc',
+                   'mime-version', 'content-type', 'content-transfer-encoding')
+
+WSP = re.compile(br'[ \t]+')
+TRAILING_WSP = re.compile(br' \r\n')
+TRAILING_CRLF = re.compile(br'(?:\r\n)+\Z')
+# the CRLF ending a header field, as opposed to one folding it
+FIELD_END = re.compile(br'\r\n(?![ \t])')
+LINE_END = re.compile(br'\r\n')
+
+
+class BodyHasher:
+    """Hashes a message body with relaxed canonicalization, a chunk at a time.
+
+    Runs of whitespace are reduced to a single space, whitespace at the end
+    of lines is removed and so are empty lines at the end of the body.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._pending = b''
+        self._blank_lines = 0
+
+    def update(self, chunk):
+        data = self._pending + bytes(chunk)
+        end = data.rfind(b'\r\n') + 2
+        if end == 1:
+            self._pending = data
+            return
+        self._pending = data[end:]
+        self._lines(data[:end])
+
+    def _lines(self, lines):
+        """Hashes complete lines, holding back the trailing empty ones."""
+        lines = TRAILING_WSP.sub(b'\r\n', WSP.sub(b' ', lines))
+        trailing = TRAILING_CRLF.search(lines)
+        content = lines[:trailing.start()]
+        count = (trailing.end() - trailing.start()) // 2
+        if content:
+            self._hash.update(b'\r\n' * self._blank_lines + content + b'\r\n')
+            self._blank_lines = count - 1
+        else:
+            self._blank_lines += count
+
+    def digest(self):
+        """The base64 encoded hash, the bh= tag of the signature."""
+        if self._pending:
+            # a last line without a CRLF gets one, keeping its trailing
+            # whitespace as other verifiers do
+            line = WSP.sub(b' ', self._pending)
+            self._hash.update(b'\r\n' * self._blank_lines + line + b'\r\n')
+            self._pending = b''
+            self._blank_lines = 0
+        return base64.b64encode(self._hash.digest()).decode('ascii')
+
+
+def body_hash(data):
+    """The relaxed SHA-256 body hash of bytes or an iterable of bytes chunks."""
+    hasher = BodyHasher()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        hasher.update(data)
+    else:
+        for chunk in data:
+            hasher.update(chunk)
+    return hasher.digest()
+
+
+def _relaxed_header(field):
+    """Canonicalizes a header field, given with its folding but without its final CRLF."""
+    name, _, value = field.partition(b':')
+    value = WSP.sub(b' ', LINE_END.sub(b'', value)).strip(b' ')
+    return name.strip().lower() + b':' + value + b'\r\n'
+
+
+def _fold(value, width=72):
+    """Splits a tag value across continuation lines."""
+    return b'\r\n '.join(value[i:i + width] for i in range(0, len(value), width))
+
+
+class DKIMSigner:
+    """Creates DKIM-Signature headers for one signing domain and key.
+
+    The key is parsed the first time a message is signed and kept for the
+    life of the signer.
+
+    :param domain: the signing domain, the d= tag
+    :param selector: the selector of the public key record, the s= tag
+    :param private_key: a PEM encoded RSA or Ed25519 private key, as bytes
+        or str, or the path of a file holding one
+    :param headers: the names of the headers signed when the message has
+        them
+    """
+
+    def __init__(self, domain, selector, private_key, headers=DEFAULT_HEADERS):
+        self.domain = domain
+        self.selector = selector
+        self.private_key = private_key
+        self.headers = tuple(name.lower().encode('ascii') for name in headers)
+        self._key = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """The parsed private key."""
+        if self._key is None:
+            with self._lock:
+                if self._key is None:
+                    self._key = self._load_key()
+        return self._key
+
+    def _load_key(self):
+        try:
+            from cryptography.hazmat.primitives import serialization
+        except ImportError:
+            raise ImportError('DKIM signing needs the cryptography package: '
+                              'pip install apistar-mail[dkim]') from None
+
+        key = self.private_key
+        if isinstance(key, str) and '-----BEGIN' in key:
+            key = key.encode('ascii')
+        elif not isinstance(key, bytes):
+            with open(os.fspath(key), 'rb') as fp:
+                key = fp.read()
+        return serialization.load_pem_private_key(key, password=None)
+
+    @property
+    def algorithm(self):
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+
+        if isinstance(self.key, ed25519.Ed25519PrivateKey):
+            return 'ed25519-sha256'
+        return 'rsa-sha256'
+
+    def _sign(self, data):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ed25519, padding
+
+        key = self.key
+        if isinstance(key, ed25519.Ed25519PrivateKey):
+            # RFC 8463 signs the SHA-256 hash of the data with PureEdDSA
+            return key.sign(hashlib.sha256(data).digest())
+        return key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+    def signature(self, header_block, body_hash):
+        """Returns the DKIM-Signature header field for a message.
+
+        :param header_block: the rendered header fields of the message, each
+            ending in CRLF, without the blank line ending the headers
+        :param body_hash: the message's body hash, see `body_hash`
+        """
+        fields = {}
+        for field in FIELD_END.split(header_block[:-2]):
+            # the last instance of a header is the one signed
+            fields[field.partition(b':')[0].strip().lower()] = field
+        signed = [name for name in self.headers if name in fields]
+
+        tags = b'v=1; a=%s; c=relaxed/relaxed; d=%s; s=%s;\r\n h=%s;\r\n bh=%s;\r\n b=' % (
+            self.algorithm.encode('ascii'), self.domain.encode('ascii'),
+            self.selector.encode('ascii'), b':'.join(signed), body_hash.encode('ascii'))
+        unsigned = b'DKIM-Signature: ' + tags
+        data = b''.join(_relaxed_header(fields[name]) for name in signed)
+        data += _relaxed_header(unsigned)[:-2]
+        signature = base64.b64encode(self._sign(data))
+        return unsigned + _fold(signature) + b'\r\n'
@@ -10,3 +10,7 @@ class MailUnicodeDecodeError(UnicodeDecodeError):
 
 class BadHeaderError(Exception):
     pass
+
+
+class SpoolLockedError(Exception):
+    """Raised when a spool directory is already open in another Spool."""
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+
+
+class RelayHost:
+    """An SMTP relay that mail can be sent through.
+
+    :param server: host name or address
+    :param port: port number
+    :param weight: share of new connections the relay gets relative to the others
+    """
+
+    def __init__(self, server, port=25, weight=1):
+        self.server = server
+        self.port = port
+        self.weight = weight
+
+    def __repr__(self):
+        return '<RelayHost %s:%s weight=%s>' % (self.server, self.port, self.weight)
+
+
+class CircuitBreaker:
+    """Tracks the health of one relay.
+
+    After `failure_threshold` failures in a row the breaker opens and the
+    relay is avoided. Once `reset_timeout` seconds have passed it is tried
+    again: a success closes the breaker, a failure opens it for another
+    `reset_timeout`.
+
+    :param failure_threshold: consecutive failures that open the breaker
+    :param reset_timeout: seconds before an open breaker lets a connection through
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def healthy(self):
+        """True when the breaker is closed, or has been open long enough to try again."""
+        return self.opened_at is None or self.clock() - self.opened_at >= self.reset_timeout
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+
+
+class RelaySelector:
+    """Spreads connections over several relays and routes around unhealthy ones.
+
+    Each new connection tries the healthy relays in a random order weighted
+    by their weights, then, as a last resort, the unhealthy ones, longest
+    failed first. Connection failures, dropped sessions and operations
+    slower than `slow_threshold` count against a relay's circuit breaker.
+
+    :param hosts: RelayHost instances
+    :param failure_threshold: consecutive failures that mark a relay unhealthy
+    :param reset_timeout: seconds an unhealthy relay is avoided before it is tried again
+    :param slow_threshold: seconds after which a connect or send counts as a failure,
+        None to not judge relays by speed
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, hosts, failure_threshold=3, reset_timeout=30,
+                 slow_threshold=None, clock=time.monotonic):
+        if not hosts:
+            raise ValueError('At least one relay host is required')
+        self.hosts = list(hosts)
+        self.slow_threshold = slow_threshold
+        self.breakers = dict((id(host), CircuitBreaker(failure_threshold, reset_timeout, clock))
+                             for host in self.hosts)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, servers, default_port=25, **kwargs):
+        """Creates a selector from the MAIL_SERVERS setting.
+
+        Each entry may be a RelayHost, a "host" or "host:port" string, a
+        (host, port) or (host, port, weight) tuple, or a dict with "server",
+        "port" and "weight" keys.
+        """
+        hosts = []
+        for entry in servers:
+            if isinstance(entry, RelayHost):
+                hosts.append(entry)
+            elif isinstance(entry, str):
+                server, _, port = entry.rpartition(':')
+                if not server or not port.isdigit():
+                    server, port = entry, default_port
+                hosts.append(RelayHost(server, int(port)))
+            elif isinstance(entry, dict):
+                hosts.append(RelayHost(entry['server'], entry.get('port', default_port),
+                                       entry.get('weight', 1)))
+            else:
+                hosts.append(RelayHost(*entry))
+        return cls(hosts, **kwargs)
+
+    def breaker(self, host):
+        return self.breakers[id(host)]
+
+    def candidates(self):
+        """Returns every relay in the order they should be tried."""
+        with self._lock:
+            healthy = [host for host in self.hosts if self.breaker(host).healthy]
+            unhealthy = [host for host in self.hosts if not self.breaker(host).healthy]
+            unhealthy.sort(key=lambda host: self.breaker(host).opened_at)
+
+        ordered = []
+        while healthy:
+            host = random.choices(healthy, weights=[host.weight for host in healthy])[0]
+            healthy.remove(host)
+            ordered.append(host)
+        return ordered + unhealthy
+
+    def success(self, host, duration=None):
+        """Records a successful connect or send, taking `duration` seconds."""
+        if duration is not None and self.slow_threshold is not None:
+            if duration > self.slow_threshold:
+                return self.failure(host)
+        with self._lock:
+            self.breaker(host).success()
+
+    def failure(self, host):
+        with self._lock:
+            self.breaker(host).failure()
+
+    def healthy(self):
+        """Returns the relays currently considered healthy."""
+        with self._lock:
+            return [host for host in self.hosts if self.breaker(host).healthy]
@@ -1,21 +1,97 @@
+import base64
+import collections
+import os
 import re
-import smtplib
+import sys
+import threading
 import time
 import unicodedata
 
-from email import charset, policy
-from email.encoders import encode_base64
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.header import Header
-from email.utils import formatdate, formataddr, make_msgid, parseaddr
-
-from apistar import Component
+from contextlib import contextmanager
+from functools import lru_cache
+from mmap import ACCESS_READ, mmap as memory_map
 
+from . import smtp
+from ._lazy import LazyModule
 from .exc import MailUnicodeDecodeError, BadHeaderError
+from .hosts import RelaySelector
+from .metrics import Instrumentation
+from .msgid import MessageIdGenerator, make_msgid as _make_msgid
+from .outbox import Outbox
+from .pool import ConnectionPool
+from .retry import RetryPolicy
+from .sendqueue import SendQueue
+from .spool import Spool, SpoolWorker
+from .throttle import Throttle
+
+# smtplib, and ssl with it, are imported when the first connection is made
+smtplib = LazyModule('smtplib')
+futures = LazyModule('concurrent.futures')
+
+_email_loaded = False
+
+
+def _load_email():
+    """Imports the email package's MIME machinery the first time it is needed.
+
+    Also registers the utf-8 charset, so utf-8 text is sent as 8bit and
+    headers use the shorter of base64 and quoted-printable.
+    """
+    global _email_loaded, policy, encode_base64, MIMEBase, MIMEMultipart, MIMEText
+    global Header, HeaderBlock, formatdate, formataddr, parseaddr
+    if _email_loaded:
+        return
+
+    from email import charset, policy
+    from email.encoders import encode_base64
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.header import Header
+    from email.message import Message as HeaderBlock
+    from email.utils import formatdate, formataddr, parseaddr
+
+    charset.add_charset('utf-8', charset.SHORTEST, None, 'utf-8')
+    _email_loaded = True
+
+
+class _Empty:
+    """A list or dict attribute created when first read.
+
+    The value is kept in the slot of the same name with a leading
+    underscore, which holds None until then, so the attributes most messages
+    leave empty take no memory.
+
+    :param factory: creates the empty value, list or dict
+    """
 
-charset.add_charset('utf-8', charset.SHORTEST, None, 'utf-8')
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if value is None:
+            value = self.factory()
+            setattr(instance, self.slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
+
+# attributes rendered only in the top-level headers, or not at all
+HEADER_ATTRIBUTES = frozenset(['recipients', 'subject', 'sender', 'reply_to', 'cc', 'bcc', 'date',
+                               'msgId', 'extra_headers', 'mail_options', 'rcpt_options', 'dkim'])
+
+
+def _intern(value):
+    """Interns strings repeated across many messages, such as the sender."""
+    return sys.intern(value) if type(value) is str else value
 
 
 def force_text(s, encoding='utf-8', errors='strict', ):
@@ -41,7 +117,13 @@ def force_text(s, encoding='utf-8', errors='strict', ):
     return s
 
 
-def sanitize_subject(subject, encoding='utf-8'):
+# the most sanitized addresses and subjects each kept for reuse
+HEADER_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _sanitize_subject(subject, encoding):
+    _load_email()
     try:
         subject.encode('ascii')
     except UnicodeEncodeError:
@@ -52,7 +134,13 @@ def sanitize_subject(subject, encoding='utf-8'):
     return subject
 
 
-def sanitize_address(addr, encoding='utf-8'):
+def sanitize_subject(subject, encoding='utf-8'):
+    return _sanitize_subject(subject, encoding)
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _sanitize_address(addr, encoding):
+    _load_email()
     if isinstance(addr, str):
         addr = parseaddr(force_text(addr))
     nm, addr = addr
@@ -74,10 +162,126 @@ def sanitize_address(addr, encoding='utf-8'):
     return formataddr((nm, addr))
 
 
+def sanitize_address(addr, encoding='utf-8'):
+    if not isinstance(addr, (str, tuple)):
+        # an unhashable (name, address) pair, such as a list
+        return _sanitize_address.__wrapped__(addr, encoding)
+    return _sanitize_address(addr, encoding)
+
+
 def sanitize_addresses(addresses, encoding='utf-8'):
     return map(lambda e: sanitize_address(e, encoding), addresses)
 
 
+def header_cache_info():
+    """Reports how well the sanitized address and subject caches are doing.
+
+    :returns: a dict with an entry for ``address`` and ``subject``, each a
+        dict of hits, misses, size, maxsize and hit_rate.
+    """
+    info = {}
+    for name, cached in (('address', _sanitize_address), ('subject', _sanitize_subject)):
+        stats = cached.cache_info()
+        lookups = stats.hits + stats.misses
+        info[name] = {
+            'hits': stats.hits,
+            'misses': stats.misses,
+            'size': stats.currsize,
+            'maxsize': stats.maxsize,
+            'hit_rate': stats.hits / lookups if lookups else 0.0,
+        }
+    return info
+
+
+def clear_header_cache():
+    """Empties the sanitized address and subject caches and resets their stats."""
+    _sanitize_address.cache_clear()
+    _sanitize_subject.cache_clear()
+
+
+SPACES = re.compile(r'[\s]+', re.UNICODE)
+
+# Streamed attachments are rendered with a placeholder line in place of their
+# base64 payload, which is encoded in chunks as the message is sent.
+STREAM_MARKER = re.compile(br'apistar-mail-stream-([0-9a-f]{32})\r\n')
+STREAM_MARKER_TEXT = re.compile(r'apistar-mail-stream-([0-9a-f]{32})\r\n')
+
+# 57 bytes of input make one 76 character line of base64
+BASE64_LINE = 57
+STREAM_CHUNK = BASE64_LINE * 1024
+
+# the most base64 encoded data kept for attachments made with
+# Attachment.from_path, shared by the whole process
+ENCODED_FILE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class _EncodedFileCache:
+    """Least-recently-used cache of base64 payloads, bounded by their total size.
+
+    Entries are keyed by path and hold the mtime and size the payload was
+    encoded from. A payload larger than the whole cache is not kept.
+    """
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        with self._lock:
+            cached = self._entries.get(source[0])
+            if cached is None or cached[0] != source:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(source[0])
+            self.hits += 1
+            return cached[1]
+
+    def put(self, source, payload):
+        with self._lock:
+            old = self._entries.pop(source[0], None)
+            if old is not None:
+                self.size -= len(old[1])
+            if len(payload) > self.maxbytes:
+                return
+            self._entries[source[0]] = (source, payload)
+            self.size += len(payload)
+            while self.size > self.maxbytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = 0
+
+
+_encoded_files = _EncodedFileCache(ENCODED_FILE_CACHE_BYTES)
+
+
+def encoded_file_cache_info():
+    """Reports how well the cache of encoded `Attachment.from_path` files is doing.
+
+    :returns: a dict of hits, misses, size and maxsize, the sizes in bytes
+        of base64 encoded data, and hit_rate.
+    """
+    lookups = _encoded_files.hits + _encoded_files.misses
+    return {
+        'hits': _encoded_files.hits,
+        'misses': _encoded_files.misses,
+        'size': _encoded_files.size,
+        'maxsize': _encoded_files.maxbytes,
+        'hit_rate': _encoded_files.hits / lookups if lookups else 0.0,
+    }
+
+
+def clear_encoded_file_cache():
+    """Empties the cache of encoded `Attachment.from_path` files and resets its stats."""
+    _encoded_files.clear()
+
+
 def _has_newline(line):
     """Used by has_bad_header to check for \\r or \\n"""
     if line and ('\r' in line or '\n' in line):
@@ -88,21 +292,249 @@ def _has_newline(line):
 class Attachment:
     """Encapsulates file attachment information.
 
-    :param filename: filename of attachment
+    :param filename: filename of attachment, by default the name of a file path given as data
     :param content_type: file mimetype
-    :param data: the raw file data
+    :param data: the raw file data as bytes, or a file path, binary file object or
+        iterator of bytes to stream the data from
     :param disposition: content-disposition (if any)
     :param headers: additional headers. Useful when HTML emails reference attached images
+
+    The encoded MIME part is cached, so an attachment shared by several
+    messages is base64 encoded once. Streamed data is instead read and
+    encoded in chunks each time the message is sent, so it is never held in
+    memory whole. A file path can be sent any number of times, a seekable
+    file object is rewound to where it started, and an iterator can be sent
+    only once.
     """
 
+    __slots__ = ('filename', 'content_type', 'data', 'disposition', 'headers',
+                 '_part', '_start', '_consumed', '_source', '_cache', '_marker')
+
     def __init__(self, filename=None, content_type=None, data=None,
                  disposition=None, headers=None):
+        if filename is None and isinstance(data, os.PathLike):
+            filename = os.path.basename(data)
+        self._start = self._marker = None
+        self._consumed = False
+        self._cache = False
         self.filename = filename
         self.content_type = content_type
         self.data = data
         self.disposition = disposition or 'attachment'
         self.headers = headers or {}
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            self._part = None
+            if name == 'data':
+                self._source = None
+
+    @classmethod
+    def from_path(cls, path, content_type=None, filename=None, disposition=None,
+                  headers=None, mmap=True, cache=True):
+        """Creates an attachment for a file on disk.
+
+        The file's base64 encoding is cached for the whole process, keyed by
+        its path, mtime and size, so attaching the same static file again,
+        from any thread, reuses the encoded payload until the file changes.
+        The cache holds up to `ENCODED_FILE_CACHE_BYTES` of encoded data and
+        drops the least recently used files beyond that.
+
+        :param path: path of the file
+        :param content_type: file mimetype, guessed from the file name by default
+        :param filename: filename of attachment, by default the name of the file
+        :param disposition: content-disposition (if any)
+        :param headers: additional headers
+        :param mmap: memory-map the file rather than reading it into memory.
+            The encoder then reads the file's pages from the OS page cache
+            through a memoryview, without copying them.
+        :param cache: keep the file's base64 encoding in the process-wide
+            cache. Pass False for a large or one-off file.
+        """
+        import mimetypes
+
+        path = os.path.abspath(os.fspath(path))
+        if content_type is None:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        with open(path, 'rb') as fp:
+            stat = os.fstat(fp.fileno())
+            if mmap and stat.st_size:
+                data = memoryview(memory_map(fp.fileno(), 0, access=ACCESS_READ))
+            else:
+                data = fp.read()
+
+        attachment = cls(filename or os.path.basename(path), content_type, data,
+                         disposition, headers)
+        attachment._source = (path, stat.st_mtime_ns, stat.st_size)
+        attachment._cache = cache
+        return attachment
+
+    def _encode(self, part):
+        """Sets the base64 encoded data as the payload of part."""
+        if self._source is None or not self._cache:
+            part.set_payload(self.data)
+            encode_base64(part)
+            return
+
+        cached = _encoded_files.get(self._source)
+        if cached is not None:
+            part.set_payload(cached)
+            part['Content-Transfer-Encoding'] = 'base64'
+            return
+
+        part.set_payload(self.data)
+        encode_base64(part)
+        _encoded_files.put(self._source, part.get_payload())
+
+    @property
+    def streamed(self):
+        """True when the data is read from a file or iterator as it is sent."""
+        return self.data is not None and not isinstance(
+            self.data, (bytes, bytearray, memoryview, str))
+
+    def _mime_part(self, ascii_attachments=False):
+        """Creates the encoded MIME part, or returns the cached one"""
+        if self._part is not None and self._part[0] == ascii_attachments:
+            return self._part[1]
+
+        _load_email()
+        f = MIMEBase(*self.content_type.split('/'))
+        if self.streamed:
+            import uuid
+
+            self._marker = uuid.uuid4().hex
+            f.set_payload('apistar-mail-stream-%s\n' % self._marker)
+            f['Content-Transfer-Encoding'] = 'base64'
+        else:
+            self._encode(f)
+
+        filename = self.filename
+        if filename and ascii_attachments:
+            # force filename to ascii
+            filename = unicodedata.normalize('NFKD', filename)
+            filename = filename.encode('ascii', 'ignore').decode('ascii')
+            filename = SPACES.sub(u' ', filename).strip()
+
+        try:
+            filename and filename.encode('ascii')
+
+        except UnicodeEncodeError:
+            filename = ('UTF8', '', filename)
+
+        f.add_header('Content-Disposition',
+                     self.disposition,
+                     filename=filename)
+
+        for key, value in self.headers.items():
+            f.add_header(key, value)
+
+        self._part = (ascii_attachments, f)
+        return f
+
+    def _chunks(self):
+        """Yields the raw data of a streamed attachment."""
+        data = self.data
+        if isinstance(data, os.PathLike):
+            with open(data, 'rb') as fp:
+                yield from iter(lambda: fp.read(STREAM_CHUNK), b'')
+        elif hasattr(data, 'read'):
+            if self._start is None:
+                self._start = data.tell() if data.seekable() else False
+            elif self._start is not False:
+                data.seek(self._start)
+            elif self._consumed:
+                raise ValueError('%r is not seekable and has already been sent' % data)
+            self._consumed = True
+            yield from iter(lambda: data.read(STREAM_CHUNK), b'')
+        else:
+            if self._consumed:
+                raise ValueError('%r is an iterator and has already been sent' % data)
+            self._consumed = True
+            yield from data
+
+    def _iter_base64(self):
+        """Yields the base64 encoded data of a streamed attachment in CRLF lines."""
+        pending = b''
+        for chunk in self._chunks():
+            if pending:
+                chunk = pending + chunk
+            cut = len(chunk) - len(chunk) % BASE64_LINE
+            pending = chunk[cut:]
+            if cut:
+                yield base64.encodebytes(chunk[:cut]).replace(b'\n', b'\r\n')
+        if pending:
+            yield base64.encodebytes(pending).replace(b'\n', b'\r\n')
+
+    def _encoded_size(self):
+        """The length of the base64 encoded data, or None if it can't be known up front."""
+        data = self.data
+        if isinstance(data, os.PathLike):
+            size = os.stat(data).st_size
+        elif hasattr(data, 'read') and data.seekable():
+            # the start offset of a seekable file may be 0, so compare with None
+            start = data.tell() if self._start is None else self._start
+            try:
+                size = os.fstat(data.fileno()).st_size - start
+            except (OSError, ValueError):
+                # an in-memory file such as BytesIO has no file descriptor
+                size = data.seek(0, os.SEEK_END) - start
+                data.seek(start)
+        else:
+            return None
+        lines, rest = divmod(size, BASE64_LINE)
+        encoded = lines * 78
+        if rest:
+            encoded += 4 * ((rest + 2) // 3) + 2
+        return encoded
+
+
+class MessageStream:
+    """The rendered bytes of a message, produced in chunks as they are read.
+
+    Streamed attachments are read and base64 encoded a chunk at a time, so
+    sending the stream holds only one chunk of each in memory.
+
+    :param data: the rendered message with placeholders for streamed attachments
+    :param attachments: the streamed attachments
+    """
+
+    def __init__(self, data, attachments):
+        self.data = data
+        self.attachments = dict((a._marker, a) for a in attachments)
+
+    def __iter__(self):
+        for i, segment in enumerate(STREAM_MARKER.split(self.data)):
+            if i % 2:
+                yield from self.attachments[segment.decode('ascii')]._iter_base64()
+            elif segment:
+                yield segment
+
+    def __len__(self):
+        size = len(STREAM_MARKER.sub(b'', self.data))
+        for attachment in self.attachments.values():
+            encoded = attachment._encoded_size()
+            if encoded is None:
+                raise TypeError('the size of %r is not known' % attachment.data)
+            size += encoded
+        return size
+
+
+class RenderedBody:
+    """The rendered content headers and body of a message, see Message._render_body.
+
+    The DKIM body hash is kept with them, so it is computed once however
+    many times the headers are signed.
+    """
+
+    __slots__ = ('content_headers', 'body', 'body_hash')
+
+    def __init__(self, content_headers, body):
+        self.content_headers = content_headers
+        self.body = body
+        self.body_hash = None
+
 
 class Message:
     """Encapsulates an email message.
@@ -124,8 +556,43 @@ class Message:
     :param rcpt_options:  A list of ESMTP options to be used in RCPT commands
     :param ascii_attachments: A boolean used to force attachment file names to ascii
 
+    Set `dkim` to a DKIMSigner to sign the rendered message. Messages sent
+    through a Mail with the MAIL_DKIM_* options get its signer.
+
+    The rendered message is cached until an attribute is assigned or
+    `add_recipient`/`attach` is called. Call `invalidate` after changing a
+    list or dict attribute in place.
+
+    The encoded body, with its attachments, is cached apart from the
+    top-level headers. Changing only the recipients, subject, sender, date,
+    Message-ID or extra headers re-renders just the header block, so
+    resending a large message costs about as much as its headers. Signing
+    it again then only costs the header signature.
+
+    Messages use __slots__ and generate their Message-ID when it is first
+    read, so large queues of pending messages stay small. The sender, reply-to
+    and charset strings are interned, so messages sent from the same address
+    share one copy of it.
     """
 
+    __slots__ = ('recipients', 'subject', 'sender', 'reply_to', 'body', 'date', 'charset',
+                 'extra_headers', 'ascii_attachments', 'dkim', '_cc', '_bcc', '_alts',
+                 '_mail_options', '_rcpt_options', '_attachments', '_msg_id',
+                 '_msg', '_bytes', '_string',
+                 # the RenderedBody, see _render_body
+                 '_body_bytes',
+                 # the recipients and their sanitized addresses, see envelope_recipients
+                 '_envelope',
+                 # pre-built text parts keyed by (text, subtype), set by MessageTemplate
+                 '_shared_parts')
+
+    cc = _Empty(list)
+    bcc = _Empty(list)
+    alts = _Empty(dict)
+    mail_options = _Empty(list)
+    rcpt_options = _Empty(list)
+    attachments = _Empty(list)
+
     def __init__(self, subject='',
                  recipients=None,
                  body=None,
@@ -146,56 +613,98 @@ class Message:
         if isinstance(sender, tuple):
             sender = "{} <{}>".format(*sender)
 
+        self._msg = self._envelope = self._shared_parts = self._msg_id = None
+        self._body_bytes = None
         self.recipients = recipients or []
         self.subject = subject
-        self.sender = sender
-        self.reply_to = reply_to
-        self.cc = cc or []
-        self.bcc = bcc or []
+        self.sender = _intern(sender)
+        self.reply_to = _intern(reply_to)
+        self._cc = cc or None
+        self._bcc = bcc or None
         self.body = body
-        self.alts = dict(alts or {})
+        self._alts = dict(alts) if alts else None
         self.html = html
         self.date = date
-        self.msgId = make_msgid()
-        self.charset = charset
+        self.charset = _intern(charset)
         self.extra_headers = extra_headers
-        self.mail_options = mail_options or []
-        self.rcpt_options = rcpt_options or []
-        self.attachments = attachments or []
+        self._mail_options = mail_options or None
+        self._rcpt_options = rcpt_options or None
+        self._attachments = attachments or None
         self.ascii_attachments = ascii_attachments
+        self.dkim = None
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            self.invalidate(body=name not in HEADER_ATTRIBUTES)
+
+    def invalidate(self, body=True):
+        """Discards the cached rendering of the message.
+
+        :param body: also discard the rendered body. Pass False when only
+            header attributes, such as the recipients, were changed in place.
+        """
+        self._msg = self._bytes = self._string = None
+        if body:
+            self._body_bytes = None
 
     @property
     def send_to(self):
-        return set(self.recipients) | set(self.bcc or ()) | set(self.cc or ())
+        return set(self.recipients) | set(self._bcc or ()) | set(self._cc or ())
+
+    def envelope_recipients(self):
+        """The sanitized addresses of every recipient, for the RCPT TO commands.
+
+        Kept until the recipients change, so retries and repeated sends of
+        the message don't sanitize them again.
+        """
+        send_to = self.send_to
+        if self._envelope is None or self._envelope[0] != send_to:
+            self._envelope = (send_to, list(sanitize_addresses(send_to)))
+        return list(self._envelope[1])
+
+    @property
+    def msgId(self):
+        if self._msg_id is None:
+            self._msg_id = _make_msgid()
+        return self._msg_id
+
+    @msgId.setter
+    def msgId(self, value):
+        self._msg_id = value
 
     @property
     def html(self):
-        return self.alts.get('html')
+        return self._alts.get('html') if self._alts else None
 
     @html.setter
     def html(self, value):
-        if value is None:
-            self.alts.pop('html', None)
-        else:
+        if value is not None:
             self.alts['html'] = value
+        elif self._alts:
+            self._alts.pop('html', None)
+        self.invalidate()
 
     def _mimetext(self, text, subtype='plain'):
         """Creates a MIMEText object with the given subtype (default: 'plain')
         If the text is unicode, the utf-8 charset is used.
         """
+        if self._shared_parts is not None and (text, subtype) in self._shared_parts:
+            return self._shared_parts[(text, subtype)]
         charset = self.charset or 'utf-8'
+        _load_email()
         return MIMEText(text, _subtype=subtype, _charset=charset)
 
-    def _message(self):
-        """Creates the email"""
-        encoding = self.charset or 'utf-8'
-
-        attachments = self.attachments or []
+    def _mime_root(self):
+        """Creates the MIME tree of the body and attachments, without the
+        top-level headers."""
+        _load_email()
+        attachments = self._attachments or []
 
-        if len(attachments) == 0 and not self.alts:
+        if len(attachments) == 0 and not self._alts:
             # No html content and zero attachments means plain text
             msg = self._mimetext(self.body)
-        elif len(attachments) > 0 and not self.alts:
+        elif len(attachments) > 0 and not self._alts:
             # No html and at least one attachment means multipart
             msg = MIMEMultipart()
             msg.attach(self._mimetext(self.body))
@@ -208,6 +717,18 @@ class Message:
                 alternative.attach(self._mimetext(content, mimetype))
             msg.attach(alternative)
 
+        for attachment in attachments:
+            msg.attach(attachment._mime_part(self.ascii_attachments))
+        return msg
+
+    def _add_headers(self, msg):
+        """Sets the top-level headers on msg."""
+        if self.date is None:
+            # fix the Date header now so later renderings agree with this one
+            self.date = time.time()
+
+        encoding = self.charset or 'utf-8'
+
         if self.subject:
             msg['Subject'] = sanitize_subject(force_text(self.subject), encoding)
 
@@ -218,8 +739,8 @@ class Message:
         # see RFC 5322 section 3.6.4.
         msg['Message-ID'] = self.msgId
 
-        if self.cc:
-            msg['Cc'] = ', '.join(list(set(sanitize_addresses(self.cc, encoding))))
+        if self._cc:
+            msg['Cc'] = ', '.join(list(set(sanitize_addresses(self._cc, encoding))))
 
         if self.reply_to:
             msg['Reply-To'] = sanitize_address(self.reply_to, encoding)
@@ -228,43 +749,103 @@ class Message:
             for k, v in self.extra_headers.items():
                 msg[k] = v
 
-        SPACES = re.compile(r'[\s]+', re.UNICODE)
-        for attachment in attachments:
-            f = MIMEBase(*attachment.content_type.split('/'))
-            f.set_payload(attachment.data)
-            encode_base64(f)
-
-            filename = attachment.filename
-            if filename and self.ascii_attachments:
-                # force filename to ascii
-                filename = unicodedata.normalize('NFKD', filename)
-                filename = filename.encode('ascii', 'ignore').decode('ascii')
-                filename = SPACES.sub(u' ', filename).strip()
-
-            try:
-                filename and filename.encode('ascii')
-
-            except UnicodeEncodeError:
-                filename = ('UTF8', '', filename)
+    def _message(self):
+        """Creates the email, or returns the cached one"""
+        if self._msg is not None:
+            return self._msg
 
-            f.add_header('Content-Disposition',
-                         attachment.disposition,
-                         filename=filename)
+        msg = self._mime_root()
+        self._add_headers(msg)
+        msg.policy = policy.SMTP
 
-            for key, value in attachment.headers.items():
-                f.add_header(key, value)
+        self._msg = msg
+        return msg
 
-            msg.attach(f)
+    def _render_body(self):
+        """Returns the RenderedBody, rendering it unless it is cached.
 
-        msg.policy = policy.SMTP
+        The content headers (Content-Type, MIME-Version and
+        Content-Transfer-Encoding) come first in the message, followed by the
+        top-level headers, a blank line and the body.
+        """
+        if self._body_bytes is None:
+            data = self._mime_root().as_bytes(policy=policy.SMTP)
+            end = data.index(b'\r\n\r\n') + 2
+            self._body_bytes = RenderedBody(data[:end], data[end:])
+        return self._body_bytes
+
+    def _body_hash(self, rendered):
+        """Returns the DKIM body hash of the rendered body, computing it once."""
+        if rendered.body_hash is None:
+            from .dkim import body_hash
+
+            # the rendered body starts with the blank line ending the headers
+            body = rendered.body[2:]
+            streamed = [a for a in self._attachments or () if a.streamed]
+            if not streamed:
+                rendered.body_hash = body_hash(body)
+            else:
+                for attachment in streamed:
+                    data = attachment.data
+                    if not (isinstance(data, os.PathLike)
+                            or hasattr(data, 'read') and data.seekable()):
+                        raise ValueError('%r can only be read once, so it cannot be both '
+                                         'hashed for DKIM and sent' % data)
+                rendered.body_hash = body_hash(MessageStream(body, streamed))
+        return rendered.body_hash
+
+    def _render(self):
+        """Renders the message, reusing the cached body."""
+        rendered = self._render_body()
+        _load_email()
+        headers = HeaderBlock()
+        self._add_headers(headers)
+        # the header block renders as its headers and the blank line ending them
+        header_block = rendered.content_headers + headers.as_bytes(policy=policy.SMTP)[:-2]
+        if self.dkim is not None:
+            header_block = (self.dkim.signature(header_block, self._body_hash(rendered))
+                            + header_block)
+        return header_block + rendered.body
 
-        return msg
+    @property
+    def streamed(self):
+        """True when an attachment is streamed rather than held in memory."""
+        return any(attachment.streamed for attachment in self._attachments or ())
 
     def as_string(self):
-        return self._message().as_string()
+        if self._string is None:
+            self._string = self._message().as_string()
+        if not self.streamed:
+            return self._string
+
+        streamed = dict((a._marker, a) for a in self.attachments if a.streamed)
+        return STREAM_MARKER_TEXT.sub(
+            lambda m: b''.join(streamed[m.group(1)]._iter_base64()).decode('ascii'),
+            self._string)
 
     def as_bytes(self):
-        return self._message().as_bytes()
+        if self._bytes is None:
+            self._bytes = self._render()
+        if not self.streamed:
+            return self._bytes
+        return b''.join(self.stream())
+
+    def stream(self):
+        """Returns the rendered message as a MessageStream, to send it in chunks."""
+        if self._bytes is None:
+            self._bytes = self._render()
+        return MessageStream(self._bytes, [a for a in self.attachments if a.streamed])
+
+    @property
+    def size(self):
+        """The size in bytes of the rendered message, or None if an attachment
+        is streamed from an iterator."""
+        if not self.streamed:
+            return len(self.as_bytes())
+        try:
+            return len(self.stream())
+        except TypeError:
+            return None
 
     def __str__(self):
         return self.as_string()
@@ -307,6 +888,7 @@ class Message:
         """
 
         self.recipients.append(recipient)
+        self.invalidate(body=False)
 
     def attach(self,
                filename=None,
@@ -325,6 +907,120 @@ class Message:
         """
         self.attachments.append(
             Attachment(filename, content_type, data, disposition, headers))
+        self.invalidate()
+
+
+def _prepare_message(message, mail):
+    """Verifies a message and applies mail settings before it is sent."""
+    assert message.send_to, "No recipients have been added"
+
+    assert message.sender, (
+        "The message does not specify a sender and a default sender "
+        "has not been configured")
+
+    if message.has_bad_headers():
+        raise BadHeaderError
+
+    if message.date is None:
+        message.date = time.time()
+
+    if message._msg_id is None and mail.make_msgid is not None:
+        message.msgId = mail.make_msgid()
+
+    if not message.ascii_attachments and mail.mail_ascii_attachments:
+        message.ascii_attachments = True
+
+    if message.dkim is None and mail.dkim is not None:
+        message.dkim = mail.dkim
+
+
+def _size(data):
+    """The length of message data, or 0 when a streamed message's size isn't known."""
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def _batches(recipients, size):
+    """Splits recipients into envelopes of at most size addresses."""
+    return [recipients[i:i + size] for i in range(0, len(recipients), size)]
+
+
+def _send_batches(send_batch, batches, map=map):
+    """Sends every batch of recipients and merges the refused recipients.
+
+    A batch failing does not stop the others. A batch rejected with an SMTP
+    reply counts all its recipients as refused with that reply. If any batch
+    failed for another reason, such as a dropped connection, the first such
+    error is raised once every batch has been tried.
+
+    :param send_batch: callable sending the message to a list of recipients
+        and returning the dict of refused recipients
+    :param batches: lists of recipients
+    :param map: the map function to send the batches with, to run them in parallel
+    :returns: the dict of refused recipients
+    """
+    def attempt(batch):
+        try:
+            return send_batch(batch), None
+        except Exception as e:
+            return _batch_failure(batch, e)
+
+    return _merge_batches(batches, map(attempt, batches))
+
+
+def _batch_failure(batch, error):
+    """The refused recipients and error of a batch whose send raised error.
+
+    An SMTP reply refuses the recipients it applies to; any other error is
+    returned to be raised.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return error.recipients, None
+    if isinstance(error, smtplib.SMTPResponseException):
+        return dict((addr, (error.smtp_code, error.smtp_error)) for addr in batch), None
+    return {}, error
+
+
+def _merge_batches(batches, outcomes):
+    """Merges the (refused, error) outcomes of batches as _send_batches describes."""
+    refused, errors = {}, []
+    for batch_refused, error in outcomes:
+        refused.update(batch_refused)
+        if error is not None:
+            errors.append(error)
+    if errors:
+        raise errors[0]
+    if len(refused) == sum(len(batch) for batch in batches):
+        raise smtplib.SMTPRecipientsRefused(refused)
+    return refused
+
+
+class SendResult:
+    """The outcome of sending a single message with `Mail.send_many`.
+
+    :param message: the Message instance
+    :param accepted: recipients the server accepted
+    :param refused: dict of refused recipients to (code, response) tuples
+    :param code: the SMTP reply code, 250 when the message was accepted
+    :param error: the exception raised if the message was not sent
+    """
+
+    def __init__(self, message, accepted=None, refused=None, code=None, error=None):
+        self.message = message
+        self.accepted = accepted or []
+        self.refused = refused or {}
+        self.code = code
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<SendResult code=%r accepted=%d refused=%d>' % (
+            self.code, len(self.accepted), len(self.refused))
 
 
 class Connection:
@@ -337,8 +1033,20 @@ class Connection:
         :param mail: the application mail manager
         """
         self.mail = mail
+        self.host = None
+        self.relay = None
+        self.num_emails = 0
+        # True while a transaction may have replies left unread, see ConnectionPool
+        self._in_transaction = False
 
     def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def open(self):
+        """Opens the underlying SMTP session unless sending is suppressed."""
         if self.mail.mail_suppress_send:
             self.host = None
         else:
@@ -348,22 +1056,87 @@ class Connection:
 
         return self
 
-    def __exit__(self, exc_type, exc_value, tb):
-        if self.host:
-            self.host.quit()
+    def close(self):
+        """Closes the SMTP session, ignoring a server that already hung up."""
+        host, self.host = self.host, None
+        if host:
+            try:
+                with self.mail.instrumentation.phase('quit'):
+                    host.quit()
+            except (smtplib.SMTPServerDisconnected, OSError):
+                host.close()
+
+    def _abort(self):
+        """Drops the session without QUIT, when it may be part-way through a command."""
+        host, self.host = self.host, None
+        self._in_transaction = False
+        if host:
+            host.close()
+
+    def reconnect(self):
+        """Replaces the SMTP session with a freshly configured one."""
+        self.mail.instrumentation.increment('reconnects')
+        self.close()
+        return self.open()
+
+    def is_alive(self):
+        """Checks the SMTP session with a NOOP command."""
+        if self.host is None:
+            return self.mail.mail_suppress_send
+        try:
+            code, _ = self.host.noop()
+        except (smtplib.SMTPServerDisconnected, OSError):
+            return False
+        return code == 250
 
     def configure_host(self):
-        if self.mail.mail_use_ssl:
-            host = smtplib.SMTP_SSL(self.mail.mail_server, self.mail.mail_port)
-        else:
-            host = smtplib.SMTP(self.mail.mail_server, self.mail.mail_port)
+        """Opens and authenticates an SMTP session.
+
+        With **MAIL_SERVERS** the relays are tried in the order the mail's
+        RelaySelector gives, and the session is opened on the first that
+        answers.
+        """
+        relays = self.mail.relays
+        if relays is None:
+            return self._configure_host(self.mail.mail_server, self.mail.mail_port)
+
+        error = None
+        for relay in relays.candidates():
+            start = time.monotonic()
+            try:
+                host = self._configure_host(relay.server, relay.port)
+            except OSError as e:
+                relays.failure(relay)
+                error = e
+                continue
+            relays.success(relay, time.monotonic() - start)
+            self.relay = relay
+            return host
+        raise error
+
+    def _relay_failed(self):
+        if self.relay is not None:
+            self.mail.relays.failure(self.relay)
+
+    def _configure_host(self, server, port):
+        instrumentation = self.mail.instrumentation
+        tls = {}
+        if self.mail.mail_ssl_context is not None:
+            tls['context'] = self.mail.mail_ssl_context
+        with instrumentation.phase('connect'):
+            if self.mail.mail_use_ssl:
+                host = smtplib.SMTP_SSL(server, port, **tls)
+            else:
+                host = smtplib.SMTP(server, port)
 
         host.set_debuglevel(int(self.mail.mail_debug))
 
         if self.mail.mail_use_tls:
-            host.starttls()
+            with instrumentation.phase('starttls'):
+                host.starttls(**tls)
         if self.mail.mail_user and self.mail.mail_password:
-            host.login(self.mail.mail_user, self.mail.mail_password)
+            with instrumentation.phase('login'):
+                host.login(self.mail.mail_user, self.mail.mail_password)
 
         return host
 
@@ -372,37 +1145,163 @@ class Connection:
 
         :param message: Message instance.
         :param envelope_from: Email address to be used in MAIL FROM command.
-        """
-        assert message.send_to, "No recipients have been added"
-
-        assert message.sender, (
-            "The message does not specify a sender and a default sender "
-            "has not been configured")
+        :returns: a dict of the recipients the server refused
 
-        if message.has_bad_headers():
-            raise BadHeaderError
-
-        if message.date is None:
-            message.date = time.time()
-
-        if not message.ascii_attachments and self.mail.mail_ascii_attachments:
-            message.ascii_attachments = True
+        With **MAIL_MAX_RECIPIENTS** the recipients are split into envelopes
+        of at most that many, sent one after the other on this connection
+        with the message rendered once.
+        """
+        _prepare_message(message, self.mail)
+
+        if self.host is None and self.mail.mail_suppress_send and not self.mail.outboxes:
+            return {}
+
+        instrumentation = self.mail.instrumentation
+        with instrumentation.phase('sanitize'):
+            from_addr = sanitize_address(envelope_from or message.sender)
+            to_addrs = message.envelope_recipients()
+        with instrumentation.phase('build'):
+            data = message.stream() if message.streamed else message.as_bytes()
+
+        batch_size = self.mail.mail_max_recipients
+        if batch_size and len(to_addrs) > batch_size:
+            return _send_batches(
+                lambda batch: self.send_raw(from_addr, batch, data,
+                                            message.mail_options, message.rcpt_options),
+                _batches(to_addrs, batch_size))
+
+        return self.send_raw(from_addr, to_addrs, data,
+                             message.mail_options,
+                             message.rcpt_options)
+
+    def send_raw(self, from_addr, to_addrs, data, mail_options=(), rcpt_options=()):
+        """Sends already rendered message data.
+
+        :param from_addr: sanitized address for the MAIL FROM command.
+        :param to_addrs: list of sanitized recipient addresses.
+        :param data: the message as bytes, a seekable binary file object or a MessageStream.
+        :param mail_options: ESMTP options for the MAIL FROM command.
+        :param rcpt_options: ESMTP options for the RCPT commands.
+        :returns: a dict of the recipients the server refused
+        """
+        if self.host is None and not self.mail.mail_suppress_send:
+            # an earlier reconnect failed, so try to open a new session
+            self.open()
 
+        refused = {}
         if self.host:
-            self.host.sendmail(sanitize_address(envelope_from or message.sender),
-                               list(sanitize_addresses(message.send_to)),
-                               message.as_bytes(),
-                               message.mail_options,
-                               message.rcpt_options)
+            to_addrs = list(to_addrs)
+            instrumentation = self.mail.instrumentation
+            throttle = self.mail.throttle_for(self.relay)
+            if throttle is not None:
+                with instrumentation.phase('throttle'):
+                    throttle.wait(len(to_addrs), _size(data))
+            try:
+                refused = self._sendmail(from_addr, to_addrs, data, mail_options, rcpt_options)
+            except Exception:
+                instrumentation.increment('failures')
+                raise
+            instrumentation.increment('messages')
+            instrumentation.increment('recipients', len(to_addrs) - len(refused))
+            if refused:
+                instrumentation.increment('refused', len(refused))
+            try:
+                instrumentation.increment('bytes', len(data))
+            except TypeError:
+                # the size of a streamed message is not always known
+                pass
 
             self.num_emails += 1
 
             if self.num_emails == self.mail.mail_max_emails:
                 self.num_emails = 0
                 if self.host:
-                    self.host.quit()
+                    instrumentation.increment('recycles')
+                    with instrumentation.phase('quit'):
+                        self.host.quit()
                     self.host = self.configure_host()
 
+        if self.mail.outboxes:
+            self.mail._record(from_addr, [each for each in to_addrs if each not in refused], data)
+        return refused
+
+    def _sendmail_once(self, *args):
+        data = args[2]
+        try:
+            return self._timed_sendmail(*args)
+        except smtplib.SMTPServerDisconnected:
+            # A kept-alive session may have been dropped by the server
+            # since its last use, so reconnect once and try again.
+            self.reconnect()
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            return self._timed_sendmail(*args)
+
+    def _timed_sendmail(self, *args):
+        instrumentation = self.mail.instrumentation
+        start = time.monotonic()
+        self._in_transaction = True
+        try:
+            with instrumentation.phase('sendmail'):
+                refused = smtp.sendmail(self.host, *args, instrumentation=instrumentation,
+                                        chunking=self.mail.mail_use_chunking)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # smtp.sendmail resets the transaction before raising a reply error
+            self._in_transaction = False
+            raise
+        self._in_transaction = False
+        if self.relay is not None:
+            self.mail.relays.success(self.relay, time.monotonic() - start)
+        return refused
+
+    def _sendmail(self, from_addr, to_addrs, data, mail_options, rcpt_options):
+        """Sends under the mail's retry policy.
+
+        Transient failures are retried after a backoff. When only some
+        recipients were refused with a 4xx reply, only those are retried, so
+        the recipients that already accepted the message do not get it twice.
+        """
+        policy = self.mail.retry_policy
+        refused = {}
+        delivered = False
+        attempt = 1
+        while True:
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            try:
+                if self.host is None:
+                    self.open()
+                failed = self._sendmail_once(from_addr, to_addrs, data,
+                                             mail_options, rcpt_options)
+                delivered = True
+            except OSError as e:
+                if policy.is_dropped(e):
+                    self._relay_failed()
+                    self.close()
+                if isinstance(e, smtplib.SMTPRecipientsRefused):
+                    failed = e.recipients
+                elif delivered and isinstance(e, smtplib.SMTPResponseException):
+                    failed = dict((addr, (e.smtp_code, e.smtp_error)) for addr in to_addrs)
+                elif attempt < policy.attempts and policy.is_transient(e):
+                    failed = None
+                else:
+                    raise
+
+            if failed is None:
+                retry = to_addrs
+            else:
+                retry, permanent = policy.split_refused(failed)
+                refused.update(permanent)
+                if not retry or attempt >= policy.attempts:
+                    refused.update((addr, failed[addr]) for addr in retry)
+                    if delivered:
+                        return refused
+                    raise smtplib.SMTPRecipientsRefused(refused)
+
+            to_addrs = retry
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+
     def send_message(self, *args, **kwargs):
         """Shortcut for send(msg).
 
@@ -412,6 +1311,41 @@ class Connection:
         self.send(Message(*args, **kwargs))
 
 
+def _failed_result(message, error):
+    """The SendResult of a message whose send raised error."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        code = next(iter(error.recipients.values()))[0] if error.recipients else None
+        return SendResult(message, refused=error.recipients, code=code, error=error)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return SendResult(message, code=error.smtp_code, error=error)
+    return SendResult(message, error=error)
+
+
+def _sent_result(message, refused):
+    """The SendResult of a message the server accepted, but for the refused recipients."""
+    accepted = [each for each in message.envelope_recipients() if each not in refused]
+    return SendResult(message, accepted=accepted, refused=refused, code=250)
+
+
+def _send_result(connection, message):
+    """Sends a message on a connection, capturing the outcome as a SendResult."""
+    try:
+        refused = connection.send(message)
+    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException,
+            BadHeaderError, AssertionError) as e:
+        return _failed_result(message, e)
+    except OSError as e:
+        # the session is in an unknown state; the next send reopens it
+        connection.close()
+        return _failed_result(message, e)
+    except Exception as e:
+        # such as an attachment that could not be read part-way through
+        # DATA, leaving the session mid-transaction; the next send reopens it
+        connection._abort()
+        return _failed_result(message, e)
+    return _sent_result(message, refused)
+
+
 class Mail:
     """Manages email messaging"""
 
@@ -423,31 +1357,255 @@ class Mail:
         mail_options: A components setting dictionary
         """
 
+        self.options = mail_options
         self.mail_server = mail_options.get('MAIL_SERVER', 'localhost')
         self.mail_user = mail_options.get('MAIL_USERNAME')
         self.mail_password = mail_options.get('MAIL_PASSWORD')
         self.mail_port = mail_options.get('MAIL_PORT', 25)
         self.mail_use_tls = mail_options.get('MAIL_USE_TLS', False)
         self.mail_use_ssl = mail_options.get('MAIL_USE_SSL', False)
+        # None leaves smtplib's default, which does not verify the certificate
+        self.mail_ssl_context = mail_options.get('MAIL_SSL_CONTEXT')
+        self.mail_use_chunking = mail_options.get('MAIL_USE_CHUNKING', True)
         self.mail_default_sender = mail_options.get('MAIL_DEFAULT_SENDER')
+        self.mail_msgid_domain = mail_options.get('MAIL_MSGID_DOMAIN')
+        self.make_msgid = None
+        if self.mail_msgid_domain:
+            self.make_msgid = MessageIdGenerator(self.mail_msgid_domain)
+        self.dkim = None
+        if mail_options.get('MAIL_DKIM_KEY'):
+            from .dkim import DKIMSigner, DEFAULT_HEADERS as DKIM_HEADERS
+
+            self.dkim = DKIMSigner(mail_options['MAIL_DKIM_DOMAIN'],
+                                   mail_options['MAIL_DKIM_SELECTOR'],
+                                   mail_options['MAIL_DKIM_KEY'],
+                                   mail_options.get('MAIL_DKIM_HEADERS', DKIM_HEADERS))
         self.mail_debug = mail_options.get('MAIL_DEBUG', False)
         self.mail_max_emails = mail_options.get('MAIL_MAX_EMAILS')
         self.mail_suppress_send = mail_options.get('MAIL_SUPPRESS_SEND', False)
+        self.outboxes = []
+        self.outbox = None
+        if mail_options.get('MAIL_OUTBOX_SIZE') or mail_options.get('MAIL_OUTBOX_BYTES'):
+            self.outbox = Outbox(mail_options.get('MAIL_OUTBOX_SIZE'),
+                                 mail_options.get('MAIL_OUTBOX_BYTES'))
+            self.outboxes.append(self.outbox)
         self.mail_ascii_attachments = mail_options.get('MAIL_ASCII_ATTACHMENTS', False)
+        self.mail_pool_size = mail_options.get('MAIL_POOL_SIZE')
+        self.mail_pool_idle_timeout = mail_options.get('MAIL_POOL_IDLE_TIMEOUT')
+        self.mail_async_queue = mail_options.get('MAIL_ASYNC_QUEUE', False)
+        self.mail_workers = mail_options.get('MAIL_WORKERS', 1)
+        self.mail_queue_size = mail_options.get('MAIL_QUEUE_SIZE', 1000)
+        self.mail_queue_timeout = mail_options.get('MAIL_QUEUE_TIMEOUT')
+        self.instrumentation = mail_options.get('MAIL_INSTRUMENTATION') or Instrumentation()
+        self.mail_max_recipients = mail_options.get('MAIL_MAX_RECIPIENTS')
+
+        self.throttle = mail_options.get('MAIL_THROTTLE')
+        self.throttle_options = dict(
+            messages=mail_options.get('MAIL_THROTTLE_MESSAGES'),
+            recipients=mail_options.get('MAIL_THROTTLE_RECIPIENTS'),
+            bytes=mail_options.get('MAIL_THROTTLE_BYTES'),
+            interval=mail_options.get('MAIL_THROTTLE_INTERVAL', 1.0),
+            burst=mail_options.get('MAIL_THROTTLE_BURST', 1))
+        self._throttles = {}
+        self._throttles_lock = threading.Lock()
+
+        self.mail_servers = mail_options.get('MAIL_SERVERS')
+        self.relays = None
+        if self.mail_servers:
+            self.relays = RelaySelector.from_config(
+                self.mail_servers,
+                default_port=self.mail_port,
+                failure_threshold=mail_options.get('MAIL_HOST_FAILURE_THRESHOLD', 3),
+                reset_timeout=mail_options.get('MAIL_HOST_RESET_TIMEOUT', 30),
+                slow_threshold=mail_options.get('MAIL_HOST_SLOW_THRESHOLD'))
+        self.mail_batch_concurrency = mail_options.get('MAIL_BATCH_CONCURRENCY', 4)
+
+        pool_size = self.mail_pool_size
+        if self.mail_async_queue and not pool_size:
+            pool_size = self.mail_workers
+
+        self.pool = None
+        if pool_size:
+            self.pool = ConnectionPool(self.connect,
+                                       size=pool_size,
+                                       idle_timeout=self.mail_pool_idle_timeout)
+
+        self.queue = None
+        if self.mail_async_queue:
+            self.queue = SendQueue(self._deliver,
+                                   workers=self.mail_workers,
+                                   maxsize=self.mail_queue_size,
+                                   timeout=self.mail_queue_timeout)
+
+        self.retry_policy = mail_options.get('MAIL_RETRY_POLICY') or RetryPolicy(
+            attempts=mail_options.get('MAIL_RETRY_ATTEMPTS', 1),
+            backoff=mail_options.get('MAIL_RETRY_BACKOFF', 1),
+            max_backoff=mail_options.get('MAIL_RETRY_MAX_BACKOFF', 60),
+            jitter=mail_options.get('MAIL_RETRY_JITTER', 0.5))
+
+        self.mail_spool_path = mail_options.get('MAIL_SPOOL_PATH')
+        self.mail_spool_fsync_batch = mail_options.get('MAIL_SPOOL_FSYNC_BATCH', 1)
+        self.mail_spool_interval = mail_options.get('MAIL_SPOOL_INTERVAL', 5)
+        self.mail_spool_max_attempts = mail_options.get('MAIL_SPOOL_MAX_ATTEMPTS', 10)
+        self.mail_spool_replay = mail_options.get('MAIL_SPOOL_REPLAY', True)
+
+        self.spool = None
+        self.spool_worker = None
+        if self.mail_spool_path:
+            self.spool = Spool(self.mail_spool_path, fsync_batch=self.mail_spool_fsync_batch)
+            spool_policy = RetryPolicy(attempts=self.mail_spool_max_attempts,
+                                       backoff=self.retry_policy.backoff,
+                                       max_backoff=300,
+                                       jitter=self.retry_policy.jitter)
+            self.spool_worker = SpoolWorker(self.spool, self._deliver_spooled,
+                                            interval=self.mail_spool_interval,
+                                            policy=spool_policy)
+            if self.mail_spool_replay:
+                self.spool_worker.start()
 
     def send(self, message):
         """
         Sends a single message instance. If TESTING is True the message will
         not actually be sent.
 
+        With **MAIL_SPOOL_PATH** the message is verified and written to the
+        spool, to be delivered by the spool worker. Otherwise with
+        **MAIL_ASYNC_QUEUE** it is verified and queued for a background
+        worker, and a Future resolved once it has been sent is returned.
+
+        With **MAIL_MAX_RECIPIENTS** a message with more recipients is sent
+        as several envelopes, up to **MAIL_BATCH_CONCURRENCY** at once over
+        pooled connections, with the message rendered only once.
+
         :param message: a Message instance.
         """
         if message.sender is None:
             message.sender = self.mail_default_sender
 
+        if self.spool is not None:
+            self._spool(message)
+            return
+
+        if self.queue is not None:
+            _prepare_message(message, self)
+            return self.queue.put(message)
+
+        self._deliver(message)
+
+    def _deliver(self, message):
+        batch_size = self.mail_max_recipients
+        if (batch_size and self.mail_batch_concurrency > 1 and not message.streamed
+                and len(message.send_to) > batch_size):
+            return self._deliver_batches(message)
+
+        if self.pool is not None:
+            with self.pool.connection() as connection:
+                message.send(connection)
+            return
+
         with self.connect() as connection:
             message.send(connection)
 
+    def _deliver_batches(self, message):
+        """Sends the envelope batches of a message in parallel over pooled connections.
+
+        The message is rendered once and shared by every batch.
+        """
+        _prepare_message(message, self)
+        if self.mail_suppress_send and not self.outboxes:
+            return
+
+        instrumentation = self.instrumentation
+        with instrumentation.phase('sanitize'):
+            from_addr = sanitize_address(message.sender)
+            batches = _batches(message.envelope_recipients(), self.mail_max_recipients)
+        with instrumentation.phase('build'):
+            data = message.as_bytes()
+
+        concurrency = min(self.mail_batch_concurrency, len(batches))
+        pool = self.pool
+        if pool is None:
+            pool = ConnectionPool(self.connect, size=concurrency)
+
+        def send_batch(batch):
+            with pool.connection() as connection:
+                return connection.send_raw(from_addr, batch, data,
+                                           message.mail_options, message.rcpt_options)
+
+        try:
+            with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                _send_batches(send_batch, batches, map=executor.map)
+        finally:
+            if pool is not self.pool:
+                pool.close()
+
+    @contextmanager
+    def record_messages(self, max_messages=100, max_bytes=None):
+        """Records the messages sent within a with block in an Outbox::
+
+            with mail.record_messages() as outbox:
+                mail.send_message(subject='testing', recipients=['you@example.com'])
+                assert outbox[0].subject == 'testing'
+
+        With **MAIL_SUPPRESS_SEND** messages are still rendered and recorded,
+        just not sent. Only the latest `max_messages` messages, holding at
+        most `max_bytes` bytes, are kept.
+        """
+        outbox = Outbox(max_messages, max_bytes)
+        self.outboxes.append(outbox)
+        try:
+            yield outbox
+        finally:
+            self.outboxes.remove(outbox)
+
+    def _record(self, from_addr, to_addrs, data):
+        for outbox in list(self.outboxes):
+            outbox.record(from_addr, to_addrs, data)
+
+    def throttle_for(self, relay=None):
+        """Returns the Throttle for sends through a relay, or None if sending is unthrottled.
+
+        A MAIL_THROTTLE instance is shared by every relay. Limits set with the
+        MAIL_THROTTLE_* options apply to each relay separately.
+        """
+        if self.throttle is not None:
+            return self.throttle
+        key = id(relay)
+        throttle = self._throttles.get(key)
+        if throttle is None:
+            with self._throttles_lock:
+                throttle = self._throttles.setdefault(key, Throttle(**self.throttle_options))
+        return throttle or None
+
+    def _spool(self, message):
+        _prepare_message(message, self)
+        self.spool.put(sanitize_address(message.sender),
+                       message.envelope_recipients(),
+                       message.stream() if message.streamed else message.as_bytes(),
+                       message.mail_options,
+                       message.rcpt_options)
+        self.spool_worker.wake()
+
+    def _deliver_spooled(self, entry, body):
+        if self.pool is not None:
+            with self.pool.connection() as connection:
+                return self._send_spooled(connection, entry, body)
+
+        # the spool worker is a thread, so it sends with a blocking
+        # Connection even for an AsyncMail, whose connect() is async
+        with Connection(self) as connection:
+            return self._send_spooled(connection, entry, body)
+
+    def _send_spooled(self, connection, entry, body):
+        def send_batch(batch):
+            return connection.send_raw(entry.from_addr, batch, body,
+                                       entry.mail_options, entry.rcpt_options)
+
+        batch_size = self.mail_max_recipients
+        if batch_size and len(entry.to_addrs) > batch_size:
+            return _send_batches(send_batch, _batches(entry.to_addrs, batch_size))
+        return send_batch(entry.to_addrs)
+
     def send_message(self, *args, **kwargs):
         """Shortcut for send(msg).
 
@@ -456,16 +1614,107 @@ class Mail:
 
         self.send(Message(*args, **kwargs))
 
+    def send_many(self, messages, concurrency=1, executor='thread', chunk_size=100):
+        """
+        Sends many messages, spreading them over up to `concurrency` pooled
+        connections. Each connection sends its share in one session, with the
+        envelope pipelined when the server supports it.
+
+        With executor='process' the messages are instead rendered and sent
+        by `concurrency` worker processes, each with its own connection, so
+        MIME building and encoding use as many cores. The messages are
+        passed to the workers `chunk_size` at a time as they are read from
+        `messages`, and their attachments must be bytes or file paths. The
+        MAIL_THROTTLE_* limits are divided between the workers. A
+        MAIL_THROTTLE instance and MAIL_INSTRUMENTATION are not used by the
+        workers, and messages are sent directly even with MAIL_ASYNC_QUEUE or
+        MAIL_SPOOL_PATH.
+
+        Failures do not stop the batch; a SendResult is returned for every
+        message, in order.
+
+        :param messages: an iterable of Message instances.
+        :param concurrency: the number of connections to send on at once.
+        :param executor: 'thread' or 'process'.
+        :param chunk_size: messages handed to a worker process at a time.
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1, not %r' % (concurrency,))
+        if executor == 'process':
+            from .processes import send_in_processes
+            return send_in_processes(self, messages, concurrency, chunk_size)
+        if executor != 'thread':
+            raise ValueError("executor must be 'thread' or 'process', not %r" % (executor,))
+
+        messages = list(messages)
+        for message in messages:
+            if message.sender is None:
+                message.sender = self.mail_default_sender
+
+        pool = self.pool
+        if pool is None:
+            pool = ConnectionPool(self.connect, size=concurrency)
+
+        def send_batch(batch):
+            try:
+                with pool.connection() as connection:
+                    return [_send_result(connection, message) for message in batch]
+            except Exception as e:
+                return [SendResult(message, error=e) for message in batch]
+
+        batches = [messages[i::concurrency] for i in range(concurrency)]
+        batches = [batch for batch in batches if batch]
+        results = [None] * len(messages)
+        try:
+            with futures.ThreadPoolExecutor(max_workers=len(batches) or 1) as executor:
+                for i, batch_results in enumerate(executor.map(send_batch, batches)):
+                    results[i::concurrency] = batch_results
+        finally:
+            if pool is not self.pool:
+                pool.close()
+        return results
+
     def connect(self):
         """Opens a connection to the mail host."""
         return Connection(self)
 
+    def flush(self, timeout=None):
+        """Waits for queued messages to be sent.
 
-class MailComponent(Component):
-    """A component that injects an instance of `Mail` for sending emails"""
+        :param timeout: the most seconds to wait, None to wait indefinitely.
+        :returns: False if messages were still queued when the timeout expired.
+        """
+        flushed = True
+        if self.queue is not None:
+            flushed = self.queue.flush(timeout)
+        if self.spool_worker is not None and flushed:
+            flushed = self.spool_worker.flush(timeout)
+        return flushed
+
+    def close(self, timeout=None):
+        """Sends any queued messages, then closes pooled connections.
 
-    def __init__(self, **mail_options) -> None:
-        self.mail = Mail(**mail_options)
+        Spooled messages are not waited for; they stay on disk and are sent
+        once the spool is next opened.
 
-    def resolve(self) -> Mail:
-        return self.mail
+        :param timeout: the most seconds to wait for the queue to drain.
+        :returns: False if messages were still queued when the timeout expired.
+        """
+        flushed = True
+        if self.queue is not None:
+            flushed = self.queue.close(timeout)
+        if self.spool_worker is not None:
+            self.spool_worker.stop()
+            self.spool.close()
+        if self.pool is not None and flushed:
+            self.pool.close()
+        return flushed
+
+
+def __getattr__(name):
+    # MailComponent lives in its own module so that apistar is only
+    # imported by applications that use the component
+    if name == 'MailComponent':
+        from .component import MailComponent
+        return MailComponent
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,181 @@
+"""Instrumentation of the send pipeline.
+
+Sending is split into timed phases:
+
+* ``sanitize``: formatting the envelope addresses
+* ``build``: rendering the MIME message
+* ``connect``: opening the socket and reading the greeting (and the SSL handshake)
+* ``starttls``: upgrading the session with STARTTLS
+* ``login``: authenticating
+* ``sendmail``: the whole SMTP transaction for one message, including
+  ``envelope`` (MAIL FROM and RCPT TO, a single round-trip with PIPELINING)
+  and ``data`` (the DATA command and the message) when apistar-mail drives
+  the commands itself
+* ``throttle``: waiting for the rate limits, when a throttle is configured
+* ``quit``: closing the session
+
+and counters: ``messages``, ``bytes``, ``recipients``, ``refused``,
+``failures``, ``reconnects`` and ``recycles`` (sessions replaced after
+MAIL_MAX_EMAILS messages).
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Instrumentation:
+    """Times the phases of sending mail and counts what was sent.
+
+    Signal callbacks are connected with `connect`: ``before`` callbacks are
+    called with the phase name as it starts, and ``after`` callbacks with the
+    phase name, its duration in seconds and the exception it raised, or None.
+    Timings and counts are passed on to collectors, which are any objects
+    with ``observe(phase, seconds)`` and ``increment(counter, value)``
+    methods, such as InMemoryCollector. Without callbacks or collectors
+    nothing is timed.
+
+    :param collectors: the collectors to report to
+    """
+
+    SIGNALS = ('before', 'after')
+
+    def __init__(self, collectors=None):
+        self.collectors = list(collectors or [])
+        self.callbacks = dict((signal, []) for signal in self.SIGNALS)
+
+    @property
+    def enabled(self):
+        return bool(self.collectors or self.callbacks['before'] or self.callbacks['after'])
+
+    def connect(self, signal, callback):
+        """Registers a callback for the ``before`` or ``after`` signal."""
+        if signal not in self.callbacks:
+            raise ValueError('Unknown signal %r, expected one of %s' % (signal, self.SIGNALS))
+        self.callbacks[signal].append(callback)
+
+    def disconnect(self, signal, callback):
+        self.callbacks[signal].remove(callback)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block as the named phase."""
+        if not self.enabled:
+            yield
+            return
+
+        for callback in self.callbacks['before']:
+            callback(name)
+        error = None
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            for collector in self.collectors:
+                collector.observe(name, duration)
+            for callback in self.callbacks['after']:
+                callback(name, duration, error)
+
+    def increment(self, counter, value=1):
+        for collector in self.collectors:
+            collector.increment(counter, value)
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, as Prometheus does.
+
+    :param buckets: ascending upper bounds, the last of which should be infinity
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    @property
+    def buckets(self):
+        """A list of (upper bound, cumulative count) pairs."""
+        total, buckets = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class InMemoryCollector:
+    """Keeps a histogram per phase and a total per counter in memory.
+
+    :param buckets: the histogram bucket bounds
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bucket_bounds = buckets
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram(self.bucket_bounds)
+            histogram.observe(seconds)
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(float(bound))
+
+
+def format_prometheus(collector, namespace='apistar_mail'):
+    """Renders an InMemoryCollector in the Prometheus text exposition format."""
+    with collector._lock:
+        histograms = sorted(collector.histograms.items())
+        counters = sorted(collector.counters.items())
+
+    lines = []
+    if histograms:
+        name = '%s_phase_seconds' % namespace
+        lines.append('# HELP %s Time spent in each phase of sending mail.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        for phase, histogram in histograms:
+            for bound, count in histogram.buckets:
+                lines.append('%s_bucket{phase="%s",le="%s"} %d'
+                             % (name, phase, _format_bound(bound), count))
+            lines.append('%s_sum{phase="%s"} %r' % (name, phase, histogram.sum))
+            lines.append('%s_count{phase="%s"} %d' % (name, phase, histogram.count))
+    for counter, value in counters:
+        name = '%s_%s_total' % (namespace, counter)
+        lines.append('# TYPE %s counter' % name)
+        lines.append('%s %r' % (name, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,47 @@
+import itertools
+import os
+import threading
+
+
+class MessageIdGenerator:
+    """Creates unique Message-ID header values without a DNS lookup per message.
+
+    email.utils.make_msgid looks up the host's fully qualified name for every
+    ID. The generator resolves the domain once, on first use, and builds IDs
+    from the process id, a random token and a counter. The token and the
+    counter are renewed in a forked child, so workers forked from one parent
+    never hand out the same ID.
+
+    :param domain: the domain after the @, by default the host's fully
+        qualified domain name
+    """
+
+    def __init__(self, domain=None):
+        self._domain = domain
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def domain(self):
+        if self._domain is None:
+            import socket
+
+            self._domain = socket.getfqdn()
+        return self._domain
+
+    def _reset(self, pid):
+        self._token = os.urandom(8).hex()
+        self._counter = itertools.count()
+        self._pid = pid
+
+    def __call__(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            with self._lock:
+                if pid != self._pid:
+                    self._reset(pid)
+        return '<%d.%s.%d@%s>' % (pid, self._token, next(self._counter), self.domain)
+
+
+#: the generator used for messages not sent through a Mail with MAIL_MSGID_DOMAIN
+make_msgid = MessageIdGenerator()
@@ -0,0 +1,117 @@
+import collections
+import threading
+
+
+class RecordedMessage:
+    """A message as it was, or would have been, handed to the relay.
+
+    :param sender: the sanitized envelope sender
+    :param recipients: the sanitized envelope recipients it was sent to
+    :param data: the rendered message bytes, or the MessageStream of a
+        message with streamed attachments
+
+    A stream is only kept when its attachments can be read again, from a
+    path or a seekable file, and so have a known size. Attachments streamed
+    from an iterator or an unseekable file are consumed by sending, so only
+    the envelope of such a message is recorded, with a `size` of 0.
+    """
+
+    __slots__ = ('sender', 'recipients', '_data', 'size', '_parsed')
+
+    def __init__(self, sender, recipients, data):
+        self.sender = sender
+        self.recipients = recipients
+        self._parsed = None
+        try:
+            self.size = len(data)
+        except TypeError:
+            # streamed from an iterator, which can't be read again
+            data, self.size = None, 0
+        self._data = data
+
+    @property
+    def data(self):
+        """The message bytes. A stream is rendered the first time they are read."""
+        if self._data is None:
+            raise ValueError('the message was streamed from an iterator or unseekable '
+                             'file, so only its envelope was recorded')
+        if not isinstance(self._data, bytes):
+            self._data = b''.join(self._data)
+        return self._data
+
+    @property
+    def message(self):
+        """The message parsed into an email.message.EmailMessage, for inspection."""
+        if self._parsed is None:
+            from email import message_from_bytes, policy
+            self._parsed = message_from_bytes(self.data, policy=policy.default)
+        return self._parsed
+
+    @property
+    def subject(self):
+        return self.message['Subject']
+
+    def __repr__(self):
+        return '<RecordedMessage from=%s to=%d size=%d>' % (
+            self.sender, len(self.recipients), self.size)
+
+
+class Outbox:
+    """A ring buffer of the most recently sent messages.
+
+    The oldest messages are dropped to stay within `max_messages` and
+    `max_bytes`, so it can be left recording under production-like load.
+    Messages share the bytes the message itself caches, so recording adds
+    no copy of them. `recorded` and `recorded_bytes` count everything
+    recorded, including the messages since dropped.
+
+    :param max_messages: the most messages kept, None for no limit
+    :param max_bytes: the most message bytes kept, None for no limit. A
+        single message larger than this is counted but not kept.
+    """
+
+    def __init__(self, max_messages=100, max_bytes=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.recorded = 0
+        self.recorded_bytes = 0
+        self.dropped = 0
+        self._messages = collections.deque()
+        self._lock = threading.Lock()
+
+    def record(self, sender, recipients, data):
+        """Adds a message, dropping the oldest ones past the limits."""
+        entry = RecordedMessage(sender, list(recipients), data)
+        with self._lock:
+            self.recorded += 1
+            self.recorded_bytes += entry.size
+            if self.max_bytes is not None and entry.size > self.max_bytes:
+                self.dropped += 1
+                return
+            self._messages.append(entry)
+            self.bytes += entry.size
+            while (self.max_messages is not None and len(self._messages) > self.max_messages
+                   or self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= self._messages.popleft().size
+                self.dropped += 1
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            self.bytes = 0
+
+    @property
+    def messages(self):
+        """The kept messages, oldest first."""
+        with self._lock:
+            return list(self._messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
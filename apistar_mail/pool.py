@@ -0,0 +1,118 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+from ._lazy import LazyModule
+
+smtplib = LazyModule('smtplib')
+
+
+class ConnectionPool:
+    """Keeps authenticated connections open and lends them to threads.
+
+    :param factory: callable returning a new, unopened Connection
+    :param size: maximum number of connections open at once
+    :param idle_timeout: seconds an idle connection is kept before being closed
+    """
+
+    def __init__(self, factory, size=10, idle_timeout=None):
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _expired(self, now):
+        """Removes and returns idle connections past the idle timeout."""
+        if self.idle_timeout is None:
+            return []
+        expired = [conn for conn, last_used in self._idle
+                   if now - last_used >= self.idle_timeout]
+        if expired:
+            self._idle = [(conn, last_used) for conn, last_used in self._idle
+                          if now - last_used < self.idle_timeout]
+            self._created -= len(expired)
+        return expired
+
+    def acquire(self):
+        """Checks out a healthy connection, blocking while the pool is exhausted."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+                expired = self._expired(time.monotonic())
+                if self._idle:
+                    conn, _ = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn = None
+                    break
+                self._cond.wait()
+
+        for stale in expired:
+            stale.close()
+
+        try:
+            if conn is None:
+                conn = self.factory().open()
+            elif not conn.is_alive():
+                conn.reconnect()
+        except Exception:
+            self._discard()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool, or closes it if discard is True."""
+        with self._cond:
+            if not (discard or self._closed):
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        conn.close()
+        self._discard()
+
+    def _discard(self):
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Lends a connection for the duration of a with block.
+
+        Connections whose session broke mid-command are discarded rather
+        than reused; SMTP replies such as a refused recipient leave the
+        session usable. A send interrupted part-way through a transaction,
+        by any error including KeyboardInterrupt, leaves replies unread, so
+        its session is dropped without QUIT.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            self.release(conn)
+            raise
+        except BaseException as e:
+            if conn._in_transaction:
+                conn._abort()
+                self.release(conn, discard=True)
+            else:
+                self.release(conn, discard=isinstance(e, OSError))
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Closes all idle connections and refuses further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
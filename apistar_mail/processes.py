@@ -0,0 +1,165 @@
+"""Sending with worker processes, for `Mail.send_many(executor='process')`.
+
+Rendering MIME and base64 encoding attachments hold the GIL, so threads
+render one message at a time however many cores there are. Here each
+worker process builds and renders its messages itself and sends them on
+its own pooled connection. The parent only sends lightweight message specs
+and gets back the outcome of each message.
+"""
+
+import collections
+import time
+
+from concurrent import futures
+from multiprocessing.util import Finalize
+
+from .mail import Attachment, Mail, Message, SendResult, _send_result
+
+# options that can't be shared with, or make no sense in, a worker process
+WORKER_EXCLUDED_OPTIONS = ('MAIL_ASYNC_QUEUE', 'MAIL_SPOOL_PATH', 'MAIL_INSTRUMENTATION',
+                           'MAIL_THROTTLE')
+# rate limits, divided between the workers
+WORKER_DIVIDED_OPTIONS = ('MAIL_THROTTLE_MESSAGES', 'MAIL_THROTTLE_RECIPIENTS',
+                          'MAIL_THROTTLE_BYTES')
+
+# the Mail of this worker process, see _init_worker
+_mail = None
+
+
+def worker_options(options, workers):
+    """The mail options for each of `workers` worker processes."""
+    options = dict((key, value) for key, value in options.items()
+                   if key not in WORKER_EXCLUDED_OPTIONS)
+    for key in WORKER_DIVIDED_OPTIONS:
+        if options.get(key):
+            options[key] = options[key] / workers
+    options['MAIL_POOL_SIZE'] = 1
+    return options
+
+
+def message_spec(message, make_msgid=None):
+    """Returns a picklable dict from which the worker rebuilds the message.
+
+    The Date and Message-ID are fixed here, so the parent's message carries
+    the values that were sent. Attachments created with
+    `Attachment.from_path` are passed by path and mapped again in the worker.
+
+    :param make_msgid: the Mail's Message-ID generator, if it has one, used
+        as _prepare_message would
+    """
+    if message.date is None:
+        message.date = time.time()
+    if message._msg_id is None and make_msgid is not None:
+        message.msgId = make_msgid()
+    attachments = []
+    for attachment in message._attachments or ():
+        path = attachment._source[0] if attachment._source is not None else None
+        attachments.append((attachment.filename, attachment.content_type,
+                            None if path else attachment.data,
+                            attachment.disposition, attachment.headers, path,
+                            attachment._cache))
+    return {
+        'subject': message.subject,
+        'recipients': message.recipients,
+        'body': message.body,
+        'alts': message._alts,
+        'sender': message.sender,
+        'cc': message._cc,
+        'bcc': message._bcc,
+        'attachments': attachments,
+        'reply_to': message.reply_to,
+        'date': message.date,
+        'msgId': message.msgId,
+        'charset': message.charset,
+        'extra_headers': message.extra_headers,
+        'mail_options': message._mail_options,
+        'rcpt_options': message._rcpt_options,
+        'ascii_attachments': message.ascii_attachments,
+    }
+
+
+def message_from_spec(spec):
+    """Rebuilds a message from the dict made by `message_spec`."""
+    spec = dict(spec)
+    msg_id = spec.pop('msgId')
+    attachments = []
+    for filename, content_type, data, disposition, headers, path, cache in spec.pop(
+            'attachments'):
+        if path is not None:
+            attachments.append(Attachment.from_path(path, content_type, filename,
+                                                    disposition, headers, cache=cache))
+        else:
+            attachments.append(Attachment(filename, content_type, data, disposition, headers))
+    message = Message(attachments=attachments, **spec)
+    message.msgId = msg_id
+    return message
+
+
+def _init_worker(options):
+    global _mail
+    _mail = Mail(**options)
+    # say QUIT to the relay when the worker exits
+    Finalize(_mail, _mail.close, exitpriority=10)
+
+
+def _send_spec(connection, spec):
+    try:
+        message = message_from_spec(spec)
+    except Exception as e:
+        # such as an attachment file that can no longer be opened
+        return SendResult(None, error=e)
+    return _send_result(connection, message)
+
+
+def _send_specs(specs):
+    """Sends messages in a worker, returning (accepted, refused, code, error) tuples."""
+    try:
+        with _mail.pool.connection() as connection:
+            results = [_send_spec(connection, spec) for spec in specs]
+    except Exception as e:
+        results = [SendResult(None, error=e)] * len(specs)
+    return [(result.accepted, result.refused, result.code, result.error) for result in results]
+
+
+def send_in_processes(mail, messages, workers, chunk_size):
+    """Sends messages with `workers` worker processes and returns their SendResults.
+
+    Messages are handed out `chunk_size` at a time, and at most two chunks
+    per worker are in flight, so an iterator of messages is consumed as the
+    workers get through it.
+    """
+    options = worker_options(mail.options, workers)
+    results = []
+    pending = collections.deque()
+
+    def collect():
+        chunk, future = pending.popleft()
+        try:
+            outcomes = future.result()
+        except Exception as e:
+            # the chunk could not be pickled, or the worker died
+            outcomes = [([], {}, None, e)] * len(chunk)
+        for message, (accepted, refused, code, error) in zip(chunk, outcomes):
+            results.append(SendResult(message, accepted, refused, code, error))
+
+    with futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(options,)) as executor:
+        def submit(chunk):
+            specs = [message_spec(message, mail.make_msgid) for message in chunk]
+            return executor.submit(_send_specs, specs)
+
+        chunk = []
+        for message in messages:
+            if message.sender is None:
+                message.sender = mail.mail_default_sender
+            chunk.append(message)
+            if len(chunk) == chunk_size:
+                pending.append((chunk, submit(chunk)))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    collect()
+        if chunk:
+            pending.append((chunk, submit(chunk)))
+        while pending:
+            collect()
+    return results
@@ -0,0 +1,66 @@
+import random
+
+from ._lazy import LazyModule
+
+smtplib = LazyModule('smtplib')
+
+
+class RetryPolicy:
+    """Decides which SMTP failures are retried and how long to wait between tries.
+
+    4xx replies, dropped sessions and socket errors are transient; 5xx
+    replies are permanent. Waits grow exponentially from `backoff` up to
+    `max_backoff`, with up to `jitter` of each wait taken off at random so
+    that many senders retrying at once spread out.
+
+    :param attempts: the most times a message is tried, including the first
+    :param backoff: seconds before the first retry, doubled for each later one
+    :param max_backoff: the longest wait between tries
+    :param jitter: the fraction of each wait that is randomised, from 0 to 1
+    """
+
+    def __init__(self, attempts=1, backoff=1, max_backoff=60, jitter=0.5):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    @staticmethod
+    def is_transient_code(code):
+        return 400 <= code < 500
+
+    def is_transient(self, exc):
+        """True when the failure is worth trying again."""
+        if isinstance(exc, smtplib.SMTPResponseException):
+            return self.is_transient_code(exc.smtp_code)
+        if isinstance(exc, smtplib.SMTPRecipientsRefused):
+            return any(self.is_transient_code(code) for code, _ in exc.recipients.values())
+        if isinstance(exc, smtplib.SMTPServerDisconnected):
+            return True
+        return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+    def is_dropped(self, exc):
+        """True when the failure left the session unusable, so it must be reopened."""
+        if isinstance(exc, smtplib.SMTPServerDisconnected):
+            return True
+        if isinstance(exc, smtplib.SMTPResponseException):
+            return exc.smtp_code == 421
+        return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+    def split_refused(self, refused):
+        """Splits sendmail's refused recipients into those worth retrying and the rest.
+
+        :returns: a list of recipients to retry and a dict of permanent refusals.
+        """
+        retry, permanent = [], {}
+        for addr, (code, resp) in refused.items():
+            if self.is_transient_code(code):
+                retry.append(addr)
+            else:
+                permanent[addr] = (code, resp)
+        return retry, permanent
+
+    def delay(self, attempt):
+        """Seconds to wait before try number `attempt + 1`."""
+        wait = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return wait * (1 - self.jitter * random.random())
@@ -0,0 +1,104 @@
+import atexit
+import queue
+import threading
+
+from ._lazy import LazyModule
+
+futures = LazyModule('concurrent.futures')
+
+
+class SendQueue:
+    """Delivers messages in the background on a bounded pool of worker threads.
+
+    Workers are started on the first put. Putting blocks while the queue is
+    full, so a burst of sends slows the caller down rather than growing
+    without bound.
+
+    :param send: callable that delivers a single message
+    :param workers: number of worker threads
+    :param maxsize: the most messages waiting at once, 0 for no limit
+    :param timeout: seconds put waits for room before raising queue.Full,
+        None to wait indefinitely
+    """
+
+    def __init__(self, send, workers=1, maxsize=0, timeout=None):
+        self.send = send
+        self.workers = workers
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name='apistar-mail-%d' % i, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def put(self, message):
+        """Queues a message and returns a Future resolved once it is sent."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Send queue is closed')
+            self._start()
+            self._pending += 1
+
+        future = futures.Future()
+        try:
+            self._queue.put((message, future), timeout=self.timeout)
+        except queue.Full:
+            self._done()
+            raise
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            message, future = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.send(message))
+                except BaseException as e:
+                    future.set_exception(e)
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until every queued message has been handled.
+
+        :returns: False if the timeout expired first.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """Refuses new messages, flushes the queue and stops the workers.
+
+        :returns: False if the queue could not be flushed within the timeout,
+            in which case the workers are left to finish in the background.
+        """
+        with self._lock:
+            self._closed = True
+        if not self.flush(timeout):
+            return False
+
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        atexit.unregister(self.close)
+        return True
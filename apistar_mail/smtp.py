@@ -0,0 +1,267 @@
+"""Protocol helpers shared by the SMTP transports."""
+
+import re
+
+from contextlib import nullcontext
+
+from ._lazy import LazyModule
+
+smtplib = LazyModule('smtplib')
+
+CRLF = b'\r\n'
+
+PERIODS = re.compile(br'(?m)^\.')
+
+CHUNK_SIZE = 65536
+# BDAT chunks sent ahead of their replies when the server supports PIPELINING
+BDAT_WINDOW = 32
+
+
+def quote_data(data):
+    """Dot-stuffs a message and appends the end-of-data marker, as smtplib does."""
+    q = PERIODS.sub(b'..', data)
+    if q[-2:] != CRLF:
+        q = q + CRLF
+    return q + b'.' + CRLF
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """Yields a message a chunk at a time.
+
+    The message may be bytes, which are sliced without copying, a binary
+    file, which is read chunk_size bytes at a time, or an iterable of bytes
+    chunks, which are passed through.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    elif hasattr(data, 'read'):
+        yield from iter(lambda: data.read(chunk_size), b'')
+    else:
+        yield from data
+
+
+def iter_quoted(data, chunk_size=CHUNK_SIZE):
+    """Yields the dot-stuffed contents of a message, ending with the end-of-data marker.
+
+    The message may be bytes, a binary file or an iterable of bytes chunks,
+    see iter_chunks. It is quoted a chunk at a time, so no dot-stuffed copy
+    of the whole message is ever held in memory.
+    """
+    chunks = iter_chunks(data, chunk_size)
+    at_line_start = True
+    tail = b''
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        quoted = PERIODS.sub(b'..', chunk)
+        if not at_line_start and chunk[:1] == b'.':
+            # the chunk starts mid-line, so its leading period was not at a line start
+            quoted = quoted[1:]
+        at_line_start = chunk[-1:] == b'\n'
+        tail = (tail + chunk[-2:])[-2:]
+        buffer.append(quoted)
+        size += len(quoted)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if tail != CRLF:
+        buffer.append(CRLF)
+    buffer.append(b'.' + CRLF)
+    yield b''.join(buffer)
+
+
+def iter_bdat(data, chunk_size=CHUNK_SIZE):
+    """Yields (command, chunk) pairs sending a message with CHUNKING (RFC 3030).
+
+    Each chunk is sent as is after its BDAT command, without dot-stuffing,
+    and the last command carries LAST. As with DATA, a message not ending
+    in CRLF has one added.
+    """
+    previous = None
+    tail = b''
+    for chunk in iter_chunks(data, chunk_size):
+        if not len(chunk):
+            continue
+        tail = (tail + chunk[-2:])[-2:]
+        if previous is not None:
+            yield b'BDAT %d\r\n' % len(previous), previous
+        previous = chunk
+    if tail != CRLF:
+        previous = bytes(previous or b'') + CRLF
+    yield b'BDAT %d LAST\r\n' % len(previous), previous
+
+
+def mail_command(sender, options=()):
+    """Builds a MAIL FROM command line."""
+    optionlist = ''
+    if options:
+        optionlist = ' ' + ' '.join(options)
+    return ('mail FROM:%s%s\r\n' % (smtplib.quoteaddr(sender), optionlist)).encode('ascii')
+
+
+def rcpt_command(recipient, options=()):
+    """Builds a RCPT TO command line."""
+    optionlist = ''
+    if options:
+        optionlist = ' ' + ' '.join(options)
+    return ('rcpt TO:%s%s\r\n' % (smtplib.quoteaddr(recipient), optionlist)).encode('ascii')
+
+
+def envelope_error(from_addr, to_addrs, replies):
+    """Interprets the replies to MAIL FROM and each RCPT TO.
+
+    Returns a tuple of the dict of refused recipients and the exception to
+    raise if the message cannot be sent at all, mirroring smtplib.
+    """
+    code, resp = replies[0]
+    if code != 250:
+        return {}, smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+    senderrs = {}
+    for each, (rcode, rresp) in zip(to_addrs, replies[1:]):
+        if rcode not in (250, 251):
+            senderrs[each] = (rcode, rresp)
+    if len(senderrs) == len(to_addrs):
+        # the server refused all our recipients
+        return senderrs, smtplib.SMTPRecipientsRefused(senderrs)
+    return senderrs, None
+
+
+def _untimed(name):
+    return nullcontext()
+
+
+def _rset(host):
+    try:
+        host.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+def _send_bdat(host, msg, pipelining):
+    """Sends the message in BDAT chunks and reads their replies.
+
+    With PIPELINING up to BDAT_WINDOW chunks are sent ahead of their
+    replies. Returns the first failed reply, or the reply to the last chunk.
+    """
+    window = BDAT_WINDOW if pipelining else 0
+    outstanding = 0
+    failed = None
+    try:
+        for command, chunk in iter_bdat(msg):
+            # one write, so Nagle's algorithm doesn't hold the chunk back
+            host.send(command + chunk)
+            outstanding += 1
+            while outstanding > window:
+                reply = host.getreply()
+                outstanding -= 1
+                if reply[0] != 250:
+                    failed = reply
+                    break
+            if failed is not None:
+                # no further chunks may be sent once one has failed
+                break
+    except BaseException:
+        # the server is waiting for the rest of a chunk, so the session is unusable
+        host.close()
+        raise
+    while outstanding:
+        reply = host.getreply()
+        outstanding -= 1
+        if reply[0] != 250 and failed is None:
+            failed = reply
+    return failed or reply
+
+
+def sendmail(host, from_addr, to_addrs, msg, mail_options=(), rcpt_options=(),
+             instrumentation=None, chunking=True):
+    """Sends a message over an smtplib session, pipelining the envelope.
+
+    When the server advertises PIPELINING the MAIL FROM, every RCPT TO and
+    DATA are written in one go and their replies read back afterwards, so
+    the envelope costs a single round-trip. When it advertises CHUNKING the
+    message is sent in BDAT chunks instead of DATA, without dot-stuffing,
+    and with PIPELINING the chunks don't wait for each other's replies
+    either. The message may be bytes, or a binary file or iterable of bytes
+    chunks, which is streamed a chunk at a time. Plain bytes to a server
+    with neither extension are left to smtplib.SMTP.sendmail. Either way the
+    refused recipients are returned and the same exceptions are raised.
+
+    When an Instrumentation is given, the ``envelope`` and ``data`` phases
+    are timed, except when the whole transaction is left to smtplib.
+
+    :param chunking: use CHUNKING when the server supports it
+    """
+    phase = instrumentation.phase if instrumentation is not None else _untimed
+    host.ehlo_or_helo_if_needed()
+    features = getattr(host, 'esmtp_features', {})
+    pipelining = 'pipelining' in features
+    chunking = chunking and 'chunking' in features
+    if isinstance(msg, bytes) and not (pipelining or chunking):
+        return host.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+    esmtp_opts = []
+    if host.has_extn('size'):
+        try:
+            esmtp_opts.append('size=%d' % len(msg))
+        except TypeError:
+            # the size of a streamed message is not always known up front
+            pass
+    esmtp_opts.extend(mail_options)
+
+    with phase('envelope'):
+        if pipelining:
+            commands = [mail_command(from_addr, esmtp_opts)]
+            commands.extend(rcpt_command(each, rcpt_options) for each in to_addrs)
+            host.send(b''.join(commands) + (b'' if chunking else b'data\r\n'))
+            replies = [host.getreply() for _ in range(len(commands))]
+            data_code, data_resp = None, None
+            if not chunking:
+                data_code, data_resp = host.getreply()
+        else:
+            replies = [host.mail(from_addr, esmtp_opts)]
+            if replies[0][0] == 250:
+                replies.extend(host.rcpt(each, rcpt_options) for each in to_addrs)
+            data_code, data_resp = None, None
+
+    senderrs, error = envelope_error(from_addr, to_addrs, replies)
+    with phase('data'):
+        if chunking:
+            if error is not None:
+                _rset(host)
+                raise error
+            code, resp = _send_bdat(host, msg, pipelining)
+            if code != 250:
+                _rset(host)
+                raise smtplib.SMTPDataError(code, resp)
+            return senderrs
+
+        if error is None and data_code is None:
+            host.putcmd('data')
+            data_code, data_resp = host.getreply()
+        if error is None and data_code != 354:
+            error = smtplib.SMTPDataError(data_code, data_resp)
+        if error is not None:
+            if data_code == 354:
+                # the server accepted DATA regardless, so send an empty body
+                host.send(b'.\r\n')
+                host.getreply()
+            _rset(host)
+            raise error
+
+        try:
+            for chunk in iter_quoted(msg):
+                host.send(chunk)
+        except BaseException:
+            # the server is part-way through DATA, so the session is unusable
+            host.close()
+            raise
+        code, resp = host.getreply()
+        if code != 250:
+            _rset(host)
+            raise smtplib.SMTPDataError(code, resp)
+    return senderrs
@@ -0,0 +1,391 @@
+import json
+import os
+import threading
+import time
+
+from .exc import SpoolLockedError
+from .retry import RetryPolicy
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class SpoolEntry:
+    """A message waiting in the spool.
+
+    :param offset: position of the entry in the spool log, used as its id
+    :param envelope: dict of the envelope the message is sent with
+    :param start: position of the message data in the spool log
+    :param length: length of the message data
+    """
+
+    def __init__(self, offset, envelope, start, length):
+        self.offset = offset
+        self.envelope = envelope
+        self.start = start
+        self.length = length
+
+    @property
+    def from_addr(self):
+        return self.envelope['from']
+
+    @property
+    def to_addrs(self):
+        return self.envelope['to']
+
+    @property
+    def mail_options(self):
+        return self.envelope.get('mail_options', [])
+
+    @property
+    def rcpt_options(self):
+        return self.envelope.get('rcpt_options', [])
+
+
+class SpoolBody:
+    """A read-only binary file over the data of one spooled message."""
+
+    def __init__(self, fp, start, length):
+        self.fp = fp
+        self.start = start
+        self.length = length
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def seek(self, pos):
+        self.pos = pos
+        self.fp.seek(self.start + pos)
+
+    def read(self, size=-1):
+        remaining = self.length - self.pos
+        if size < 0 or size > remaining:
+            size = remaining
+        data = self.fp.read(size)
+        self.pos += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(65536), b'')
+
+    def readline(self, size=-1):
+        remaining = self.length - self.pos
+        if size < 0 or size > remaining:
+            size = remaining
+        data = self.fp.readline(size)
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        self.fp.close()
+
+
+class Spool:
+    """A durable, append-only outbox in a local directory.
+
+    Each message is appended to ``spool.log`` as a header line holding the
+    data length and JSON envelope, followed by the message data. Delivered
+    entries are recorded by offset in ``done.log``. Both files are fsynced
+    after every `fsync_batch` writes, or when `sync` is called, and are
+    truncated once every entry is done. A torn record left by a crash is
+    dropped when the spool is reopened.
+
+    The spool keeps its position in the log in memory, so only one Spool,
+    in one process, may use a directory at a time. It holds an exclusive
+    lock on ``spool.lock`` while open, and opening a locked directory
+    raises SpoolLockedError.
+
+    :param path: the spool directory, created if missing
+    :param fsync_batch: the number of writes between fsyncs
+    """
+
+    def __init__(self, path, fsync_batch=1):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        os.makedirs(path, exist_ok=True)
+        self.log_path = os.path.join(path, 'spool.log')
+        self.done_path = os.path.join(path, 'done.log')
+        self._lock_file = self._acquire(os.path.join(path, 'spool.lock'))
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+        self._done = set()
+        if os.path.exists(self.done_path):
+            with open(self.done_path, 'rb') as fp:
+                for line in fp:
+                    if line.endswith(b'\n'):
+                        self._done.add(int(line.split(b' ', 1)[0]))
+
+        self._size = 0
+        self._entries = 0
+        if os.path.exists(self.log_path):
+            for entry in self._scan(os.path.getsize(self.log_path)):
+                self._size = entry.start + entry.length + 1
+                self._entries += 1
+            # drop a record torn by a crash part-way through put
+            os.truncate(self.log_path, self._size)
+
+        self._log = open(self.log_path, 'ab')
+        self._done_log = open(self.done_path, 'ab')
+
+    @staticmethod
+    def _acquire(lock_path):
+        """Locks the spool directory for this Spool, returning the open lock file."""
+        fp = open(lock_path, 'ab')
+        if fcntl is not None:
+            try:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fp.close()
+                raise SpoolLockedError('the spool in %s is in use by another Spool'
+                                       % os.path.dirname(lock_path)) from None
+        return fp
+
+    def _scan(self, end):
+        """Yields the complete entries in the first `end` bytes of the log."""
+        with open(self.log_path, 'rb') as fp:
+            offset = 0
+            while offset < end:
+                header = fp.readline()
+                if not header.endswith(b'\n'):
+                    return
+                length, envelope = header.split(b' ', 1)
+                start = offset + len(header)
+                if start + int(length) + 1 > end:
+                    return
+                yield SpoolEntry(offset, json.loads(envelope.decode('utf-8')),
+                                 start, int(length))
+                offset = start + int(length) + 1
+                fp.seek(offset)
+
+    def put(self, from_addr, to_addrs, data, mail_options=(), rcpt_options=()):
+        """Appends a rendered message and its envelope to the spool.
+
+        The data may be bytes, or an iterable of bytes chunks supporting
+        len(), such as a MessageStream, which is written a chunk at a time.
+
+        :returns: the id of the new entry.
+        """
+        if not isinstance(data, bytes):
+            try:
+                length = len(data)
+            except TypeError:
+                # the length must lead the record, so read it all first
+                data = b''.join(data)
+        if isinstance(data, bytes):
+            length, data = len(data), [data]
+
+        envelope = json.dumps({
+            'from': from_addr,
+            'to': list(to_addrs),
+            'mail_options': list(mail_options),
+            'rcpt_options': list(rcpt_options),
+            'queued': time.time(),
+        }, separators=(',', ':')).encode('utf-8')
+        header = b'%d %s\n' % (length, envelope)
+
+        with self._lock:
+            offset = self._size
+            try:
+                self._log.write(header)
+                written = 0
+                for chunk in data:
+                    self._log.write(chunk)
+                    written += len(chunk)
+                if written != length:
+                    raise ValueError('expected %d bytes of message data, got %d'
+                                     % (length, written))
+                self._log.write(b'\n')
+                self._log.flush()
+            except BaseException:
+                # drop the partial record
+                self._log.flush()
+                self._log.truncate(offset)
+                raise
+            self._size += len(header) + length + 1
+            self._entries += 1
+            self._written()
+        return offset
+
+    def _written(self):
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch:
+            self._sync()
+
+    def _sync(self):
+        for fp in (self._log, self._done_log):
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._unsynced = 0
+
+    def sync(self):
+        """Forces pending writes to disk."""
+        with self._lock:
+            self._sync()
+
+    def pending(self):
+        """Returns the entries not yet marked done, oldest first."""
+        with self._lock:
+            end, done = self._size, set(self._done)
+        return [entry for entry in self._scan(end) if entry.offset not in done]
+
+    def open_body(self, entry):
+        """Opens the data of an entry for streaming."""
+        return SpoolBody(open(self.log_path, 'rb'), entry.start, entry.length)
+
+    def mark_done(self, entry, status='sent'):
+        """Records an entry as delivered, or as failed for good."""
+        with self._lock:
+            self._done_log.write(b'%d %s\n' % (entry.offset, status.encode('ascii')))
+            self._done_log.flush()
+            self._done.add(entry.offset)
+            self._written()
+
+    def compact(self):
+        """Empties the spool files once every entry is done.
+
+        :returns: True if the spool was emptied.
+        """
+        with self._lock:
+            if self._entries == 0 or len(self._done) < self._entries:
+                return False
+            for fp in (self._log, self._done_log):
+                fp.truncate(0)
+                fp.flush()
+                os.fsync(fp.fileno())
+            self._done = set()
+            self._size = self._entries = self._unsynced = 0
+            return True
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._log.close()
+            self._done_log.close()
+            # closing the file releases the lock
+            self._lock_file.close()
+
+
+class SpoolWorker:
+    """Delivers spooled messages from a background thread.
+
+    Transient failures are retried after the policy's backoff; permanent
+    failures, and messages out of attempts, are marked failed. When the
+    message is sent but some recipients are refused with a transient 4xx
+    reply, it is spooled again for just those recipients, to be retried in
+    the same way.
+
+    :param spool: the Spool to deliver
+    :param deliver: callable taking an entry and its SpoolBody that sends the
+        message, returning a dict of refused recipients as sendmail does
+    :param interval: seconds between passes over the spool
+    :param policy: the RetryPolicy deciding what is retried and when
+    """
+
+    def __init__(self, spool, deliver, interval=5, policy=None):
+        self.spool = spool
+        self.deliver = deliver
+        self.interval = interval
+        self.policy = policy or RetryPolicy(attempts=10, max_backoff=300)
+        self._retries = {}
+        self._pass_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Makes one delivery pass over the spool.
+
+        :returns: the number of entries still pending.
+        """
+        with self._pass_lock:
+            now = time.monotonic()
+            remaining = 0
+            for entry in self.spool.pending():
+                attempts, due = self._retries.get(entry.offset, (0, now))
+                if due > now:
+                    remaining += 1
+                    continue
+                try:
+                    with self.spool.open_body(entry) as body:
+                        refused = self.deliver(entry, body)
+                        retry = self.policy.split_refused(refused or {})[0]
+                        if retry and attempts + 1 < self.policy.attempts:
+                            self._respool(entry, body, retry, attempts + 1)
+                            remaining += 1
+                except Exception as e:
+                    attempts += 1
+                    if attempts >= self.policy.attempts or not self.policy.is_transient(e):
+                        self._finish(entry, 'failed')
+                    else:
+                        due = time.monotonic() + self.policy.delay(attempts)
+                        self._retries[entry.offset] = (attempts, due)
+                        remaining += 1
+                else:
+                    self._finish(entry, 'sent')
+            if not remaining:
+                self.spool.compact()
+            return remaining
+
+    def _respool(self, entry, body, to_addrs, attempts):
+        """Spools the message again for the recipients to retry, keeping its attempt count."""
+        body.seek(0)
+        offset = self.spool.put(entry.from_addr, to_addrs, body,
+                                entry.mail_options, entry.rcpt_options)
+        self._retries[offset] = (attempts, time.monotonic() + self.policy.delay(attempts))
+
+    def _finish(self, entry, status):
+        self.spool.mark_done(entry, status)
+        self._retries.pop(entry.offset, None)
+
+    def next_due(self):
+        """Seconds until the earliest retry is due, or None if none are waiting."""
+        if not self._retries:
+            return None
+        return max(0, min(due for _, due in self._retries.values()) - time.monotonic())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='apistar-mail-spool',
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.run_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def wake(self):
+        """Starts a delivery pass without waiting for the interval."""
+        self._wake.set()
+
+    def flush(self, timeout=None):
+        """Delivers until the spool is empty.
+
+        :returns: False if entries were still pending when the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.run_once():
+            wait = self.next_due() or 0
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,124 @@
+from string import Template
+
+from .mail import Attachment, Message, _load_email
+
+
+def _is_static(text):
+    """True when substitution leaves text as it is, a literal $ such as in "$5 off" included."""
+    if text is None:
+        return True
+    return not any(match.group('named') or match.group('braced') or match.group('escaped')
+                   for match in Template.pattern.finditer(text))
+
+
+def _substitute(text, context):
+    if text is None or not context:
+        return text
+    return Template(text).safe_substitute(context)
+
+
+class MessageTemplate:
+    """Stamps out personalized messages that share a body and attachments.
+
+    Text may contain ``$name`` placeholders, filled in from the keyword
+    arguments given to `render`. Text parts without placeholders and every
+    attachment are encoded once, when the template is created, and shared by
+    all the messages rendered from it, so each new message only costs its
+    headers and substituted parts. When the body and alternatives have no
+    placeholders the whole rendered body is shared too, along with its DKIM
+    body hash.
+
+    Takes the same arguments as Message, less the per-message recipients
+    and date.
+    """
+
+    def __init__(self, subject='',
+                 body=None,
+                 html=None,
+                 alts=None,
+                 sender=None,
+                 attachments=None,
+                 reply_to=None,
+                 charset=None,
+                 extra_headers=None,
+                 mail_options=None,
+                 rcpt_options=None,
+                 ascii_attachments=False):
+
+        self.subject = subject
+        self.body = body
+        self.alts = dict(alts or {})
+        if html is not None:
+            self.alts['html'] = html
+        self.sender = sender
+        self.attachments = attachments or []
+        self.reply_to = reply_to
+        self.charset = charset
+        self.extra_headers = extra_headers
+        self.mail_options = mail_options or []
+        self.rcpt_options = rcpt_options or []
+        self.ascii_attachments = ascii_attachments
+
+        charset = self.charset or 'utf-8'
+        _load_email()
+        from email.mime.text import MIMEText
+        self._parts = {}
+        # the (inputs, RenderedBody) shared while the body has no placeholders
+        self._body = None
+        texts = [(self.body, 'plain')] + [(content, subtype)
+                                          for subtype, content in self.alts.items()]
+        for text, subtype in texts:
+            if _is_static(text):
+                self._parts[(text, subtype)] = MIMEText(text, _subtype=subtype, _charset=charset)
+        for attachment in self.attachments:
+            attachment._mime_part(self.ascii_attachments)
+
+    def attach(self,
+               filename=None,
+               content_type=None,
+               data=None,
+               disposition=None,
+               headers=None):
+        """Adds an attachment shared by every message rendered from the template.
+
+        Takes the same arguments as Message.attach.
+        """
+        attachment = Attachment(filename, content_type, data, disposition, headers)
+        attachment._mime_part(self.ascii_attachments)
+        self.attachments.append(attachment)
+
+    def render(self, recipients, cc=None, bcc=None, date=None, **context):
+        """Creates a Message for the given recipients.
+
+        :param recipients: list of email addresses
+        :param cc: CC list
+        :param bcc: BCC list
+        :param date: send date
+        :param context: values substituted for ``$name`` placeholders
+        """
+        alts = dict((subtype, _substitute(content, context))
+                    for subtype, content in self.alts.items())
+        msg = Message(subject=_substitute(self.subject, context),
+                      recipients=list(recipients),
+                      body=_substitute(self.body, context),
+                      html=alts.pop('html', None),
+                      alts=alts,
+                      sender=self.sender,
+                      cc=cc,
+                      bcc=bcc,
+                      attachments=list(self.attachments),
+                      reply_to=self.reply_to,
+                      date=date,
+                      charset=self.charset,
+                      extra_headers=self.extra_headers,
+                      mail_options=self.mail_options,
+                      rcpt_options=self.rcpt_options,
+                      ascii_attachments=self.ascii_attachments)
+        msg._shared_parts = self._parts
+        if _is_static(self.body) and all(_is_static(text) for text in self.alts.values()):
+            key = (self.body, tuple(self.alts.items()), tuple(self.attachments),
+                   self.charset, self.ascii_attachments)
+            if self._body is None or self._body[0] != key:
+                self._body = (key, msg._render_body())
+            msg._body_bytes = self._body[1]
+        return msg
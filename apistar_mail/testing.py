@@ -0,0 +1,399 @@
+"""An in-process SMTP server to test and load test against.
+
+SinkServer speaks enough ESMTP for smtplib and AsyncMail: EHLO and HELO,
+STARTTLS, AUTH PLAIN and LOGIN, PIPELINING, SIZE, CHUNKING, MAIL, RCPT,
+DATA, BDAT, RSET, NOOP and QUIT. It records or discards what it receives, and can be made
+slow or faulty, so reconnects, retries, recycling and throttling can be
+exercised without a real relay::
+
+    from apistar_mail.testing import SinkServer
+
+    with SinkServer() as server:
+        server.add_fault('RCPT', 451, 'Try again later', match='busy', count=1)
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port)
+        mail.send(message)
+        sender, recipients, data = server.messages[0]
+"""
+
+import asyncio
+import base64
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+
+DEFAULT_FEATURES = ('PIPELINING', 'SIZE 0', '8BITMIME', 'CHUNKING', 'AUTH PLAIN LOGIN')
+
+
+def make_tls_context():
+    """Creates a server SSLContext with a throwaway self-signed certificate.
+
+    The certificate is generated with the openssl command line tool. Returns
+    None when it isn't installed.
+    """
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        return None
+
+    directory = tempfile.mkdtemp(prefix='apistar-mail-')
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    try:
+        subprocess.run([openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                        '-subj', '/CN=localhost', '-days', '1',
+                        '-keyout', keyfile, '-out', certfile],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+    except (OSError, subprocess.CalledProcessError, ssl.SSLError):
+        return None
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return context
+
+
+class Fault:
+    """A reply given instead of the normal one, see `SinkServer.add_fault`."""
+
+    def __init__(self, stage, code=None, text=None, match=None, count=None):
+        self.stage = stage.upper()
+        self.code = code
+        self.text = text or ('Injected failure' if code else None)
+        self.match = match
+        self.count = count
+
+    def applies(self, stage, argument):
+        if stage != self.stage or self.count == 0:
+            return False
+        if self.match is None:
+            matched = True
+        elif callable(self.match):
+            matched = self.match(argument)
+        else:
+            matched = self.match.lower() in argument.lower()
+        if matched and self.count is not None:
+            self.count -= 1
+        return matched
+
+
+class _Dropped(Exception):
+    """Raised to close the session without a reply."""
+
+
+class SinkServer:
+    """An SMTP server that accepts mail and records or discards it.
+
+    It runs on the current event loop with ``await server.start()`` or
+    ``async with``, or on an event loop in a background thread with
+    `start_thread` or a plain ``with`` block.
+
+    :param features: the ESMTP extensions advertised in reply to EHLO.
+        ``SIZE n`` rejects larger messages when n isn't 0. BDAT is accepted
+        whether or not CHUNKING is advertised. STARTTLS is added when there
+        is a tls_context.
+    :param tls_context: a server SSLContext enabling STARTTLS, see
+        `make_tls_context`. Needs Python 3.11 or later.
+    :param users: a dict of usernames to passwords checked by AUTH. By
+        default any credentials are accepted.
+    :param record: keep the messages and commands received. Without it only
+        the counts are kept, for long load tests.
+    :param latency: seconds to wait before each reply, or a dict of them by
+        stage (the command verbs, CONNECT for the greeting and MESSAGE for
+        the reply to the message content).
+    :param host: the address to listen on. The port is picked by the system.
+    """
+
+    def __init__(self, features=DEFAULT_FEATURES, tls_context=None, users=None, record=True,
+                 latency=None, host='127.0.0.1'):
+        self.features = features
+        self.tls_context = tls_context
+        self.users = users
+        self.record = record
+        self.latency = latency
+        self.host = host
+        self.port = None
+        self.faults = []
+        self.messages = []
+        self.commands = []
+        self.sessions = 0
+        self.received = 0
+        self.bytes = 0
+        self._server = None
+        self._writers = set()
+        self._tasks = set()
+        self._loop = None
+        self._thread = None
+
+    def add_fault(self, stage, code=None, text=None, match=None, count=None):
+        """Makes the server fail a stage of the session.
+
+        :param stage: a command verb such as MAIL, RCPT or DATA, CONNECT for
+            the greeting or MESSAGE for the reply to the message content
+        :param code: the reply code, such as 421, 451 or 554. Without a code
+            the connection is dropped instead.
+        :param text: the reply text
+        :param match: only fail commands whose argument contains this
+            string, or for which this function returns True
+        :param count: fail only this many times. By default it always fails.
+        """
+        fault = Fault(stage, code, text, match, count)
+        self.faults.append(fault)
+        return fault
+
+    def clear_faults(self):
+        self.faults = []
+
+    async def start(self):
+        """Starts listening on the running event loop."""
+        self._server = await asyncio.start_server(self._handle, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """Stops listening and ends the open sessions."""
+        self._server.close()
+        await self._server.wait_closed()
+        for writer in list(self._writers):
+            writer.close()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.stop()
+
+    def start_thread(self):
+        """Starts listening on an event loop in a background thread."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+        return self
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start_thread()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop_thread()
+
+    def _size_limit(self):
+        for feature in self.features:
+            if feature.upper().startswith('SIZE '):
+                return int(feature.split()[1])
+        return 0
+
+    def _fault(self, stage, argument, code, text):
+        """Returns the reply code and text, replaced by those of a matching fault."""
+        for fault in self.faults:
+            if fault.applies(stage, argument):
+                if fault.code is None:
+                    raise _Dropped
+                return fault.code, fault.text
+        return code, text
+
+    async def _reply(self, writer, stage, argument, code, text):
+        code, text = self._fault(stage, argument, code, text)
+        await self._write(writer, stage, code, text)
+        return code
+
+    async def _write(self, writer, stage, code, text):
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(stage)
+        if latency:
+            await asyncio.sleep(latency)
+        lines = text if isinstance(text, list) else [text]
+        reply = ''.join('%d-%s\r\n' % (code, line) for line in lines[:-1])
+        writer.write((reply + '%d %s\r\n' % (code, lines[-1])).encode('utf-8'))
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.sessions += 1
+        task = asyncio.current_task()
+        self._writers.add(writer)
+        self._tasks.add(task)
+        try:
+            await self._session(reader, writer)
+        except (_Dropped, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+            self._writers.discard(writer)
+            self._tasks.discard(task)
+
+    async def _session(self, reader, writer):
+        if await self._reply(writer, 'CONNECT', '', 220, 'localhost ESMTP') != 220:
+            return
+        tls_active = False
+        sender, recipients = None, []
+        chunks, chunked_size = [], 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').rstrip('\r\n')
+            verb, _, argument = command.partition(' ')
+            verb = verb.upper()
+            if self.record:
+                self.commands.append(verb)
+
+            if verb == 'EHLO':
+                features = ['localhost'] + list(self.features)
+                if self.tls_context is not None and not tls_active:
+                    features.append('STARTTLS')
+                await self._reply(writer, verb, argument, 250, features)
+            elif verb == 'STARTTLS' and self.tls_context is not None and not tls_active:
+                if not hasattr(writer, 'start_tls'):
+                    await self._reply(writer, verb, argument, 454, 'TLS not available')
+                    continue
+                if await self._reply(writer, verb, argument, 220, 'Ready to start TLS') == 220:
+                    await writer.start_tls(self.tls_context)
+                    tls_active = True
+            elif verb == 'AUTH':
+                await self._auth(reader, writer, argument)
+            elif verb == 'MAIL':
+                size = self._size_limit()
+                params = dict(param.upper().partition('=')[::2] for param in argument.split()[1:])
+                if size and int(params.get('SIZE') or 0) > size:
+                    await self._reply(writer, verb, argument, 552, 'Message size exceeds limit')
+                elif await self._reply(writer, verb, argument, 250, 'OK') == 250:
+                    sender, recipients = _address(argument), []
+            elif verb == 'RCPT':
+                if await self._reply(writer, verb, argument, 250, 'OK') == 250:
+                    recipients.append(_address(argument))
+            elif verb == 'DATA':
+                if sender is None or not recipients:
+                    await self._reply(writer, verb, argument, 554, 'No valid recipients')
+                    continue
+                if await self._reply(writer, verb, argument, 354,
+                                     'End data with <CR><LF>.<CR><LF>') != 354:
+                    continue
+                data, size = await self._read_data(reader)
+                if size is None:
+                    return
+                await self._accept(writer, sender, recipients, data, size)
+                sender, recipients = None, []
+            elif verb == 'BDAT':
+                words = argument.split()
+                try:
+                    length = int(words[0])
+                except (IndexError, ValueError):
+                    await self._reply(writer, verb, argument, 501, 'Syntax: BDAT size [LAST]')
+                    continue
+                try:
+                    chunk = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    return
+                last = len(words) > 1 and words[1].upper() == 'LAST'
+                if sender is None or not recipients:
+                    await self._reply(writer, verb, argument, 554, 'No valid recipients')
+                    chunks, chunked_size = [], 0
+                    continue
+                chunked_size += length
+                if self.record:
+                    chunks.append(chunk)
+                if not last:
+                    if await self._reply(writer, verb, argument, 250,
+                                         '%d octets received' % length) != 250:
+                        chunks, chunked_size = [], 0
+                    continue
+                data = b''.join(chunks) if self.record else None
+                await self._accept(writer, sender, recipients, data, chunked_size)
+                sender, recipients = None, []
+                chunks, chunked_size = [], 0
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                chunks, chunked_size = [], 0
+                await self._reply(writer, verb, argument, 250, 'OK')
+            elif verb == 'QUIT':
+                await self._reply(writer, verb, argument, 221, 'Bye')
+                return
+            elif verb in ('HELO', 'NOOP'):
+                await self._reply(writer, verb, argument, 250, 'OK')
+            else:
+                await self._reply(writer, verb, argument, 502, 'Command not implemented')
+
+    async def _accept(self, writer, sender, recipients, data, size):
+        """Replies to the complete message content, recording it when accepted."""
+        limit = self._size_limit()
+        if limit and size > limit:
+            code, text = 552, 'Message size exceeds limit'
+        else:
+            code, text = self._fault('MESSAGE', '', 250, 'OK queued')
+        if code == 250:
+            # counted before the reply, so the client never sees a
+            # message accepted that isn't counted yet
+            self.received += 1
+            self.bytes += size
+            if self.record:
+                self.messages.append((sender, recipients, data))
+        await self._write(writer, 'MESSAGE', code, text)
+
+    async def _read_data(self, reader):
+        """Reads the message content up to the final dot, undoing dot-stuffing.
+
+        Returns the data, or None when recording is off, and its size.
+        The size is None if the client disconnected.
+        """
+        lines, size = [], 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                return None, None
+            if line == b'.\r\n':
+                break
+            if line.startswith(b'.'):
+                line = line[1:]
+            size += len(line)
+            if self.record:
+                lines.append(line)
+        return b''.join(lines) if self.record else None, size
+
+    async def _auth(self, reader, writer, argument):
+        mechanism, _, initial = argument.partition(' ')
+        mechanism = mechanism.upper()
+
+        async def challenge(prompt):
+            await self._reply(writer, 'AUTH', argument, 334, prompt)
+            line = await reader.readline()
+            if not line:
+                raise _Dropped
+            return line.decode('ascii', 'replace').strip()
+
+        try:
+            if mechanism == 'PLAIN':
+                response = initial or await challenge('')
+                _, user, password = _b64(response).split('\0')
+            elif mechanism == 'LOGIN':
+                user = _b64(initial or await challenge('VXNlcm5hbWU6'))
+                password = _b64(await challenge('UGFzc3dvcmQ6'))
+            else:
+                await self._reply(writer, 'AUTH', argument, 504, 'Unrecognized mechanism')
+                return
+        except ValueError:
+            await self._reply(writer, 'AUTH', argument, 501, 'Cannot decode response')
+            return
+
+        if self.users is not None and self.users.get(user) != password:
+            await self._reply(writer, 'AUTH', argument, 535, 'Authentication failed')
+        else:
+            await self._reply(writer, 'AUTH', argument, 235, 'Authentication successful')
+
+
+def _address(argument):
+    """The <address> of a MAIL FROM or RCPT TO argument."""
+    return argument.partition(':')[2].strip().split(' ')[0]
+
+
+def _b64(value):
+    return base64.b64decode(value, validate=True).decode('utf-8')
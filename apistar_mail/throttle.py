@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """A token bucket refilling at a steady rate.
+
+    Taking tokens never fails: it reserves them, letting the bucket go into
+    debt, and returns how long the caller must wait for the debt to be paid
+    off. Bursts are so spread out at the refill rate rather than refused.
+    The bucket is safe to share between threads and asyncio tasks.
+
+    :param rate: tokens added every `interval`
+    :param interval: seconds over which `rate` tokens are added
+    :param capacity: the most tokens that can build up while idle, which is
+        the largest burst sent without waiting. Defaults to `rate`.
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, rate, interval=1.0, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.interval = interval
+        self.capacity = rate if capacity is None else capacity
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Takes tokens and returns the seconds to wait before using them."""
+        with self._lock:
+            now = self.clock()
+            refill = (now - self.updated) * self.rate / self.interval
+            self.tokens = min(self.capacity, self.tokens + refill) - tokens
+            self.updated = now
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens * self.interval / self.rate
+
+
+class Throttle:
+    """Limits messages, recipients and bytes sent per interval.
+
+    Each limit left as None is not enforced.
+
+    :param messages: messages per interval
+    :param recipients: recipients per interval
+    :param bytes: bytes of message data per interval
+    :param interval: the interval in seconds
+    :param burst: the multiple of each limit that may be sent at once after
+        an idle spell
+    """
+
+    def __init__(self, messages=None, recipients=None, bytes=None, interval=1.0, burst=1):
+        self.buckets = []
+        for name, rate in (('messages', messages), ('recipients', recipients), ('bytes', bytes)):
+            if rate:
+                self.buckets.append((name, TokenBucket(rate, interval, rate * burst)))
+
+    def __bool__(self):
+        return bool(self.buckets)
+
+    def reserve(self, recipients=1, size=0):
+        """Takes what sending one message needs and returns the seconds to wait."""
+        amounts = {'messages': 1, 'recipients': recipients, 'bytes': size}
+        return max([bucket.reserve(amounts[name]) for name, bucket in self.buckets] or [0])
+
+    def wait(self, recipients=1, size=0):
+        """Blocks the thread until a message may be sent."""
+        delay = self.reserve(recipients, size)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, recipients=1, size=0):
+        """Suspends the task until a message may be sent."""
+        import asyncio
+
+        delay = self.reserve(recipients, size)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
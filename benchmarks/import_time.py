@@ -0,0 +1,93 @@
+"""Measures how long importing apistar-mail and first using it take.
+
+Run from the repository root::
+
+    python -m benchmarks.import_time --output import_time.json
+
+Every statement runs in a fresh interpreter, so nothing is already imported.
+Alongside the timings, the report lists which of the heavy dependencies
+(smtplib, ssl, the email MIME modules, asyncio and apistar) each statement
+pulled in.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import apistar_mail
+
+STATEMENTS = [
+    ('import', 'import apistar_mail'),
+    ('import_mail', 'from apistar_mail import Mail, Message'),
+    ('create_message', 'from apistar_mail import Message\n'
+                       'Message(subject="s", sender="a@example.com", recipients=["b@example.com"],'
+                       ' body="body")'),
+    ('render_message', 'from apistar_mail import Message\n'
+                       'Message(subject="s", sender="a@example.com", recipients=["b@example.com"],'
+                       ' body="body").as_bytes()'),
+    ('import_component', 'from apistar_mail import MailComponent'),
+]
+
+HEAVY_MODULES = ['smtplib', 'ssl', 'email.mime.multipart', 'email.policy', 'asyncio', 'apistar']
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+exec(compile(%r, '<benchmark>', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': [m for m in %r if m in sys.modules]}))
+'''
+
+
+def measure(statement, rounds):
+    times, modules = [], []
+    for _ in range(rounds):
+        output = subprocess.run([sys.executable, '-c', SCRIPT % (statement, HEAVY_MODULES)],
+                                check=True, stdout=subprocess.PIPE).stdout
+        result = json.loads(output.decode('utf-8'))
+        times.append(result['seconds'])
+        modules = result['modules']
+    return {
+        'rounds': rounds,
+        'best': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'imported': modules,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='fresh interpreters per statement (default: 10)')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, statement in STATEMENTS:
+        stats = measure(statement, args.rounds)
+        stats['name'] = 'import.%s' % name
+        results.append(stats)
+
+    report = {
+        'apistar_mail': apistar_mail.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""Benchmarks for message construction and delivery throughput.
+
+Run from the repository root::
+
+    python -m benchmarks.run --output results.json
+
+Each benchmark is timed over several rounds and reported as JSON with the
+best, median and mean round, so results from different releases can be
+compared. Resending is also timed with DKIM signing when the
+cryptography package is installed. The memory held by each queued message
+is measured with tracemalloc. Delivery benchmarks send to an in-process SMTP stand-in, over
+STARTTLS too when the openssl command line tool is available to create a
+certificate.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import apistar_mail
+from apistar_mail.dkim import DKIMSigner
+from apistar_mail.mail import Attachment, Mail, Message
+from apistar_mail.testing import SinkServer, make_tls_context
+
+MB = 1024 * 1024
+
+HTML = '<html><body>%s</body></html>' % ('<p>Hello <b>world</b></p>' * 200)
+TEXT = 'Hello world, this is the plain text body.\n' * 200
+DATA_64K = os.urandom(64 * 1024)
+
+
+def plain_message():
+    return Message(subject='Benchmark',
+                   sender='sender@example.com',
+                   recipients=['to@example.com'],
+                   body=TEXT)
+
+
+def html_message():
+    msg = plain_message()
+    msg.html = HTML
+    return msg
+
+
+def many_recipients_message():
+    msg = plain_message()
+    msg.recipients = ['user%d@example.com' % i for i in range(500)]
+    msg.cc = ['cc%d@example.com' % i for i in range(100)]
+    return msg
+
+
+def unicode_message():
+    return Message(subject='Grüße aus Köln – 東京からこんにちは',
+                   sender=('Jörg Müller', 'jörg@münchen.example'),
+                   recipients=['Zoë <zoë@bücher.example>'] +
+                              ['Ünïcödé %d <user%d@exämple.com>' % (i, i) for i in range(50)],
+                   body='Grüße, ¡hola!, こんにちは\n' * 200)
+
+
+def attachment_message(size):
+    data = os.urandom(size)
+
+    def factory():
+        msg = plain_message()
+        # a new Attachment each time, so its encoded part isn't reused
+        msg.attachments.append(Attachment('data.bin', 'application/octet-stream', data))
+        return msg
+    return factory
+
+
+def construction_cases(sizes):
+    cases = [
+        ('plain', plain_message, 200),
+        ('html_alternative', html_message, 200),
+        ('many_recipients', many_recipients_message, 50),
+        ('unicode_idn', unicode_message, 100),
+    ]
+    for size in sizes:
+        cases.append(('attachment_%dmb' % size, attachment_message(size * MB),
+                      max(1, 20 // size)))
+    return cases
+
+
+def measure(func, rounds, setup=None):
+    """Times func over rounds, calling setup untimed before each, and returns stats."""
+    times = []
+    for _ in range(rounds):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        if setup is not None:
+            func(arg)
+        else:
+            func()
+        times.append(time.perf_counter() - start)
+    return {
+        'rounds': rounds,
+        'best': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+
+
+def bench_construction(sizes, scale):
+    results = []
+    signer = dkim_signer()
+    for name, factory, rounds in construction_cases(sizes):
+        rounds = max(1, int(rounds * scale))
+        for method in ('_message', 'as_bytes'):
+            stats = measure(lambda msg: getattr(msg, method)(), rounds, setup=factory)
+            stats['name'] = 'construct.%s.%s' % (name, method)
+            stats['ops_per_sec'] = 1 / stats['median'] if stats['median'] else None
+            results.append(stats)
+
+        stats = measure(resend, rounds, setup=rendered(factory))
+        stats['name'] = 'construct.%s.resend' % name
+        stats['ops_per_sec'] = 1 / stats['median'] if stats['median'] else None
+        results.append(stats)
+
+        if signer is not None:
+            stats = measure(resend, rounds, setup=rendered(factory, signer))
+            stats['name'] = 'construct.%s.resend_dkim' % name
+            stats['ops_per_sec'] = 1 / stats['median'] if stats['median'] else None
+            results.append(stats)
+    return results
+
+
+def dkim_signer():
+    """A DKIMSigner with a throwaway RSA key, or None without cryptography."""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+    except ImportError:
+        print('cryptography is not installed, skipping the DKIM benchmarks', file=sys.stderr)
+        return None
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    return DKIMSigner('example.com', 'bench', pem)
+
+
+def rendered(factory, signer=None):
+    def setup():
+        msg = factory()
+        msg.dkim = signer
+        msg.as_bytes()
+        return msg
+    return setup
+
+
+def resend(msg):
+    """Renders a message again for a new recipient, reusing its rendered body."""
+    msg.recipients = ['someone.else@example.com']
+    msg.as_bytes()
+
+
+def queued_message(i):
+    return Message(subject='Your order %d has shipped' % i,
+                   sender='shop@example.com',
+                   recipients=['customer%d@example.com' % i],
+                   body='Order %d is on its way.' % i)
+
+
+def bench_memory(count, scale):
+    """Measures the memory held per message queued but not yet rendered."""
+    count = max(1, int(count * scale))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        queue = [queued_message(i) for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del queue
+    return [{
+        'name': 'memory.queued_message',
+        'messages': count,
+        'bytes_per_message': (after - before) / count,
+    }]
+
+
+def attachment_message_64k():
+    msg = html_message()
+    msg.attachments.append(Attachment('data.bin', 'application/octet-stream', DATA_64K))
+    return msg
+
+
+def bench_delivery(count, scale, tls_context, workers):
+    count = max(1, int(count * scale))
+    variants = [('plain', None)]
+    if tls_context is not None:
+        variants.append(('starttls', tls_context))
+    else:
+        print('openssl is not available, skipping the TLS benchmarks', file=sys.stderr)
+
+    results = []
+    for label, context in variants:
+        with SinkServer(tls_context=context, record=False) as server:
+            options = {
+                'MAIL_SERVER': '127.0.0.1',
+                'MAIL_PORT': server.port,
+                'MAIL_USE_TLS': context is not None,
+            }
+
+            def send_each():
+                mail = Mail(**options)
+                for _ in range(count):
+                    mail.send(plain_message())
+
+            def send_pooled():
+                mail = Mail(MAIL_POOL_SIZE=1, **options)
+                for _ in range(count):
+                    mail.send(plain_message())
+                mail.close()
+
+            def connection_send():
+                mail = Mail(**options)
+                with mail.connect() as connection:
+                    for _ in range(count):
+                        connection.send(plain_message())
+
+            def connection_send_64k(chunking):
+                def run():
+                    mail = Mail(MAIL_USE_CHUNKING=chunking, **options)
+                    with mail.connect() as connection:
+                        for _ in range(count):
+                            connection.send(attachment_message_64k())
+                return run
+
+            def send_many(executor):
+                def run():
+                    mail = Mail(**options)
+                    mail.send_many((attachment_message_64k() for _ in range(count)),
+                                   concurrency=workers, executor=executor)
+                return run
+
+            for name, func in (('mail_send', send_each),
+                               ('mail_send_pooled', send_pooled),
+                               ('connection_send', connection_send),
+                               ('connection_send_64k_data', connection_send_64k(False)),
+                               ('connection_send_64k_bdat', connection_send_64k(True)),
+                               ('send_many_threads', send_many('thread')),
+                               ('send_many_processes', send_many('process'))):
+                stats = measure(func, 3)
+                stats['name'] = 'deliver.%s.%s' % (label, name)
+                stats['messages'] = count
+                stats['messages_per_sec'] = count / stats['median']
+                results.append(stats)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--sizes', default='1,10,100',
+                        help='comma separated attachment sizes in MB (default: 1,10,100)')
+    parser.add_argument('--messages', type=int, default=200,
+                        help='messages sent per delivery round (default: 200)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the number of rounds and messages')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='connections and processes used by send_many (default: one per CPU)')
+    parser.add_argument('--no-delivery', action='store_true',
+                        help='only run the construction benchmarks')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = bench_construction(sizes, args.scale)
+    results.extend(bench_memory(10000, args.scale))
+    if not args.no_delivery:
+        results.extend(bench_delivery(args.messages, args.scale, make_tls_context(),
+                                      args.workers))
+
+    report = {
+        'apistar_mail': apistar_mail.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import pytest
+
+from apistar_mail.mail import Message
+from apistar_mail.testing import SinkServer
+
+
+def make_server():
+    """A SinkServer rejecting recipients whose address starts with "refused"
+    with a 550, and those starting with "busy" with a 451 the first time
+    they are seen."""
+    server = SinkServer(features=('PIPELINING', 'SIZE 1000000', 'AUTH PLAIN LOGIN'))
+    server.add_fault('RCPT', 550, 'No such user', match='<refused')
+    busy = set()
+
+    def first_busy(argument):
+        if argument.startswith('TO:<busy') and argument not in busy:
+            busy.add(argument)
+            return True
+        return False
+
+    server.add_fault('RCPT', 451, 'Try again later', match=first_busy)
+    return server
+
+
+@pytest.fixture
+def smtp_server():
+    return make_server()
+
+
+@pytest.fixture
+def threaded_smtp_server():
+    """The SinkServer running on its own event loop in a background thread."""
+    with make_server() as server:
+        yield server
+
+
+@pytest.fixture
+def mail_options():
+    """Settings for a Mail logging in to a made up server. A test module
+    overrides this fixture to add its own settings."""
+    return {
+        'MAIL_SERVER': 'smtp.example.com',
+        'MAIL_USERNAME': 'fake@example.com',
+        'MAIL_PASSWORD': 'secret',
+        'MAIL_DEFAULT_SENDER': 'fake@example.com',
+    }
+
+
+@pytest.fixture
+def make_message():
+    """A factory of plain text messages, by default to foo@bar.com. The body
+    has a line starting with a dot, which is stuffed when sent."""
+    def make_message(recipients=("foo@bar.com",), subject="subject",
+                     body="normal ascii text\n.leading dot", sender="from@example.com", **kwargs):
+        return Message(subject=subject, sender=sender, recipients=list(recipients), body=body,
+                       **kwargs)
+    return make_message
@@ -0,0 +1,181 @@
+import asyncio
+import smtplib
+import ssl
+
+from apistar_mail import aio
+from apistar_mail.aio import AsyncMail
+from apistar_mail.exc import BadHeaderError
+from apistar_mail.mail import Message
+from apistar_mail.testing import SinkServer, make_tls_context
+
+import pytest
+
+
+@pytest.fixture
+def mail_options(mail_options):
+    return dict(mail_options, MAIL_SERVER='127.0.0.1', MAIL_POOL_SIZE=2)
+
+
+def test_async_send(smtp_server, mail_options, make_message):
+    async def scenario():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_PORT=smtp_server.port, **mail_options)
+        msg = make_message(sender=None)
+        await mail.send(msg)
+        await mail.close()
+        await smtp_server.stop()
+        return msg
+
+    msg = asyncio.run(scenario())
+    sender, recipients, data = smtp_server.messages[0]
+    assert sender == '<fake@example.com>'
+    assert recipients == ['<foo@bar.com>']
+    assert data == msg.as_bytes() + b"\r\n"
+    assert 'AUTH' in smtp_server.commands
+
+
+def test_async_send_reuses_pooled_connections(smtp_server, mail_options, make_message):
+    async def scenario():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_PORT=smtp_server.port, **mail_options)
+        await asyncio.gather(*[mail.send(make_message()) for i in range(50)])
+        await mail.close()
+        await smtp_server.stop()
+
+    asyncio.run(scenario())
+    assert len(smtp_server.messages) == 50
+    assert smtp_server.sessions <= 2
+
+
+def test_async_send_without_pipelining(smtp_server, mail_options, make_message):
+    smtp_server.features = ('AUTH LOGIN',)
+
+    async def scenario():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_PORT=smtp_server.port, **mail_options)
+        await mail.send(make_message(["foo@bar.com", "refused@bar.com"]))
+        await mail.close()
+        await smtp_server.stop()
+
+    asyncio.run(scenario())
+    sender, recipients, data = smtp_server.messages[0]
+    assert recipients == ['<foo@bar.com>']
+
+
+def test_async_send_all_recipients_refused(smtp_server, mail_options, make_message):
+    async def scenario():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_PORT=smtp_server.port, **mail_options)
+        try:
+            await mail.send(make_message(["refused@bar.com"]))
+        finally:
+            await mail.close()
+            await smtp_server.stop()
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        asyncio.run(scenario())
+    assert smtp_server.messages == []
+
+
+def test_async_send_suppressed(mail_options):
+    async def scenario():
+        mail = AsyncMail(MAIL_SUPPRESS_SEND=True, **mail_options)
+        msg = Message(recipients=["foo@bar.com"], body="text")
+        await mail.send(msg)
+        return msg
+
+    msg = asyncio.run(scenario())
+    assert msg.sender == 'fake@example.com'
+
+
+def test_cancelled_send_does_not_reuse_session(mail_options, make_message):
+    server = SinkServer(latency={'RCPT': 0.2})
+
+    async def scenario():
+        async with server:
+            mail = AsyncMail(MAIL_PORT=server.port, **mail_options)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(mail.send(make_message(["first@bar.com"])), 0.05)
+            await mail.send(make_message(["second@bar.com"]))
+            await mail.close()
+
+    asyncio.run(scenario())
+    assert server.received == 1
+    assert server.messages[0][1] == ['<second@bar.com>']
+    assert server.sessions == 2
+
+
+def test_error_before_sending_keeps_session(mail_options, make_message):
+    async def scenario():
+        async with SinkServer() as server:
+            mail = AsyncMail(MAIL_PORT=server.port, **mail_options)
+            await mail.send(make_message())
+            with pytest.raises(BadHeaderError):
+                await mail.send(make_message(subject="testing\r\n"))
+            await mail.send(make_message())
+            await mail.close()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.received == 2
+    assert server.sessions == 1
+
+
+def test_async_send_many(mail_options, make_message):
+    messages = [make_message(body='message %d' % i) for i in range(5)]
+    messages[1] = make_message(["refused@bar.com"])
+    messages[2].attach('data.bin', 'application/octet-stream', iter([b'data']))
+    messages[2].as_bytes()
+
+    async def scenario():
+        async with SinkServer() as server:
+            server.add_fault('RCPT', 550, 'No such user', match='<refused')
+            mail = AsyncMail(MAIL_PORT=server.port, **mail_options)
+            results = await mail.send_many(messages, concurrency=2)
+            await mail.close()
+        return server, results
+
+    server, results = asyncio.run(scenario())
+    assert [r.message for r in results] == messages
+    assert [r.ok for r in results] == [True, False, False, True, True]
+    assert results[1].code == 550 and results[1].refused
+    assert isinstance(results[2].error, ValueError)
+    assert all(r.accepted == ['foo@bar.com'] for r in results[3:])
+    assert len(server.messages) == 3
+
+
+@pytest.mark.skipif(not aio.HAS_START_TLS, reason='needs Python 3.11')
+def test_async_starttls_verifies_certificates(make_message):
+    context = make_tls_context()
+    if context is None:
+        pytest.skip('needs the openssl command line tool')
+    unverified = ssl.create_default_context()
+    unverified.check_hostname = False
+    unverified.verify_mode = ssl.CERT_NONE
+
+    async def scenario():
+        async with SinkServer(tls_context=context) as server:
+            options = dict(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_USE_TLS=True)
+            with pytest.raises(ssl.SSLCertVerificationError):
+                await AsyncMail(**options).send(make_message())
+            mail = AsyncMail(MAIL_SSL_CONTEXT=unverified, **options)
+            await mail.send(make_message())
+            await mail.close()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.commands.count('STARTTLS') == 2
+    assert server.received == 1
+
+
+def test_async_starttls_needs_start_tls(monkeypatch):
+    monkeypatch.setattr(aio, 'HAS_START_TLS', False)
+    with pytest.raises(ValueError):
+        AsyncMail(MAIL_USE_TLS=True)
+    AsyncMail(MAIL_USE_SSL=True)
+
+
+def test_async_send_many_rejects_no_concurrency(make_message):
+    mail = AsyncMail(MAIL_SUPPRESS_SEND=True)
+    with pytest.raises(ValueError):
+        asyncio.run(mail.send_many([make_message()], concurrency=0))
@@ -4,7 +4,8 @@ import re
 import time
 from smtplib import SMTP
 from unittest.mock import patch, MagicMock
-from apistar_mail.mail import Message, Mail, force_text, sanitize_address
+from apistar_mail.mail import (Message, Mail, force_text, sanitize_address, sanitize_subject,
+                               clear_header_cache, header_cache_info)
 from apistar_mail.exc import MailUnicodeDecodeError, BadHeaderError
 
 import pytest
@@ -38,6 +39,26 @@ def test_sanitize_address_with_unicode_localpart():
     assert '=?utf-8?q?=C3=BCnicron?=' in result
 
 
+def test_sanitize_cache_hits():
+    clear_header_cache()
+    first = sanitize_address("ünicron <to@exämple.com>")
+    assert sanitize_address("ünicron <to@exämple.com>") == first
+    assert sanitize_address(["ünicron", "to@exämple.com"]) == first
+    assert sanitize_subject("Grüße") == sanitize_subject("Grüße")
+    info = header_cache_info()
+    assert info['address']['hits'] == 1
+    assert info['address']['misses'] == 1
+    assert info['subject']['hit_rate'] == 0.5
+
+
+def test_envelope_recipients_follow_changes():
+    msg = Message(subject="subject", recipients=["ünicron <to@example.com>"])
+    assert msg.envelope_recipients() == ['=?utf-8?q?=C3=BCnicron?= <to@example.com>']
+    msg.recipients.append("other@example.com")
+    assert sorted(msg.envelope_recipients()) == [
+        '=?utf-8?q?=C3=BCnicron?= <to@example.com>', 'other@example.com']
+
+
 # Message
 
 def test_message_init():
@@ -440,6 +461,93 @@ def test_message_as_bytes():
     assert bytes(msg) == msg.as_bytes()
 
 
+def test_message_rendering_is_cached():
+    msg = Message(sender="from@example.com",
+                  recipients=["foo@bar.com"],
+                  body="normal ascii text")
+    msg.attach(data=b"this is a test", content_type="text/plain")
+    with patch('apistar_mail.mail.encode_base64') as encode:
+        first = msg.as_bytes()
+        assert msg.as_bytes() is first
+        assert msg.size == len(first)
+        assert encode.call_count == 1
+
+
+def test_message_cache_invalidated_on_mutation():
+    msg = Message(sender="from@example.com",
+                  recipients=["foo@bar.com"],
+                  body="normal ascii text")
+    msg.as_bytes()
+    msg.add_recipient("bar@bar.com")
+    assert 'bar@bar.com' in msg.as_string()
+    msg.subject = "changed"
+    assert 'Subject: changed' in msg.as_string()
+    msg.html = "<p>html</p>"
+    assert 'text/html' in msg.as_string()
+    msg.attach(data=b"this is a test", content_type="text/csv")
+    assert 'text/csv' in msg.as_string()
+    msg.cc.append("cc@bar.com")
+    msg.invalidate()
+    assert 'Cc: cc@bar.com' in msg.as_string()
+
+
+def test_header_changes_reuse_rendered_body():
+    msg = Message(subject="subject",
+                  sender="from@example.com",
+                  recipients=["foo@bar.com"],
+                  body="normal ascii text")
+    msg.attach(data=b"this is a test" * 100, content_type="application/octet-stream")
+    first = msg.as_bytes()
+    body = first[first.index(b"\r\n\r\n"):]
+    with patch.object(Message, '_mime_root', wraps=msg._mime_root) as mime_root:
+        msg.recipients = ["bar@bar.com"]
+        msg.subject = "resent"
+        msg.date = time.time() + 60
+        msg.add_recipient("baz@bar.com")
+        resent = msg.as_bytes()
+        assert mime_root.call_count == 0
+        assert resent.endswith(body)
+        parsed = email.message_from_bytes(resent)
+        assert parsed['Subject'] == "resent"
+        assert set(parsed['To'].split(', ')) == {"bar@bar.com", "baz@bar.com"}
+
+        msg.body = "changed text"
+        assert b"changed text" in msg.as_bytes()
+        assert mime_root.call_count == 1
+
+
+def test_message_date_fixed_at_first_render():
+    msg = Message(sender="from@example.com",
+                  recipients=["foo@bar.com"],
+                  body="normal ascii text")
+    first = msg.as_bytes()
+    assert msg.date is not None
+    mail = Mail(**test_mail_options)
+    mail.send(msg)
+    assert msg.as_bytes() is first
+
+
+def test_message_is_compact():
+    sender = "".join(["from@", "example.com"])
+    msg = Message(sender=sender, recipients=["foo@bar.com"], body="normal ascii text")
+    assert not hasattr(msg, '__dict__')
+    assert msg._cc is None and msg._attachments is None and msg._alts is None
+    assert msg.sender is Message(sender="from@example.com").sender
+    msg.bcc.append("bcc@bar.com")
+    assert msg.send_to == {"foo@bar.com", "bcc@bar.com"}
+
+
+def test_message_id_generated_on_first_use():
+    with patch('apistar_mail.mail._make_msgid', return_value='<1@example.com>') as make_msgid:
+        msg = Message(sender="from@example.com", recipients=["foo@bar.com"])
+        assert make_msgid.call_count == 0
+        assert 'Message-ID: <1@example.com>' in msg.as_string()
+        assert msg.msgId == '<1@example.com>'
+        assert make_msgid.call_count == 1
+    msg.msgId = '<2@example.com>'
+    assert 'Message-ID: <2@example.com>' in msg.as_string()
+
+
 # Connection
 
 
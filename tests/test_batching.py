@@ -0,0 +1,61 @@
+import asyncio
+import smtplib
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+
+import pytest
+
+
+def recipients(count, prefix='user'):
+    return ['%s%d@example.com' % (prefix, i) for i in range(count)]
+
+
+def test_connection_splits_envelopes(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_MAX_RECIPIENTS=10)
+    msg = make_message(recipients(23) + ['refused@example.com'])
+    with mail.connect() as connection:
+        refused = connection.send(msg)
+
+    assert list(refused) == ['refused@example.com']
+    sizes = [len(r) for _, r, _ in threaded_smtp_server.messages]
+    assert len(sizes) == 3 and sum(sizes) == 23 and max(sizes) == 10
+    assert len(set(data for _, _, data in threaded_smtp_server.messages)) == 1
+    assert threaded_smtp_server.sessions == 1
+
+
+def test_mail_sends_batches_in_parallel(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_MAX_RECIPIENTS=5, MAIL_BATCH_CONCURRENCY=3)
+    mail.send(make_message(recipients(30)))
+
+    assert len(threaded_smtp_server.messages) == 6
+    delivered = sorted(r for _, batch, _ in threaded_smtp_server.messages for r in batch)
+    assert delivered == sorted('<%s>' % addr for addr in recipients(30))
+    assert threaded_smtp_server.sessions <= 3
+
+
+def test_all_batches_refused(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_MAX_RECIPIENTS=2)
+    with pytest.raises(smtplib.SMTPRecipientsRefused) as info:
+        mail.send(make_message(recipients(5, prefix='refused')))
+    assert len(info.value.recipients) == 5
+    assert threaded_smtp_server.messages == []
+
+
+def test_async_mail_splits_envelopes(threaded_smtp_server, make_message):
+    mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                     MAIL_MAX_RECIPIENTS=2)
+    msg = make_message(recipients(5) + ['refused@example.com'])
+
+    async def scenario():
+        refused = await mail.send_many([msg])
+        await mail.close()
+        return refused
+
+    result, = asyncio.run(scenario())
+    assert list(result.refused) == ['refused@example.com']
+    assert sorted(len(r) for _, r, _ in threaded_smtp_server.messages) == [1, 2, 2]
+    assert threaded_smtp_server.sessions == 1
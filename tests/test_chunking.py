@@ -0,0 +1,72 @@
+import asyncio
+import os
+import smtplib
+
+import pytest
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+from apistar_mail.smtp import iter_bdat
+from apistar_mail.testing import SinkServer
+
+DATA = os.urandom(300000) + b'\r\n.line\r\n'
+
+
+@pytest.fixture
+def make_message(make_message):
+    def make_attached(recipients=("foo@bar.com",)):
+        msg = make_message(recipients)
+        msg.attach(filename="data.bin", content_type="application/octet-stream", data=DATA)
+        return msg
+    return make_attached
+
+
+def test_iter_bdat_marks_last_chunk_and_ends_in_crlf():
+    commands = list(iter_bdat(b'x' * 10, chunk_size=4))
+    assert [command for command, chunk in commands] == [
+        b'BDAT 4\r\n', b'BDAT 4\r\n', b'BDAT 4 LAST\r\n']
+    assert b''.join(chunk for command, chunk in commands) == b'x' * 10 + b'\r\n'
+    assert list(iter_bdat(b'line\r\n', chunk_size=3)) == [
+        (b'BDAT 3\r\n', b'lin'), (b'BDAT 3 LAST\r\n', b'e\r\n')]
+    assert list(iter_bdat(iter([]))) == [(b'BDAT 2 LAST\r\n', b'\r\n')]
+
+
+def test_bdat_sends_message_in_pipelined_chunks(make_message):
+    msg = make_message()
+    with SinkServer() as server:
+        Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port).send(msg)
+    sender, recipients, data = server.messages[0]
+    assert data == msg.as_bytes()
+    assert 'DATA' not in server.commands
+    assert server.commands.count('BDAT') == len(data) // 65536 + 1
+
+
+def test_bdat_failures_reset_the_transaction(make_message):
+    with SinkServer() as server:
+        server.add_fault('RCPT', 550, 'No such user', match='nobody')
+        server.add_fault('MESSAGE', 554, 'Rejected', count=1)
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_POOL_SIZE=1)
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            mail.send(make_message(["nobody@bar.com"]))
+        with pytest.raises(smtplib.SMTPDataError):
+            mail.send(make_message())
+        mail.send(make_message(["nobody@bar.com", "foo@bar.com"]))
+        mail.close()
+    assert server.sessions == 1
+    assert server.received == 1
+    assert server.messages[0][1] == ['<foo@bar.com>']
+
+
+def test_async_bdat(make_message):
+    msg = make_message()
+
+    async def scenario():
+        async with SinkServer() as server:
+            mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port)
+            await mail.send(msg)
+            await mail.close()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.messages[0][2] == msg.as_bytes()
+    assert 'BDAT' in server.commands and 'DATA' not in server.commands
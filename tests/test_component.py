@@ -0,0 +1,24 @@
+import inspect
+import subprocess
+import sys
+
+from apistar_mail import AsyncMail, AsyncMailComponent, Mail, MailComponent
+
+
+def test_mail_component_does_not_import_smtp_or_aio():
+    code = ('import sys, apistar_mail; apistar_mail.MailComponent; '
+            'print(sorted(set(sys.modules) & {"smtplib", "apistar_mail.aio"}))')
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.strip() == b'[]'
+
+
+def test_components_handle_their_mail_parameters():
+    def handler(mail: Mail, async_mail: AsyncMail):
+        pass
+
+    mail, async_mail = inspect.signature(handler).parameters.values()
+    component = AsyncMailComponent(MAIL_SUPPRESS_SEND=True)
+    assert component.can_handle_parameter(async_mail)
+    assert not component.can_handle_parameter(mail)
+    assert isinstance(component.resolve(), AsyncMail)
+    assert MailComponent(MAIL_SUPPRESS_SEND=True).can_handle_parameter(mail)
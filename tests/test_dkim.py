@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import re
+
+import pytest
+
+from apistar_mail import dkim
+from apistar_mail.dkim import BodyHasher, DKIMSigner, body_hash
+from apistar_mail.mail import Mail
+from apistar_mail.template import MessageTemplate
+
+
+def sha256(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+
+
+@pytest.fixture
+def rsa_key():
+    pytest.importorskip('cryptography')
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    return key, pem
+
+
+# runs of whitespace and trailing blank lines, which relaxed canonicalization removes
+BODY = "normal  ascii text \n\n\n"
+
+
+def verify(data, public_key):
+    """Checks the signature of a message signed by DKIMSigner."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    headers, body = data.split(b'\r\n\r\n', 1)
+    fields = dkim.FIELD_END.split(headers)
+    signature_field = fields.pop(0)
+    tags = dict(tag.strip().split(b'=', 1) for tag in
+                re.sub(br'\s', b'', signature_field.partition(b':')[2]).split(b';'))
+    assert tags[b'bh'].decode('ascii') == body_hash(body)
+    by_name = dict((field.partition(b':')[0].lower(), field) for field in fields)
+    signed = b''.join(dkim._relaxed_header(by_name[name]) for name in tags[b'h'].split(b':'))
+    unsigned = re.sub(br'b=[^;]*$', b'b=', signature_field)
+    signed += dkim._relaxed_header(unsigned)[:-2]
+    public_key.verify(base64.b64decode(tags[b'b']), signed, padding.PKCS1v15(), hashes.SHA256())
+    return tags
+
+
+def test_relaxed_body_hash():
+    assert body_hash(b'') == sha256(b'')
+    assert body_hash(b'a  b \t\r\n\r\n c\r\n\r\n\r\n') == sha256(b'a b\r\n\r\n c\r\n')
+    assert body_hash(b'no newline ') == sha256(b'no newline \r\n')
+
+    data = b'line  one\r\n\r\n\tline two  \r\n' * 100 + b'\r\n' * 5
+    hasher = BodyHasher()
+    for i in range(0, len(data), 7):
+        hasher.update(data[i:i + 7])
+    assert hasher.digest() == body_hash(data)
+
+
+def test_signature_verifies_and_body_hash_is_reused(rsa_key, monkeypatch, make_message):
+    key, pem = rsa_key
+    msg = make_message(body=BODY)
+    msg.dkim = DKIMSigner('example.com', 'mail', pem)
+    tags = verify(msg.as_bytes(), key.public_key())
+    assert tags[b'a'] == b'rsa-sha256' and tags[b'd'] == b'example.com'
+    assert tags[b'h'].startswith(b'from:subject:date:message-id:to')
+
+    # a header change is signed again, without hashing the body again
+    monkeypatch.setattr('apistar_mail.dkim.body_hash', None)
+    msg.recipients = ['other@bar.com']
+    assert verify(msg.as_bytes(), key.public_key())[b'bh'] == tags[b'bh']
+
+
+def test_template_messages_share_body_hash(rsa_key):
+    key, pem = rsa_key
+    signer = DKIMSigner('example.com', 'mail', pem)
+    template = MessageTemplate(subject="Hi $name", sender="from@example.com",
+                               body="static text")
+    template.attach('data.bin', 'application/octet-stream', b'x' * 10000)
+    messages = [template.render(['%s@bar.com' % name], name=name) for name in ('a', 'b')]
+    for msg in messages:
+        msg.dkim = signer
+        verify(msg.as_bytes(), key.public_key())
+    assert messages[0]._body_bytes is messages[1]._body_bytes
+    assert messages[0]._body_bytes.body_hash is not None
+
+
+def test_mail_signs_with_key_parsed_once(rsa_key, monkeypatch, make_message):
+    key, pem = rsa_key
+    mail = Mail(MAIL_SUPPRESS_SEND=True, MAIL_DKIM_KEY=pem.decode('ascii'),
+                MAIL_DKIM_DOMAIN='example.com', MAIL_DKIM_SELECTOR='mail')
+    loads = []
+    load_key = DKIMSigner._load_key
+    monkeypatch.setattr(DKIMSigner, '_load_key', lambda self: loads.append(1) or load_key(self))
+    with mail.record_messages() as outbox:
+        for i in range(3):
+            mail.send(make_message(body=BODY))
+    assert len(loads) == 1
+    for recorded in outbox:
+        verify(recorded.data, key.public_key())
@@ -0,0 +1,75 @@
+import random
+import socket
+
+from apistar_mail.hosts import CircuitBreaker, RelayHost, RelaySelector
+from apistar_mail.mail import Mail
+
+
+class Clock:
+    now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_circuit_breaker_opens_and_resets():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.failure()
+    assert breaker.healthy
+    breaker.failure()
+    assert not breaker.healthy
+    clock.now += 10
+    assert breaker.healthy
+    # a failed trial opens the breaker again straight away
+    breaker.failure()
+    assert not breaker.healthy
+    clock.now += 10
+    breaker.success()
+    breaker.failure()
+    assert breaker.healthy
+
+
+def test_selector_from_config():
+    selector = RelaySelector.from_config(
+        ['a.example.com', 'b.example.com:2525', ('c.example.com', 26, 5),
+         {'server': 'd.example.com', 'weight': 2}, RelayHost('e.example.com')],
+        default_port=587)
+    assert [(h.server, h.port, h.weight) for h in selector.hosts] == [
+        ('a.example.com', 587, 1), ('b.example.com', 2525, 1), ('c.example.com', 26, 5),
+        ('d.example.com', 587, 2), ('e.example.com', 25, 1)]
+
+
+def test_selector_weights_and_routes_around_failures():
+    clock = Clock()
+    heavy, light = RelayHost('heavy', weight=3), RelayHost('light', weight=1)
+    selector = RelaySelector([heavy, light], failure_threshold=1, reset_timeout=10,
+                             slow_threshold=1, clock=clock)
+    random.seed(1)
+    firsts = [selector.candidates()[0] for _ in range(2000)]
+    assert 0.65 < firsts.count(heavy) / len(firsts) < 0.85
+
+    selector.success(heavy, duration=5)
+    assert selector.healthy() == [light]
+    assert selector.candidates() == [light, heavy]
+    clock.now += 10
+    assert selector.healthy() == [heavy, light]
+
+
+def test_mail_fails_over_to_healthy_relay(threaded_smtp_server, make_message):
+    dead = RelayHost('127.0.0.1', unused_port(), weight=100)
+    live = RelayHost('127.0.0.1', threaded_smtp_server.port)
+    mail = Mail(MAIL_SERVERS=[dead, live], MAIL_HOST_FAILURE_THRESHOLD=1)
+    for i in range(5):
+        mail.send(make_message())
+
+    assert len(threaded_smtp_server.messages) == 5
+    assert mail.relays.healthy() == [live]
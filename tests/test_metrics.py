@@ -0,0 +1,76 @@
+import asyncio
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+from apistar_mail.metrics import Histogram, InMemoryCollector, Instrumentation, format_prometheus
+
+import pytest
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.1, 1, float('inf')))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(value)
+    assert histogram.count == 4
+    assert histogram.buckets == [(0.1, 1), (1, 3), (float('inf'), 4)]
+
+
+def test_signals_and_unknown_signal():
+    instrumentation = Instrumentation()
+    events = []
+    instrumentation.connect('before', lambda phase: events.append(('before', phase)))
+    instrumentation.connect('after', lambda phase, duration, error:
+                            events.append(('after', phase, type(error))))
+    with instrumentation.phase('build'):
+        pass
+    with pytest.raises(ValueError):
+        with instrumentation.phase('connect'):
+            raise ValueError('boom')
+    assert events == [('before', 'build'), ('after', 'build', type(None)),
+                      ('before', 'connect'), ('after', 'connect', ValueError)]
+    with pytest.raises(ValueError):
+        instrumentation.connect('during', print)
+
+
+def test_send_records_phases_and_counters(threaded_smtp_server, make_message):
+    collector = InMemoryCollector()
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_MAX_EMAILS=2, MAIL_INSTRUMENTATION=Instrumentation([collector]))
+    with mail.connect() as connection:
+        for i in range(3):
+            connection.send(make_message(["foo@bar.com", "refused@bar.com"]))
+
+    assert collector.counters['messages'] == 3
+    assert collector.counters['recipients'] == 3
+    assert collector.counters['refused'] == 3
+    assert collector.counters['recycles'] == 1
+    # the server's copy ends with the CRLF added before the end-of-data marker
+    assert collector.counters['bytes'] == sum(len(data) - 2 for _, _, data
+                                              in threaded_smtp_server.messages)
+    for phase in ('sanitize', 'build', 'connect', 'sendmail', 'envelope', 'data', 'quit'):
+        assert collector.histograms[phase].count >= 1
+    assert collector.histograms['connect'].count == 2
+    assert 'login' not in collector.histograms
+
+    text = format_prometheus(collector)
+    assert '# TYPE apistar_mail_phase_seconds histogram' in text
+    assert 'apistar_mail_phase_seconds_count{phase="build"} 3' in text
+    assert 'apistar_mail_phase_seconds_bucket{phase="build",le="+Inf"} 3' in text
+    assert 'apistar_mail_messages_total 3' in text
+
+
+def test_async_send_records_phases(smtp_server, make_message):
+    collector = InMemoryCollector()
+
+    async def run():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_server.port,
+                         MAIL_INSTRUMENTATION=Instrumentation([collector]))
+        await mail.send(make_message())
+        await mail.close()
+        await smtp_server.stop()
+
+    asyncio.run(run())
+    assert collector.counters['messages'] == 1
+    assert collector.histograms['envelope'].count == 1
+    assert collector.histograms['quit'].count == 1
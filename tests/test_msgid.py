@@ -0,0 +1,58 @@
+import os
+import re
+from unittest.mock import patch
+
+import pytest
+
+from apistar_mail.mail import Message, Mail
+from apistar_mail.msgid import MessageIdGenerator
+
+
+def test_ids_are_unique_and_well_formed():
+    make_msgid = MessageIdGenerator('mail.example.com')
+    ids = [make_msgid() for _ in range(1000)]
+    assert len(set(ids)) == 1000
+    assert all(re.match(r'^<[\w.]+@mail\.example\.com>$', each) for each in ids)
+
+
+def test_domain_resolved_once():
+    make_msgid = MessageIdGenerator()
+    with patch('socket.getfqdn', return_value='host.example.com') as getfqdn:
+        assert make_msgid().endswith('@host.example.com>')
+        make_msgid()
+        assert getfqdn.call_count == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_children_do_not_repeat_ids():
+    make_msgid = MessageIdGenerator('example.com')
+    parent_ids = {make_msgid() for _ in range(10)}
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.write(write_end, '\n'.join(make_msgid() for _ in range(10)).encode('ascii'))
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as fp:
+        child_ids = set(fp.read().split('\n'))
+    os.waitpid(pid, 0)
+    assert len(child_ids) == 10
+    assert not parent_ids & child_ids
+
+
+def test_mail_msgid_domain():
+    mail = Mail(MAIL_SUPPRESS_SEND=True, MAIL_MSGID_DOMAIN='mail.example.com')
+    msg = Message(subject="subject", sender="from@example.com",
+                  recipients=["foo@bar.com"], body="normal ascii text")
+    with patch('socket.getfqdn') as getfqdn:
+        mail.send(msg)
+        assert getfqdn.call_count == 0
+    assert msg.msgId.endswith('@mail.example.com>')
+    assert 'Message-ID: %s' % msg.msgId in msg.as_string()
+
+    # an ID already given to the message is kept
+    msg = Message(sender="from@example.com", recipients=["foo@bar.com"])
+    msg.msgId = '<mine@example.com>'
+    mail.send(msg)
+    assert msg.msgId == '<mine@example.com>'
@@ -0,0 +1,82 @@
+import asyncio
+import io
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+from apistar_mail.outbox import Outbox
+
+import pytest
+
+
+def test_record_suppressed_messages(make_message):
+    mail = Mail(MAIL_SUPPRESS_SEND=True)
+    msg = make_message()
+    with mail.record_messages() as outbox:
+        mail.send(msg)
+        mail.send_message(subject="second", sender="from@example.com",
+                          recipients=["bar@bar.com"])
+    mail.send(make_message())
+
+    assert len(outbox) == 2
+    assert outbox[0].data is msg.as_bytes()
+    assert outbox[0].sender == "from@example.com"
+    assert outbox[0].recipients == ["foo@bar.com"]
+    assert outbox[1].subject == "second"
+    assert outbox.bytes == outbox.recorded_bytes == sum(m.size for m in outbox)
+    assert mail.outboxes == []
+
+
+def test_outbox_is_bounded():
+    outbox = Outbox(max_messages=3, max_bytes=250)
+    for i in range(10):
+        outbox.record("a@b.com", ["c@d.com"], b"x" * 100)
+    assert len(outbox) == 2
+    assert outbox.bytes == 200
+    assert outbox.recorded == 10 and outbox.dropped == 8
+    outbox.record("a@b.com", ["c@d.com"], b"x" * 1000)
+    assert len(outbox) == 2 and outbox.dropped == 9
+
+    outbox = Outbox(max_messages=3)
+    for i in range(10):
+        outbox.record("a@b.com", ["c%d@d.com" % i], b"x")
+    assert [m.recipients[0] for m in outbox] == ["c7@d.com", "c8@d.com", "c9@d.com"]
+
+
+def test_streamed_messages_are_sized_or_recorded_as_envelopes(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port)
+    with mail.record_messages(max_bytes=100000) as outbox:
+        for data in (io.BytesIO(b"x" * 50000), iter([b"x" * 50000])):
+            msg = make_message()
+            msg.attach("data.bin", "application/octet-stream", data)
+            mail.send(msg)
+    assert len(threaded_smtp_server.messages) == 2
+
+    # a seekable file is read again to render the recorded message
+    assert outbox[0].size == len(outbox[0].data) == len(threaded_smtp_server.messages[0][2])
+    # an iterator was consumed by sending, so only the envelope is kept
+    assert outbox[1].size == 0 and outbox[1].recipients == ["foo@bar.com"]
+    with pytest.raises(ValueError):
+        outbox[1].data
+    assert outbox.bytes == outbox[0].size
+
+
+def test_outbox_option_records_sent_messages(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_OUTBOX_SIZE=10)
+    mail.send(make_message(recipients=["foo@bar.com", "refused@bar.com"]))
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].recipients == ["foo@bar.com"]
+    assert len(threaded_smtp_server.messages) == 1
+
+
+def test_async_record_messages(make_message):
+    mail = AsyncMail(MAIL_SUPPRESS_SEND=True)
+
+    async def scenario():
+        with mail.record_messages() as outbox:
+            await mail.send(make_message())
+        return outbox
+
+    outbox = asyncio.run(scenario())
+    assert len(outbox) == 1
+    assert outbox[0].message['To'] == "foo@bar.com"
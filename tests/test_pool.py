@@ -0,0 +1,144 @@
+import smtplib
+import threading
+from smtplib import SMTP
+from unittest.mock import patch, MagicMock
+
+from apistar_mail.exc import BadHeaderError
+from apistar_mail.mail import Mail
+from apistar_mail.pool import ConnectionPool
+
+import pytest
+
+
+@pytest.fixture
+def mail_options(mail_options):
+    return dict(mail_options, MAIL_PORT=587, MAIL_USE_TLS=True, MAIL_POOL_SIZE=2)
+
+
+def smtp_factory(*args):
+    host = MagicMock(spec=SMTP)
+    host.noop.return_value = (250, b'OK')
+    return host
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_reuses_connection(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(**mail_options)
+    for i in range(5):
+        mail.send(make_message())
+    assert mock_smtp.call_count == 1
+    mail.close()
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_reconnects_when_noop_fails(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(**mail_options)
+    mail.send(make_message())
+    conn, _ = mail.pool._idle[0]
+    conn.host.noop.side_effect = smtplib.SMTPServerDisconnected
+    mail.send(make_message())
+    assert mock_smtp.call_count == 2
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_reconnects_on_server_disconnected(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(**mail_options)
+    mail.send(make_message())
+    conn, _ = mail.pool._idle[0]
+    conn.host.sendmail.side_effect = smtplib.SMTPServerDisconnected
+    mail.send(make_message())
+    assert mock_smtp.call_count == 2
+    assert conn.host.sendmail.called
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_closes_idle_connections(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(MAIL_POOL_IDLE_TIMEOUT=0, **mail_options)
+    mail.send(make_message())
+    conn, _ = mail.pool._idle[0]
+    stale = conn.host
+    mail.send(make_message())
+    assert stale.quit.called
+    assert mock_smtp.call_count == 2
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_honours_max_emails(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(MAIL_MAX_EMAILS=3, **mail_options)
+    for i in range(7):
+        mail.send(make_message())
+    assert mock_smtp.call_count == 3
+
+
+def test_pool_limits_open_connections():
+    opened = []
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    class FakeConnection:
+        def open(self):
+            opened.append(self)
+            return self
+
+        def close(self):
+            pass
+
+        def is_alive(self):
+            return True
+
+    pool = ConnectionPool(FakeConnection, size=2)
+
+    def worker():
+        for i in range(20):
+            with pool.connection() as conn:
+                with lock:
+                    in_use.append(conn)
+                    peak.append(len(in_use))
+                with lock:
+                    in_use.remove(conn)
+
+    threads = [threading.Thread(target=worker) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(opened) <= 2
+    assert max(peak) <= 2
+    pool.close()
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_drops_connection_interrupted_mid_send(mock_smtp, mail_options, make_message):
+    hosts = []
+    mock_smtp.side_effect = lambda *args: hosts.append(smtp_factory()) or hosts[-1]
+    mail = Mail(**mail_options)
+    with patch('apistar_mail.smtp.sendmail', side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            mail.send(make_message())
+    # closed without QUIT, since replies may be left unread
+    hosts[0].close.assert_called_once_with()
+    hosts[0].quit.assert_not_called()
+    assert mail.pool._idle == []
+    mail.send(make_message())
+    assert mock_smtp.call_count == 2
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_pool_keeps_connection_on_error_before_sending(mock_smtp, mail_options, make_message):
+    mock_smtp.side_effect = smtp_factory
+    mail = Mail(**mail_options)
+    mail.send(make_message())
+    with pytest.raises(BadHeaderError):
+        mail.send(make_message(subject="testing\r\n"))
+    with pytest.raises(KeyboardInterrupt):
+        with mail.pool.connection():
+            raise KeyboardInterrupt
+    mail.send(make_message())
+    assert mock_smtp.call_count == 1
@@ -0,0 +1,97 @@
+import asyncio
+import smtplib
+from unittest.mock import patch
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail, Message
+from apistar_mail.retry import RetryPolicy
+
+import pytest
+
+
+@pytest.fixture
+def mail_options(mail_options):
+    return dict(mail_options, MAIL_SUPPRESS_SEND=True, MAIL_RETRY_ATTEMPTS=3, MAIL_RETRY_BACKOFF=0)
+
+
+def test_policy_classifies_failures():
+    policy = RetryPolicy()
+    assert policy.is_transient(smtplib.SMTPDataError(451, b'later'))
+    assert not policy.is_transient(smtplib.SMTPDataError(554, b'no'))
+    assert policy.is_transient(smtplib.SMTPServerDisconnected())
+    assert policy.is_transient(ConnectionResetError())
+    assert policy.is_transient(smtplib.SMTPRecipientsRefused({'a': (450, b'')}))
+    assert not policy.is_transient(smtplib.SMTPRecipientsRefused({'a': (550, b'')}))
+    assert policy.split_refused({'a': (450, b''), 'b': (550, b'')}) == (['a'], {'b': (550, b'')})
+
+
+def test_policy_backs_off_with_jitter():
+    policy = RetryPolicy(backoff=1, max_backoff=5, jitter=0.5)
+    assert 0.5 <= policy.delay(1) <= 1
+    assert 1 <= policy.delay(2) <= 2
+    assert 2.5 <= policy.delay(10) <= 5
+    assert RetryPolicy(jitter=0).delay(3) == 4
+
+
+def test_retries_only_temporarily_refused_recipients(mail_options):
+    mail = Mail(**mail_options)
+    with mail.connect() as conn:
+        with patch.object(conn, 'host') as host:
+            host.sendmail.side_effect = [
+                {'b@example.com': (451, b'later'), 'c@example.com': (550, b'no')},
+                {},
+            ]
+            refused = conn.send_raw('fake@example.com',
+                                    ['a@example.com', 'b@example.com', 'c@example.com'],
+                                    b'data')
+            assert host.sendmail.call_args[0][1] == ['b@example.com']
+    assert refused == {'c@example.com': (550, b'no')}
+
+
+def test_retries_transient_failure_until_attempts_run_out(mail_options):
+    mail = Mail(**mail_options)
+    with mail.connect() as conn:
+        with patch.object(conn, 'host') as host:
+            host.sendmail.side_effect = smtplib.SMTPDataError(451, b'later')
+            with pytest.raises(smtplib.SMTPDataError):
+                conn.send_raw('fake@example.com', ['a@example.com'], b'data')
+            assert host.sendmail.call_count == 3
+
+
+def test_does_not_retry_permanent_failure(mail_options):
+    mail = Mail(**mail_options)
+    with mail.connect() as conn:
+        with patch.object(conn, 'host') as host:
+            host.sendmail.side_effect = smtplib.SMTPDataError(554, b'no')
+            with pytest.raises(smtplib.SMTPDataError):
+                conn.send_raw('fake@example.com', ['a@example.com'], b'data')
+            assert host.sendmail.call_count == 1
+
+
+def test_reports_recipients_still_refused_after_retries(mail_options):
+    mail = Mail(**mail_options)
+    with mail.connect() as conn:
+        with patch.object(conn, 'host') as host:
+            host.sendmail.side_effect = [
+                {'b@example.com': (451, b'later')},
+                smtplib.SMTPRecipientsRefused({'b@example.com': (451, b'later')}),
+                smtplib.SMTPRecipientsRefused({'b@example.com': (451, b'later')}),
+            ]
+            refused = conn.send_raw('fake@example.com', ['a@example.com', 'b@example.com'],
+                                    b'data')
+    assert refused == {'b@example.com': (451, b'later')}
+
+
+def test_async_retries_temporarily_refused_recipients(smtp_server):
+    async def scenario():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_server.port,
+                         MAIL_DEFAULT_SENDER='fake@example.com',
+                         MAIL_RETRY_ATTEMPTS=2, MAIL_RETRY_BACKOFF=0)
+        await mail.send(Message(recipients=['foo@bar.com', 'busy@bar.com'], body='text'))
+        await mail.close()
+        await smtp_server.stop()
+
+    asyncio.run(scenario())
+    assert [recipients for _, recipients, _ in smtp_server.messages] == [
+        ['<foo@bar.com>'], ['<busy@bar.com>']]
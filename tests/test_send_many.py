@@ -0,0 +1,133 @@
+import email
+from smtplib import SMTP
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from apistar_mail.mail import Attachment, Message, Mail
+
+
+def test_send_many_pipelines_envelopes(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com')
+    messages = [make_message(body='message %d' % i) for i in range(20)]
+    results = mail.send_many(messages, concurrency=4)
+
+    assert [r.message for r in results] == messages
+    assert all(r.ok and r.code == 250 for r in results)
+    assert results[0].accepted == ['foo@bar.com']
+    assert len(threaded_smtp_server.messages) == 20
+    assert threaded_smtp_server.sessions == 4
+
+
+def test_send_many_reports_refusals(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com')
+    partial = make_message(["foo@bar.com", "refused@bar.com"])
+    refused = make_message(["refused@bar.com"])
+    sent = make_message()
+    results = mail.send_many([partial, refused, sent], concurrency=1)
+
+    assert results[0].ok
+    assert results[0].accepted == ['foo@bar.com']
+    assert results[0].refused['refused@bar.com'][0] == 550
+    assert not results[1].ok
+    assert results[1].code == 550
+    assert results[2].ok
+    assert len(threaded_smtp_server.messages) == 2
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_send_many_continues_after_failure(mock_smtp, make_message):
+    host = MagicMock(spec=SMTP)
+    host.sendmail.side_effect = [OSError('boom'), {}]
+    mock_smtp.return_value = host
+    mail = Mail(MAIL_DEFAULT_SENDER='fake@example.com')
+    results = mail.send_many([make_message(), make_message()])
+
+    assert isinstance(results[0].error, OSError)
+    assert results[1].ok
+    assert mock_smtp.call_count == 2
+
+
+def test_send_many_suppressed(make_message):
+    mail = Mail(MAIL_SUPPRESS_SEND=True, MAIL_DEFAULT_SENDER='fake@example.com')
+    results = mail.send_many([make_message(), Message(subject="no recipients")],
+                             concurrency=2)
+    assert results[0].ok
+    assert isinstance(results[1].error, AssertionError)
+
+
+def test_send_many_reports_other_failures(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com')
+    messages = [make_message(body='message %d' % i) for i in range(3)]
+    # an iterator can only be sent once, and rendering the message consumed it
+    messages[1].attach('data.bin', 'application/octet-stream', iter([b'data']))
+    messages[1].as_bytes()
+    results = mail.send_many(messages)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, ValueError)
+    assert len(threaded_smtp_server.messages) == 2
+
+
+def test_send_many_in_processes(threaded_smtp_server, tmp_path, make_message):
+    path = tmp_path / "terms.txt"
+    path.write_bytes(b"the terms and conditions\n" * 100)
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com', MAIL_INSTRUMENTATION=None)
+    messages = [make_message(body='message %d' % i) for i in range(9)]
+    messages[0].attachments.append(Attachment.from_path(str(path)))
+    messages.append(make_message(["refused@bar.com"]))
+    results = mail.send_many(iter(messages), concurrency=2, executor='process', chunk_size=2)
+
+    assert [r.message for r in results] == messages
+    assert all(r.ok and r.accepted == ['foo@bar.com'] for r in results[:9])
+    assert results[9].code == 550
+    assert len(threaded_smtp_server.messages) == 9
+    sent = dict((email.message_from_bytes(data)['Message-ID'], data)
+                for _, _, data in threaded_smtp_server.messages)
+    assert b'terms.txt' in sent[messages[0].msgId]
+
+
+def test_send_many_in_processes_uses_msgid_domain(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com', MAIL_INSTRUMENTATION=None,
+                MAIL_MSGID_DOMAIN='mail.example.org')
+    messages = [make_message(body='message %d' % i) for i in range(3)]
+    results = mail.send_many(messages, concurrency=2, executor='process', chunk_size=1)
+
+    assert all(r.ok for r in results)
+    sent = [email.message_from_bytes(data)['Message-ID']
+            for _, _, data in threaded_smtp_server.messages]
+    assert sorted(sent) == sorted(m.msgId for m in messages)
+    assert all(msg_id.endswith('@mail.example.org>') for msg_id in sent)
+
+
+def test_send_many_in_processes_reports_broken_messages(threaded_smtp_server, tmp_path,
+                                                        make_message):
+    path = tmp_path / "gone.txt"
+    path.write_bytes(b"removed before the worker opens it\n")
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_DEFAULT_SENDER='fake@example.com', MAIL_INSTRUMENTATION=None)
+    messages = [make_message(body='message %d' % i) for i in range(3)]
+    messages[1].attachments.append(Attachment.from_path(str(path)))
+    path.unlink()
+    results = mail.send_many(messages, concurrency=1, executor='process', chunk_size=3)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, FileNotFoundError)
+    assert len(threaded_smtp_server.messages) == 2
+
+
+def test_send_many_rejects_unknown_executor():
+    with pytest.raises(ValueError):
+        Mail().send_many([], executor='fibers')
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_send_many_rejects_no_concurrency(executor, make_message):
+    with pytest.raises(ValueError):
+        Mail(MAIL_SUPPRESS_SEND=True).send_many([make_message()], concurrency=0,
+                                                executor=executor)
@@ -0,0 +1,76 @@
+import queue
+import threading
+from smtplib import SMTP
+from unittest.mock import patch, MagicMock
+
+from apistar_mail.exc import BadHeaderError
+from apistar_mail.mail import Mail
+from apistar_mail.sendqueue import SendQueue
+
+import pytest
+
+
+@pytest.fixture
+def mail_options(mail_options):
+    return dict(mail_options, MAIL_ASYNC_QUEUE=True, MAIL_WORKERS=2)
+
+
+def test_queue_resolves_futures():
+    sent = []
+    send_queue = SendQueue(sent.append, workers=3)
+    futures = [send_queue.put(i) for i in range(30)]
+    assert send_queue.flush(timeout=5)
+    assert all(f.done() for f in futures)
+    assert sorted(sent) == list(range(30))
+    assert send_queue.close()
+
+
+def test_queue_sets_exceptions():
+    def send(message):
+        raise ValueError(message)
+
+    send_queue = SendQueue(send)
+    future = send_queue.put('boom')
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    send_queue.close()
+
+
+def test_queue_applies_backpressure():
+    release = threading.Event()
+    send_queue = SendQueue(lambda message: release.wait(), maxsize=1, timeout=0.05)
+    send_queue.put(1)
+    send_queue.put(2)
+    # the worker holds one message and the queue holds another
+    with pytest.raises(queue.Full):
+        send_queue.put(3)
+    assert not send_queue.flush(timeout=0.01)
+    release.set()
+    assert send_queue.close(timeout=5)
+
+
+def test_closed_queue_refuses_messages():
+    send_queue = SendQueue(lambda message: None)
+    send_queue.close()
+    with pytest.raises(RuntimeError):
+        send_queue.put(1)
+
+
+@patch('apistar_mail.mail.smtplib.SMTP')
+def test_mail_send_returns_future(mock_smtp, mail_options, make_message):
+    mock_smtp.return_value = MagicMock(spec=SMTP)
+    mock_smtp.return_value.noop.return_value = (250, b'OK')
+    mail = Mail(**mail_options)
+    futures = [mail.send(make_message()) for i in range(10)]
+    assert mail.flush(timeout=5)
+    assert all(f.result() is None for f in futures)
+    assert mock_smtp.return_value.sendmail.call_count == 10
+    assert mock_smtp.call_count <= 2
+    assert mail.close()
+
+
+def test_mail_send_verifies_before_queueing(mail_options, make_message):
+    mail = Mail(MAIL_SUPPRESS_SEND=True, **mail_options)
+    with pytest.raises(BadHeaderError):
+        mail.send(make_message(subject="testing\r\n"))
+    mail.close()
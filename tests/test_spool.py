@@ -0,0 +1,184 @@
+import asyncio
+import smtplib
+import threading
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.exc import SpoolLockedError
+from apistar_mail.mail import Mail
+from apistar_mail.retry import RetryPolicy
+from apistar_mail.spool import Spool, SpoolWorker
+
+import pytest
+
+
+def test_spool_round_trip(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com'], b'first', ['SMTPUTF8'])
+    spool.put('from@example.com', ['baz@bar.com'], b'second\nmessage')
+    entries = spool.pending()
+    assert [e.to_addrs for e in entries] == [['foo@bar.com'], ['baz@bar.com']]
+    assert entries[0].mail_options == ['SMTPUTF8']
+    with spool.open_body(entries[1]) as body:
+        assert len(body) == len(b'second\nmessage')
+        assert body.readline() == b'second\n'
+        assert body.read() == b'message'
+
+    spool.mark_done(entries[0])
+    spool.close()
+
+    reopened = Spool(str(tmpdir))
+    assert [e.to_addrs for e in reopened.pending()] == [['baz@bar.com']]
+    reopened.close()
+
+
+def test_spool_drops_torn_record(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com'], b'complete')
+    spool.close()
+    with open(spool.log_path, 'ab') as fp:
+        fp.write(b'100 {"from":"from@example.com","to":[]}\npartial')
+
+    reopened = Spool(str(tmpdir))
+    assert len(reopened.pending()) == 1
+    reopened.put('from@example.com', ['baz@bar.com'], b'after')
+    assert [e.to_addrs for e in reopened.pending()] == [['foo@bar.com'], ['baz@bar.com']]
+    reopened.close()
+
+
+def test_worker_retries_and_compacts(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com'], b'data')
+    calls = []
+
+    def deliver(entry, body):
+        calls.append(body.read())
+        if len(calls) == 1:
+            raise smtplib.SMTPResponseException(451, b'try again')
+
+    worker = SpoolWorker(spool, deliver, policy=RetryPolicy(attempts=3, backoff=0))
+    assert worker.flush(timeout=5)
+    assert calls == [b'data', b'data']
+    assert spool.pending() == []
+    assert spool.compact() is False
+    assert tmpdir.join('spool.log').size() == 0
+    spool.close()
+
+
+def test_worker_gives_up_on_permanent_failure(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com'], b'data')
+    calls = []
+
+    def deliver(entry, body):
+        calls.append(entry)
+        raise smtplib.SMTPResponseException(550, b'no')
+
+    worker = SpoolWorker(spool, deliver)
+    assert worker.run_once() == 0
+    assert worker.run_once() == 0
+    assert len(calls) == 1
+    spool.close()
+
+
+def test_mail_send_spools_and_replays(tmpdir, threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_SPOOL_PATH=str(tmpdir), MAIL_SPOOL_REPLAY=False)
+    msg = make_message()
+    mail.send(msg)
+    assert threaded_smtp_server.messages == []
+    assert len(mail.spool.pending()) == 1
+
+    assert mail.flush(timeout=5)
+    mail.close()
+
+    sender, recipients, data = threaded_smtp_server.messages[0]
+    assert sender == '<from@example.com>'
+    assert recipients == ['<foo@bar.com>']
+    assert data == msg.as_bytes() + b'\r\n'
+
+
+def test_spool_worker_delivers_in_background(tmpdir, threaded_smtp_server, make_message):
+    threaded_smtp_server.features = ()
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_SPOOL_PATH=str(tmpdir))
+    for i in range(3):
+        mail.send(make_message())
+    assert mail.flush(timeout=5)
+    mail.close()
+    assert len(threaded_smtp_server.messages) == 3
+
+
+def test_async_mail_spool_replays(tmpdir, threaded_smtp_server, make_message):
+    mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                     MAIL_SPOOL_PATH=str(tmpdir), MAIL_SPOOL_REPLAY=False)
+    msg = make_message()
+
+    async def scenario():
+        await mail.send(msg)
+        assert mail.flush(timeout=5)
+        await mail.close()
+
+    asyncio.run(scenario())
+    assert len(threaded_smtp_server.messages) == 1
+    assert threaded_smtp_server.messages[0][2] == msg.as_bytes() + b'\r\n'
+
+
+def test_spool_directory_is_locked(tmpdir):
+    spool = Spool(str(tmpdir))
+    with pytest.raises(SpoolLockedError):
+        Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com'], b'kept')
+    spool.close()
+
+    reopened = Spool(str(tmpdir))
+    assert len(reopened.pending()) == 1
+    reopened.close()
+
+
+def test_worker_respools_recipients_refused_for_now(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.put('from@example.com', ['foo@bar.com', 'busy@bar.com', 'gone@bar.com'], b'data')
+    calls = []
+
+    def deliver(entry, body):
+        calls.append((entry.to_addrs, body.read()))
+        if len(calls) == 1:
+            return {'busy@bar.com': (451, b'try again'), 'gone@bar.com': (550, b'no')}
+        return {}
+
+    worker = SpoolWorker(spool, deliver, policy=RetryPolicy(attempts=3, backoff=0))
+    assert worker.flush(timeout=5)
+    assert calls == [(['foo@bar.com', 'busy@bar.com', 'gone@bar.com'], b'data'),
+                     (['busy@bar.com'], b'data')]
+    assert spool.pending() == []
+    spool.close()
+
+
+def test_mail_spool_retries_temporarily_refused_recipient(tmpdir, threaded_smtp_server,
+                                                          make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_SPOOL_PATH=str(tmpdir), MAIL_SPOOL_REPLAY=False, MAIL_RETRY_BACKOFF=0)
+    mail.send(make_message(["foo@bar.com", "busy@bar.com"]))
+    assert mail.flush(timeout=5)
+    mail.close()
+    assert [recipients for _, recipients, _ in threaded_smtp_server.messages] == [
+        ['<foo@bar.com>'], ['<busy@bar.com>']]
+
+
+def test_async_mail_spools_off_the_event_loop(tmpdir, make_message):
+    mail = AsyncMail(MAIL_SPOOL_PATH=str(tmpdir), MAIL_SPOOL_REPLAY=False)
+    put = mail.spool.put
+    threads = []
+
+    def recording_put(*args):
+        threads.append(threading.get_ident())
+        return put(*args)
+
+    mail.spool.put = recording_put
+
+    async def scenario():
+        await mail.send(make_message())
+        await mail.close()
+
+    asyncio.run(scenario())
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
@@ -0,0 +1,155 @@
+import email
+import io
+import os
+import pathlib
+
+from apistar_mail import mail as mail_module
+from apistar_mail.mail import (Attachment, Mail, clear_encoded_file_cache,
+                               encoded_file_cache_info)
+from apistar_mail.smtp import iter_quoted
+
+import pytest
+
+DATA = os.urandom(200000) + b'\n.line\n'
+
+
+@pytest.fixture
+def make_message(make_message):
+    def make_attached(data, **kwargs):
+        msg = make_message()
+        msg.attach(content_type="application/octet-stream", data=data, **kwargs)
+        return msg
+    return make_attached
+
+
+def attachment_payload(raw):
+    part = email.message_from_bytes(raw).get_payload()[1]
+    return part.get_payload(), part.get_payload(decode=True), part.get_filename()
+
+
+def test_path_matches_in_memory_encoding(tmpdir, make_message):
+    path = pathlib.Path(str(tmpdir.join('data.bin')))
+    path.write_bytes(DATA)
+    streamed = make_message(path)
+    in_memory = make_message(DATA, filename='data.bin')
+
+    assert streamed.streamed
+    encoded, decoded, filename = attachment_payload(streamed.as_bytes())
+    assert decoded == DATA
+    assert filename == 'data.bin'
+    assert encoded == attachment_payload(in_memory.as_bytes())[0]
+    assert streamed.size == len(streamed.as_bytes())
+    # a path can be read any number of times
+    assert streamed.as_bytes() == streamed.as_bytes()
+
+
+def test_file_object_is_rewound(make_message):
+    fp = io.BytesIO(b'header' + DATA)
+    fp.read(6)
+    msg = make_message(fp, filename='data.bin')
+    assert attachment_payload(msg.as_bytes())[1] == DATA
+    assert attachment_payload(msg.as_bytes())[1] == DATA
+
+
+def test_iterator_is_single_use(make_message):
+    chunks = iter([DATA[:1000], DATA[1000:1001], DATA[1001:]])
+    msg = make_message(chunks, filename='data.bin')
+    assert msg.size is None
+    stream = msg.stream()
+    with pytest.raises(TypeError):
+        len(stream)
+    assert attachment_payload(b''.join(stream))[1] == DATA
+    with pytest.raises(ValueError):
+        msg.as_bytes()
+
+
+def test_iter_quoted_across_chunks():
+    chunks = [b'one\r', b'\n.two', b'.three\r\n', b'.', b'four']
+    assert b''.join(iter_quoted(iter(chunks))) == b'one\r\n..two.three\r\n..four\r\n.\r\n'
+
+
+def test_send_streams_attachment(tmpdir, threaded_smtp_server, make_message):
+    path = pathlib.Path(str(tmpdir.join('data.bin')))
+    path.write_bytes(DATA)
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port)
+    msg = make_message(path)
+    mail.send(msg)
+    mail.send(make_message(iter([DATA]), filename='data.bin'))
+
+    assert len(threaded_smtp_server.messages) == 2
+    for sender, recipients, data in threaded_smtp_server.messages:
+        assert attachment_payload(data)[1] == DATA
+    assert threaded_smtp_server.messages[0][2] == msg.as_bytes()
+
+
+def test_spool_streams_attachment(tmpdir, threaded_smtp_server, make_message):
+    path = pathlib.Path(str(tmpdir.join('data.bin')))
+    path.write_bytes(DATA)
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_SPOOL_PATH=str(tmpdir.join('spool')), MAIL_SPOOL_REPLAY=False)
+    mail.send(make_message(path))
+    mail.send(make_message(iter([DATA]), filename='data.bin'))
+    assert mail.flush(timeout=5)
+    mail.close()
+
+    assert len(threaded_smtp_server.messages) == 2
+    for sender, recipients, data in threaded_smtp_server.messages:
+        assert attachment_payload(data)[1] == DATA
+
+
+def test_failed_stream_drops_session(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port, MAIL_POOL_SIZE=1)
+    msg = make_message(iter([DATA]), filename='data.bin')
+    msg.as_bytes()
+    with pytest.raises(ValueError):
+        mail.send(msg)
+    mail.send(make_message(DATA, filename='data.bin'))
+    mail.close()
+    assert len(threaded_smtp_server.messages) == 1
+
+
+def test_from_path_shares_encoded_payload(tmpdir, make_message):
+    path = tmpdir.join('terms.pdf')
+    path.write_binary(DATA)
+    first = Attachment.from_path(str(path))
+    second = Attachment.from_path(str(path), mmap=False)
+    assert first.filename == 'terms.pdf'
+    assert first.content_type == 'application/pdf'
+    assert isinstance(first.data, memoryview)
+
+    part = first._mime_part()
+    assert part.get_payload(decode=True) == DATA
+    assert second._mime_part().get_payload() is part.get_payload()
+    assert make_message(DATA)._message().get_payload()[1].get_payload() == part.get_payload()
+
+    # a changed file is encoded again
+    path.write_binary(b'changed')
+    os.utime(str(path), ns=(0, 0))
+    third = Attachment.from_path(str(path))
+    assert third._mime_part().get_payload(decode=True) == b'changed'
+
+
+def test_encoded_file_cache_is_bounded(tmpdir, monkeypatch):
+    clear_encoded_file_cache()
+    monkeypatch.setattr(mail_module._encoded_files, 'maxbytes', 300000)
+    paths = []
+    for name in ('a', 'b', 'c'):
+        path = tmpdir.join(name + '.bin')
+        path.write_binary(os.urandom(100000))
+        paths.append(str(path))
+
+    for path in paths[:2]:
+        Attachment.from_path(path)._mime_part()
+    # using a again makes b the least recently used
+    Attachment.from_path(paths[0])._mime_part()
+    Attachment.from_path(paths[2])._mime_part()
+    info = encoded_file_cache_info()
+    assert info['hits'] == 1 and info['misses'] == 3
+    assert 0 < info['size'] <= info['maxsize'] == 300000
+    assert list(mail_module._encoded_files._entries) == [paths[0], paths[2]]
+
+    # a file attached with cache=False is left out
+    Attachment.from_path(paths[1], cache=False)._mime_part()
+    assert list(mail_module._encoded_files._entries) == [paths[0], paths[2]]
+    clear_encoded_file_cache()
+    assert encoded_file_cache_info()['size'] == 0
@@ -0,0 +1,85 @@
+import email
+from email.mime.text import MIMEText
+from unittest.mock import patch
+
+from apistar_mail.mail import Message
+from apistar_mail.template import MessageTemplate
+
+
+def make_template():
+    template = MessageTemplate(subject="Hello $name",
+                               sender="from@example.com",
+                               body="Dear $name, see the attached brochure.",
+                               html="<p>The brochure is attached.</p>")
+    template.attach(filename="brochure.pdf",
+                    content_type="application/pdf",
+                    data=b"%PDF-1.4 brochure")
+    return template
+
+
+def test_render_substitutes_per_recipient():
+    template = make_template()
+    msg = template.render(["joe@example.com"], name="Joe")
+    assert isinstance(msg, Message)
+    assert msg.subject == "Hello Joe"
+    assert msg.body == "Dear Joe, see the attached brochure."
+    assert msg.recipients == ["joe@example.com"]
+
+    parsed = email.message_from_bytes(msg.as_bytes())
+    body, attachment = parsed.get_payload()
+    plain, html = body.get_payload()
+    assert plain.get_payload() == "Dear Joe, see the attached brochure."
+    assert html.get_payload() == "<p>The brochure is attached.</p>"
+    assert attachment.get_payload(decode=True) == b"%PDF-1.4 brochure"
+
+
+def test_render_matches_plain_message():
+    template = make_template()
+    msg = template.render(["joe@example.com"], name="Joe", date=0)
+    plain = Message(subject="Hello Joe",
+                    sender="from@example.com",
+                    recipients=["joe@example.com"],
+                    body="Dear Joe, see the attached brochure.",
+                    html="<p>The brochure is attached.</p>",
+                    date=0)
+    plain.attach(filename="brochure.pdf",
+                 content_type="application/pdf",
+                 data=b"%PDF-1.4 brochure")
+    plain.msgId = msg.msgId
+
+    def strip_boundaries(data):
+        return [line for line in data.splitlines() if b'=====' not in line]
+
+    assert strip_boundaries(msg.as_bytes()) == strip_boundaries(plain.as_bytes())
+
+
+def test_shared_parts_are_encoded_once():
+    template = make_template()
+    with patch('apistar_mail.mail.encode_base64') as encode, \
+            patch('apistar_mail.mail.MIMEText', wraps=MIMEText) as mimetext:
+        for i in range(10):
+            template.render(["user%d@example.com" % i], name="User %d" % i).as_bytes()
+        assert encode.call_count == 0
+        # only the personalized plain text part is built per message
+        assert mimetext.call_count == 10
+
+
+def test_template_without_placeholders_keeps_text():
+    template = MessageTemplate(subject="Price: $5", sender="from@example.com", body="$5 off")
+    msg = template.render(["joe@example.com"], name="Joe")
+    assert msg.subject == "Price: $5"
+    assert msg.body == "$5 off"
+
+
+def test_literal_dollar_parts_are_shared():
+    template = MessageTemplate(subject="Hello $name", sender="from@example.com",
+                               body="$5 off, this week only", html="<p>Pay $$5</p>")
+    with patch('apistar_mail.mail.MIMEText', wraps=MIMEText) as mimetext:
+        for i in range(3):
+            msg = template.render(["user%d@example.com" % i], name="User %d" % i)
+            msg.as_bytes()
+        # the plain text part was built with the template; only the html
+        # part, whose $$ escape is substituted, is built per message
+        assert mimetext.call_count == 3
+    assert msg.body == "$5 off, this week only"
+    assert msg.alts['html'] == "<p>Pay $5</p>"
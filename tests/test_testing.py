@@ -0,0 +1,112 @@
+import asyncio
+import smtplib
+import ssl
+import time
+
+import pytest
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+from apistar_mail.testing import SinkServer, make_tls_context
+
+
+@pytest.mark.parametrize('chunking', [False, True])
+def test_sink_records_messages_and_undoes_dot_stuffing(chunking, make_message):
+    with SinkServer() as server:
+        msg = make_message()
+        Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port,
+             MAIL_USE_CHUNKING=chunking).send(msg)
+    sender, recipients, data = server.messages[0]
+    assert (sender, recipients) == ('<from@example.com>', ['<foo@bar.com>'])
+    assert data == msg.as_bytes() + b'\r\n'
+    assert server.received == 1 and server.bytes == len(data)
+    assert server.commands[:2] == ['EHLO', 'MAIL']
+    assert ('BDAT' in server.commands) is chunking
+
+
+def test_sink_without_recording_only_counts(make_message):
+    with SinkServer(record=False) as server:
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_POOL_SIZE=1)
+        for i in range(5):
+            mail.send(make_message())
+        mail.close()
+    assert server.received == 5
+    assert server.messages == [] and server.commands == []
+
+
+def test_retry_after_injected_faults(make_message):
+    with SinkServer() as server:
+        server.add_fault('MESSAGE', 451, 'Try again later', count=1)
+        server.add_fault('MAIL', count=1)
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_POOL_SIZE=1,
+                    MAIL_RETRY_ATTEMPTS=3, MAIL_RETRY_BACKOFF=0)
+        mail.send(make_message())
+        mail.close()
+
+        server.add_fault('RCPT', 550, 'No such user', match='nobody')
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port)
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            mail.send(make_message(["nobody@bar.com"]))
+    # the dropped connection was replaced by a new session
+    assert server.sessions == 3
+    assert server.received == 1
+
+
+def test_max_emails_recycles_sessions(make_message):
+    with SinkServer() as server:
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_MAX_EMAILS=2)
+        with mail.connect() as connection:
+            for i in range(5):
+                connection.send(make_message())
+    assert server.received == 5
+    assert server.sessions == 3
+
+
+def test_auth_checks_users(make_message):
+    with SinkServer(users={'user': 'secret'}) as server:
+        options = {'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': server.port,
+                   'MAIL_USERNAME': 'user'}
+        Mail(MAIL_PASSWORD='secret', **options).send(make_message())
+        with pytest.raises(smtplib.SMTPAuthenticationError):
+            Mail(MAIL_PASSWORD='wrong', **options).send(make_message())
+    assert server.received == 1
+
+
+def test_latency_and_async_serving(make_message):
+    server = SinkServer(features=('AUTH LOGIN',), latency={'MESSAGE': 0.05})
+
+    async def scenario():
+        async with server:
+            mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port,
+                             MAIL_USERNAME='user', MAIL_PASSWORD='secret')
+            start = time.monotonic()
+            await mail.send(make_message())
+            elapsed = time.monotonic() - start
+            await mail.close()
+        return elapsed
+
+    assert asyncio.run(scenario()) >= 0.05
+    assert server.received == 1
+
+
+def test_starttls(make_message):
+    context = make_tls_context()
+    if context is None:
+        pytest.skip('needs the openssl command line tool')
+    with SinkServer(tls_context=context) as server:
+        Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port,
+             MAIL_USE_TLS=True).send(make_message())
+    assert 'STARTTLS' in server.commands
+    assert server.received == 1
+
+
+def test_starttls_uses_ssl_context(make_message):
+    context = make_tls_context()
+    if context is None:
+        pytest.skip('needs the openssl command line tool')
+    with SinkServer(tls_context=context) as server:
+        mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_USE_TLS=True,
+                    MAIL_SSL_CONTEXT=ssl.create_default_context())
+        with pytest.raises(ssl.SSLCertVerificationError):
+            mail.send(make_message())
+    assert server.received == 0
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from apistar_mail.aio import AsyncMail
+from apistar_mail.mail import Mail
+from apistar_mail.throttle import Throttle, TokenBucket
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_spreads_bursts():
+    clock = Clock()
+    bucket = TokenBucket(2, interval=1, clock=clock)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    clock.now += 1.0
+    assert bucket.reserve() == 0.5
+    # idle time refills only up to the capacity
+    clock.now += 100
+    assert bucket.reserve(2) == 0
+    assert bucket.reserve() == 0.5
+
+
+def test_throttle_waits_for_the_tightest_limit():
+    throttle = Throttle(messages=1000, recipients=10, interval=1)
+    assert throttle.reserve(recipients=10) == 0
+    assert 0.45 < throttle.reserve(recipients=5) <= 0.5
+    assert not Throttle()
+
+
+def test_mail_send_is_throttled(threaded_smtp_server, make_message):
+    mail = Mail(MAIL_SERVER='127.0.0.1', MAIL_PORT=threaded_smtp_server.port,
+                MAIL_POOL_SIZE=1, MAIL_THROTTLE_MESSAGES=5, MAIL_THROTTLE_INTERVAL=0.1)
+    start = time.monotonic()
+    for i in range(10):
+        mail.send(make_message())
+    assert time.monotonic() - start >= 0.09
+    assert len(threaded_smtp_server.messages) == 10
+    mail.close()
+
+
+def test_async_tasks_share_throttle(smtp_server, make_message):
+    throttle = Throttle(recipients=4, interval=0.1)
+
+    async def run():
+        await smtp_server.start()
+        mail = AsyncMail(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_server.port,
+                         MAIL_THROTTLE=throttle)
+        start = time.monotonic()
+        await asyncio.gather(*[mail.send(make_message(["a@b.com", "c@d.com"]))
+                               for i in range(4)])
+        elapsed = time.monotonic() - start
+        await mail.close()
+        await smtp_server.stop()
+        return elapsed
+
+    assert asyncio.run(run()) >= 0.09
+    assert len(smtp_server.messages) == 4